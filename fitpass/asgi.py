@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitpass.settings')
 
 application = get_asgi_application()
+
+from gymadmin import search  # noqa: E402
+
+search.warm()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -32,7 +33,6 @@ ALLOWED_HOSTS = []
 
 INSTALLED_APPS = [
     'gymadmin',
-    'silk',
     'rest_framework',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -43,16 +43,22 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gymadmin.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'gymadmin.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'silk.middleware.SilkyMiddleware',
 ]
 
+# silk stores every request and its queries in the database: a development tool only
+if DEBUG:
+    INSTALLED_APPS.append('silk')
+    MIDDLEWARE.append('silk.middleware.SilkyMiddleware')
+
 
 ROOT_URLCONF = 'fitpass.urls'
 
@@ -86,14 +92,57 @@ DATABASES = {
         'PASSWORD': 'root',
         'HOST': 'localhost',
         'PORT': '3306',
+        # persistent connections, checked before reuse by each request
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas, e.g. DATABASE_REPLICA_HOSTS=10.0.0.2,10.0.0.3. Safe requests read from them unless the
+# client wrote within GYMADMIN_REPLICA_STICKY_SECONDS (see gymadmin.routers), and the response cache
+# fills misses of models written within it from the primary.
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_REPLICA_CONN_MAX_AGE', DATABASES['default']['CONN_MAX_AGE'])),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['gymadmin.routers.ReplicaRouter']
+GYMADMIN_REPLICA_STICKY_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
 
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
+# PBKDF2 with the iteration count of a cost profile first, so new hashes use GYMADMIN_PASSWORD_PROFILE
+PASSWORD_HASHERS = [
+    'gymadmin.hashers.ProfiledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -136,3 +185,95 @@ AUTH_USER_MODEL = "gymadmin.User"
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
 
+# JSON responses are rendered with orjson when it is installed, byte for byte like DRF's JSONRenderer
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'gymadmin.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# The swagger and redoc UIs load the pregenerated OpenAPI document instead of generating it per request
+SWAGGER_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
+# Keyset pagination of the list endpoints (?page_size= is capped by GYMADMIN_MAX_PAGE_SIZE)
+GYMADMIN_PAGE_SIZE = 100
+GYMADMIN_MAX_PAGE_SIZE = 1000
+
+# Rows fetched per query by the streaming NDJSON/CSV exports
+GYMADMIN_EXPORT_CHUNK_SIZE = 2000
+
+# Batch visit upload (visits/bulk): largest accepted batch and rows per INSERT statement
+GYMADMIN_BULK_MAX_ITEMS = 10000
+GYMADMIN_BULK_BATCH_SIZE = 1000
+
+# Visits dated more than GYMADMIN_VISIT_HOT_DAYS ago are moved to the archive table by `archive_visits`,
+# GYMADMIN_ARCHIVE_BATCH_SIZE per transaction
+GYMADMIN_VISIT_HOT_DAYS = 365
+GYMADMIN_ARCHIVE_BATCH_SIZE = 1000
+
+# Subscriptions moved to their current status per transaction by `sweep_subscriptions`, and the default
+# ?days= of subscriptions/expiring
+GYMADMIN_SUBSCRIPTION_SWEEP_BATCH_SIZE = 1000
+GYMADMIN_EXPIRING_DAYS = 7
+
+# Per-view latency, query and serializer metrics served on /metrics (Prometheus text format)
+GYMADMIN_METRICS_ENABLED = True
+
+# Read-through cache of the GET endpoints, invalidated by model signals. Off without Redis: the invalidations
+# of the management commands and of the other workers would not reach a per-process cache such as LocMemCache
+GYMADMIN_CACHE_ENABLED = bool(os.environ.get('REDIS_URL'))
+GYMADMIN_CACHE_ALIAS = 'default'
+GYMADMIN_CACHE_TIMEOUT = 300
+
+# Seconds after which the in-memory occupancy index is reloaded to pick up other processes' writes
+GYMADMIN_OCCUPANCY_RECONCILE_SECONDS = 5
+
+# Fast row counts (statistics, admin changelists): seconds a cached count is served before it is redone,
+# and the table size the database has to estimate before its estimate is used instead of a COUNT(*)
+GYMADMIN_COUNTS_MAX_AGE = 60
+GYMADMIN_COUNTS_EXACT_UP_TO = 100000
+
+# Filtered admin changelists count matching rows exactly up to this many
+GYMADMIN_ADMIN_COUNT_LIMIT = 100000
+
+# Seconds after which the in-memory subscription type registry is reloaded to pick up other processes' writes
+GYMADMIN_SUBSCRIPTION_TYPES_RELOAD_SECONDS = 60
+
+# Member search (users/search): default and largest ?limit=, least trigram similarity of a fuzzy match,
+# seconds after which the in-memory index is reloaded to pick up other processes' writes, and whether
+# the WSGI/ASGI entry points build it at startup (about 700 bytes per member and process)
+GYMADMIN_SEARCH_LIMIT = 20
+GYMADMIN_SEARCH_MAX_LIMIT = 100
+GYMADMIN_SEARCH_SIMILARITY = 0.3
+GYMADMIN_SEARCH_RECONCILE_SECONDS = 300
+GYMADMIN_SEARCH_WARM_ON_START = True
+
+# PBKDF2 iterations per password cost profile (None: Django's default); logins rehash passwords
+# hashed with fewer iterations than the selected profile, never the other way round
+GYMADMIN_PASSWORD_PROFILES = {
+    'strong': None,
+    'standard': 260000,
+    'campaign': 100000,
+}
+GYMADMIN_PASSWORD_PROFILE = 'strong'
+
+# Passwords hashed at once on this host, by the pools of all the web processes together (None: one per core,
+# 0: hash inline), and signups a web process lets wait for its pool before registration answers 429
+GYMADMIN_PASSWORD_WORKERS = None
+GYMADMIN_PASSWORD_MAX_PENDING = 64
+# Directory of the per-host hashing slot lock files (None: gymadmin-passwords in the temporary directory)
+GYMADMIN_PASSWORD_LOCK_DIR = None
+
+# Signups per client address (DRF throttle rate, None disables the throttle)
+GYMADMIN_REGISTRATION_RATE = '30/min'
+
+# Directory of the OpenAPI document written by `manage.py generate_schema` (swagger.json, swagger.yaml),
+# and seconds clients and proxies may cache it for (they revalidate with its ETag afterwards)
+GYMADMIN_SCHEMA_DIR = BASE_DIR / 'build' / 'schema'
+GYMADMIN_SCHEMA_MAX_AGE = 86400
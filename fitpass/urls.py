@@ -16,33 +16,50 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
 
+from gymadmin.async_views import AsyncApplicationStatisticsView, AsyncRegisterUser, AsyncSubscriptionDetail, \
+    AsyncSubscriptionList, AsyncUserDetail, AsyncUserList, AsyncVisitCheckIn, AsyncVisitDetail, AsyncVisitList
 from gymadmin.views import RegisterUser, SubscriptionDetail, SubscriptionList, VisitList, VisitDetail, UserList, \
-    VisitListForSubscription, UserDetail
-
-schema_view = get_schema_view(openapi.Info(
-      title="GymManagement API",
-      default_version='v1',
-      description="Test description",
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+    VisitListForSubscription, UserDetail, VisitExport, SubscriptionExport, VisitBulkCreate, ApplicationStatisticsView, \
+    CacheStatisticsView, OccupancyView, VisitCheckIn, VisitCheckOut, UserSearch, VisitAnalyticsView, MetricsView, \
+    SubscriptionExpiringList, SubscriptionStatusView, RevenueReportView, SchemaView
+from gymadmin.schema import schema_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("register/", RegisterUser.as_view(), name="register"),
     path("subscriptions/", SubscriptionList.as_view(), name="subscriptions"),
     path('subscriptions/<int:pk>', SubscriptionDetail.as_view(), name="subscriptions"),
+    path('subscriptions/export.<str:export_format>', SubscriptionExport.as_view(), name="subscriptions-export"),
+    path('subscriptions/expiring', SubscriptionExpiringList.as_view(), name="subscriptions-expiring"),
     path("visits/", VisitList.as_view(), name="visits"),
     path('visits/<int:pk>', VisitDetail.as_view(), name="visits"),
+    path('visits/bulk', VisitBulkCreate.as_view(), name="visits-bulk"),
+    path('visits/check-in', VisitCheckIn.as_view(), name="visits-check-in"),
+    path('visits/check-out', VisitCheckOut.as_view(), name="visits-check-out"),
+    path('visits/export.<str:export_format>', VisitExport.as_view(), name="visits-export"),
     path('users/', UserList.as_view(), name="users"),
+    path('users/search', UserSearch.as_view(), name="users-search"),
     path('users/<int:pk>', UserDetail.as_view(), name="users"),
     path('subscriptions/<int:pk>/visits', VisitListForSubscription.as_view(), name="subscription-visits"),
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('statistics/', ApplicationStatisticsView.as_view(), name="statistics"),
+    path('statistics/visits', VisitAnalyticsView.as_view(), name="visit-analytics"),
+    path('statistics/subscriptions', SubscriptionStatusView.as_view(), name="subscription-statuses"),
+    path('statistics/revenue', RevenueReportView.as_view(), name="revenue-report"),
+    path('occupancy/', OccupancyView.as_view(), name="occupancy"),
+    path('metrics', MetricsView.as_view(), name="metrics"),
+    path('statistics/cache', CacheStatisticsView.as_view(), name="cache-statistics"),
+    path('async/register/', AsyncRegisterUser.as_view(), name="async-register"),
+    path('async/users/', AsyncUserList.as_view(), name="async-users"),
+    path('async/users/<int:pk>', AsyncUserDetail.as_view(), name="async-users"),
+    path('async/subscriptions/', AsyncSubscriptionList.as_view(), name="async-subscriptions"),
+    path('async/subscriptions/<int:pk>', AsyncSubscriptionDetail.as_view(), name="async-subscriptions"),
+    path('async/visits/', AsyncVisitList.as_view(), name="async-visits"),
+    path('async/visits/<int:pk>', AsyncVisitDetail.as_view(), name="async-visits"),
+    path('async/visits/check-in', AsyncVisitCheckIn.as_view(), name="async-visits-check-in"),
+    path('async/statistics/', AsyncApplicationStatisticsView.as_view(), name="async-statistics"),
+    path('swagger<format>/', SchemaView.as_view(), name='schema-json'),
+    # the UIs load the document from schema-json (SPEC_URL in SWAGGER_SETTINGS and REDOC_SETTINGS)
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitpass.settings')
 
 application = get_wsgi_application()
+
+from gymadmin import search  # noqa: E402
+
+search.warm()
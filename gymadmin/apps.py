@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GymadminConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gymadmin'
+
+    def ready(self):
+        from gymadmin import metrics, signals  # noqa: F401
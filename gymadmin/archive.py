@@ -0,0 +1,89 @@
+"""
+Hot/cold split of the visit history.
+
+`archive_visits` moves visits older than GYMADMIN_VISIT_HOT_DAYS into VisitArchive, keeping their ids,
+one short transaction per batch, so Visit and its indexes only hold recent history. Reads that can reach
+archived days query both tables, which is decided from the cached date of the newest archived visit;
+the rollups behind the statistics endpoints count both tables.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.db.models import Max
+
+from gymadmin import cache, counts
+from gymadmin.models import Visit, VisitArchive
+
+FIELDS = ("id", "subscription_id", "date", "enter_time", "exit_time", "updated_at")
+NEWEST_KEY = "gymadmin:visit-archive:newest"
+
+
+def hot_days():
+    return getattr(settings, "GYMADMIN_VISIT_HOT_DAYS", 365)
+
+
+def archive_before(cutoff, batch_size=None, pause=0):
+    """Move visits dated before `cutoff` into the archive, oldest first; yields the size of each batch."""
+    batch_size = batch_size or getattr(settings, "GYMADMIN_ARCHIVE_BATCH_SIZE", 1000)
+    using = router.db_for_write(Visit)
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(Visit.objects.using(using).select_for_update().filter(date__lt=cutoff).order_by("date", "id")
+                        .values_list(*FIELDS)[:batch_size])
+            if not rows:
+                return
+            # no ignore_conflicts: a row skipped here would be deleted below all the same. An id taken in the
+            # archive (an auto-increment that went back below moved ids) rolls the batch back instead.
+            VisitArchive.objects.using(using).bulk_create([VisitArchive(**dict(zip(FIELDS, row))) for row in rows])
+            # a raw delete sends no post_delete: the rollups keep counting the rows in the archive
+            Visit.objects.using(using).filter(pk__in=[row[0] for row in rows])._raw_delete(using)
+        counts.adjust(Visit, -len(rows))
+        yield len(rows)
+        if pause:
+            time.sleep(pause)
+
+
+def newest_date():
+    """Date of the newest archived visit, None for an empty archive; cached like the GET responses."""
+    store = cache.get_cache()
+    newest = store.get(NEWEST_KEY)
+    if newest is None:
+        newest = VisitArchive.objects.aggregate(newest=Max("date"))["newest"] or ""
+        store.set(NEWEST_KEY, newest, timeout=getattr(settings, "GYMADMIN_CACHE_TIMEOUT", 300))
+    return newest or None
+
+
+def forget_newest_date():
+    cache.get_cache().delete(NEWEST_KEY)
+
+
+def archived_keys(keys):
+    """The natural keys (subscription_id, date, enter_time) among `keys` of visits already in the archive."""
+    newest = newest_date()
+    # only keys dated up to the newest archived visit can be there, which spares the query for recent ones
+    keys = {key for key in keys if newest is not None and key[1] <= newest}
+    if not keys:
+        return set()
+    subscription_ids, dates, times = (set(column) for column in zip(*keys))
+    return set(VisitArchive.objects.filter(subscription_id__in=subscription_ids, date__in=dates, enter_time__in=times)
+               .values_list("subscription_id", "date", "enter_time")) & keys
+
+
+def reaches(params):
+    """Whether the date filter of a visit query (`date` or `from`) reaches into archived days."""
+    newest = newest_date()
+    start_date = params.get("date") or params.get("from")
+    if newest is None or not start_date:
+        return newest is not None
+    try:
+        return Visit._meta.get_field("date").to_python(start_date) <= newest
+    except ValidationError:
+        # let the query itself reject the filter
+        return True
+
+
+async def areaches(params):
+    return await sync_to_async(reaches)(params)
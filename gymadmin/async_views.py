@@ -0,0 +1,186 @@
+"""
+Async-native versions of the hot read paths and of check-in, for serving under ASGI (uvicorn).
+
+The handlers use Django's async ORM (`afirst`, `acount`, `async for`) instead of occupying a worker thread
+for the whole request. They take the querysets, serializers and payloads of the `APIView`s in
+`gymadmin.views`, and share their response cache and conditional GET.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, Throttled
+
+from gymadmin import cache, checkin, counts, passwords, statistics
+from gymadmin.conditional import conditional_get, object_validators
+from gymadmin.models import Subscription, User, Visit
+from gymadmin.renderers import FastJSONRenderer
+from gymadmin.subscription_types import registry
+from gymadmin.throttles import RegistrationThrottle
+from gymadmin.serializers import CheckInSerializer, SubscriptionSerializer, UserSerializer, VisitSerializer
+from gymadmin.views import ApplicationStatisticsView, SubscriptionDetail, SubscriptionList, UserDetail, UserList, \
+    VisitDetail, VisitList
+
+
+def json_response(data, status=200):
+    """The body the sync views render for `data`, so dates and times are formatted the same way."""
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type="application/json")
+
+
+class AsyncAPIView(View):
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # same as rest_framework's APIView: no session authentication here, so no CSRF check
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return json_response({'detail': 'Not found.'}, status=404)
+        except APIException as exc:
+            return json_response({'detail': exc.detail}, status=exc.status_code)
+
+
+class AsyncRegisterUser(AsyncAPIView):
+    """Registration that awaits the password hashing pool instead of holding a thread for it."""
+
+    async def post(self, request):
+        throttle = RegistrationThrottle()
+        if not throttle.allow_request(request, self):
+            raise Throttled(wait=throttle.wait())
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return json_response({'detail': 'JSON parse error.'}, status=400)
+        serializer = UserSerializer(data=data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+        try:
+            password_hash = await passwords.ahash_password(serializer.validated_data["password"])
+        except passwords.PasswordPoolBusy:
+            raise Throttled(wait=1, detail="Too many signups in progress, retry shortly")
+        await sync_to_async(serializer.save)(password_hash=password_hash)
+        return json_response({'user': serializer.data}, status=201)
+
+
+class AsyncListView(AsyncAPIView):
+    """The list of the sync `view`, paged with the async ORM and cached like it."""
+    view = None
+    name = None
+    model = None
+
+    def check(self, params):
+        return None
+
+    def cached_model(self, params):
+        return self.model
+
+    async def get(self, request):
+        detail = self.check(request.GET)
+        if detail is not None:
+            return json_response({'detail': detail}, status=400)
+        return json_response(await cache.acached_list(self.cached_model(request.GET), request,
+                                                      lambda: self.payload(request)))
+
+    async def payload(self, request):
+        # the filters may look up subscription types, and the archive may be checked, so build them off the loop
+        paginator, querysets, serializer = await sync_to_async(self.view.pagination)(request.GET)
+        page = await paginator.apaginate_querysets(querysets, request)
+        await registry.aload(row["type_id"] for row in page if "type_id" in row)
+        return {self.name: serializer.serialize(page), **paginator.get_links()}
+
+
+async def afirst(querysets):
+    """The first object found by the querysets, in order; Http404 when none holds one."""
+    for queryset in querysets:
+        instance = await queryset.afirst()
+        if instance is not None:
+            return instance
+    raise Http404
+
+
+class AsyncUserList(AsyncListView):
+    view, name, model = UserList, "users", User
+
+    def check(self, params):
+        return UserList.check(params)
+
+    def cached_model(self, params):
+        return UserList.cached_model(params)
+
+
+class AsyncUserDetail(AsyncAPIView):
+    @conditional_get(User, lambda pk: object_validators(*UserDetail.lookups(pk)))
+    async def get(self, request, pk):
+        async def produce():
+            return UserSerializer(await afirst(UserDetail.lookups(pk))).data
+        return json_response({'user': await cache.acached_object(User, pk, produce)})
+
+
+class AsyncSubscriptionList(AsyncListView):
+    view, name, model = SubscriptionList, "subscriptions", Subscription
+
+
+class AsyncSubscriptionDetail(AsyncAPIView):
+    @conditional_get(Subscription, lambda pk: object_validators(*SubscriptionDetail.lookups(pk)))
+    async def get(self, request, pk):
+        async def produce():
+            subscription = await afirst(SubscriptionDetail.lookups(pk))
+            await registry.aload([subscription.type_id])
+            return SubscriptionSerializer(subscription).data
+        return json_response({'subscription': await cache.acached_object(Subscription, pk, produce)})
+
+
+class AsyncVisitList(AsyncListView):
+    view, name, model = VisitList, "visits", Visit
+
+
+class AsyncVisitDetail(AsyncAPIView):
+    @conditional_get(Visit, lambda pk: object_validators(*VisitDetail.lookups(pk)))
+    async def get(self, request, pk):
+        async def produce():
+            return VisitSerializer(await afirst(VisitDetail.lookups(pk))).data
+        return json_response({'visit': await cache.acached_object(Visit, pk, produce)})
+
+
+class AsyncApplicationStatisticsView(AsyncAPIView):
+    async def get(self, request):
+        view = ApplicationStatisticsView
+        detail = view.check(request.GET)
+        if detail is not None:
+            return json_response({'detail': detail}, status=400)
+        mode = view.mode(request.GET)
+        start_date, end_date = view.period(request.GET)
+
+        queries = [
+            sync_to_async(counts.count)(User.objects.all(), mode),
+            statistics.asubscriptions_per_type(),
+            sync_to_async(counts.open_visits)(mode),
+        ]
+        if start_date:
+            queries += [
+                statistics.avisits_between(start_date, end_date),
+                statistics.asubscriptions_per_type(start_date, end_date),
+            ]
+        total_clients, total_subscriptions_per_type, current_visits, *in_period = await asyncio.gather(*queries)
+        return json_response(view.payload(mode, total_clients, total_subscriptions_per_type, current_visits,
+                                          start_date, end_date, *in_period))
+
+
+class AsyncVisitCheckIn(AsyncAPIView):
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return json_response({'detail': 'JSON parse error.'}, status=400)
+        serializer = CheckInSerializer(data=data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+        visit = await sync_to_async(checkin.check_in)(**serializer.validated_data)
+        return json_response({'visit_id': visit.pk, 'visit': VisitSerializer(visit).data}, status=201)
@@ -0,0 +1,120 @@
+"""
+Timing helpers shared by the `benchmark` management command.
+"""
+import asyncio
+import math
+import platform
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+
+def allow_test_client():
+    """The test clients send Host: testserver, which ALLOWED_HOSTS rejects outside the test runner."""
+    return override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"])
+
+
+def attribute(instance, path):
+    """Follow a `values()` column such as "type__title" through the attributes of a model instance."""
+    for name in path.split("__"):
+        instance = getattr(instance, name)
+    return instance
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(durations, wall_time=None):
+    ordered = sorted(durations)
+    wall_time = wall_time if wall_time is not None else sum(ordered)
+    return {
+        "requests": len(ordered),
+        "throughput_per_s": round(len(ordered) / wall_time, 1) if wall_time else 0.0,
+        "mean_ms": round(1000 * sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "p50_ms": round(1000 * percentile(ordered, 0.50), 3),
+        "p95_ms": round(1000 * percentile(ordered, 0.95), 3),
+        "p99_ms": round(1000 * percentile(ordered, 0.99), 3),
+        "max_ms": round(1000 * ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+def _timed(call, item):
+    started = time.perf_counter()
+    call(item)
+    return time.perf_counter() - started
+
+
+def run(call, items, concurrency=1):
+    """Call `call(item)` for every item on `concurrency` threads and summarize the latencies."""
+    def worker(chunk):
+        try:
+            return [_timed(call, item) for item in chunk]
+        finally:
+            connection.close()
+
+    items = list(items)
+    chunks = [items[index::concurrency] for index in range(concurrency)]
+    started = time.perf_counter()
+    if concurrency == 1:
+        durations = [_timed(call, item) for item in items]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            durations = [duration for chunk in executor.map(worker, chunks) for duration in chunk]
+    return summarize(durations, time.perf_counter() - started)
+
+
+def arun(acall, items, concurrency=1):
+    """Await `acall(item)` for every item with at most `concurrency` in flight and summarize the latencies."""
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(item):
+            async with semaphore:
+                started = time.perf_counter()
+                await acall(item)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        durations = await asyncio.gather(*(timed(item) for item in items))
+        return summarize(durations, time.perf_counter() - started)
+
+    return asyncio.run(main())
+
+
+def environment():
+    """What a result file was measured on, so runs of different commits can be told apart."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=settings.BASE_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "created_at": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+    }
+
+
+def compare(baseline, results):
+    """Relative change of the latencies and throughput of every result that is also in `baseline`."""
+    changes = {}
+    for name, summary in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        changes[name] = {
+            key: round(100 * (summary[key] - before[key]) / before[key], 1) if before[key] else None
+            for key in ("throughput_per_s", "p50_ms", "p95_ms", "p99_ms")
+        }
+    return changes
@@ -0,0 +1,216 @@
+"""
+Read-through cache for the GET endpoints.
+
+Objects are cached under model + pk and dropped by the post_save/post_delete handlers. Lists are cached
+under the normalized request and a per-model version, which a write bumps so every cached page of that
+model goes stale at once. The async views read through the same entries with `acached_object` and
+`acached_list`, which await the payload.
+
+With read replicas a miss would otherwise be filled from a replica that has not caught up with the write
+which caused it, and serve that to every client. A write is remembered for GYMADMIN_REPLICA_STICKY_SECONDS,
+and misses of a model written that recently are produced from the primary.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from gymadmin import routers
+from gymadmin.models import Subscription, SubscriptionType, User, UserStats, Visit
+
+# Payloads of a model also render fields of these models, so their writes invalidate it too
+DEPENDENCIES = {
+    User: (),
+    Subscription: (SubscriptionType,),
+    Visit: (),
+    UserStats: (User,),
+}
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, "GYMADMIN_CACHE_ALIAS", "default")]
+
+
+def is_enabled():
+    return getattr(settings, "GYMADMIN_CACHE_ENABLED", False)
+
+
+def _timeout():
+    return getattr(settings, "GYMADMIN_CACHE_TIMEOUT", 300)
+
+
+def _count(namespace, outcome):
+    with _counters_lock:
+        _counters[(namespace, outcome)] += 1
+
+
+def stats():
+    with _counters_lock:
+        snapshot = dict(_counters)
+    namespaces = sorted({namespace for namespace, _ in snapshot})
+    return {
+        namespace: {"hits": snapshot.get((namespace, "hit"), 0), "misses": snapshot.get((namespace, "miss"), 0)}
+        for namespace in namespaces
+    }
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _version_key(model):
+    return f"gymadmin:{_label(model)}:version"
+
+
+def _versions(models):
+    cache = get_cache()
+    keys = [_version_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # A fresh timestamp never collides with a version that was evicted
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return ".".join(str(found[key]) for key in keys)
+
+
+def _lookup(namespace, key):
+    value = get_cache().get(key)
+    _count(namespace, "miss" if value is None else "hit")
+    return value
+
+
+def _written_key(model):
+    return f"gymadmin:{_label(model)}:written"
+
+
+def _reads(model):
+    """Where a miss of the model reads from: the primary while a replica may lag behind its last write."""
+    if routers.replicas() and get_cache().get_many([_written_key(name) for name in (model, *DEPENDENCIES[model])]):
+        return routers.primary_reads()
+    return nullcontext()
+
+
+def _produce(model, producer):
+    with _reads(model):
+        return producer()
+
+
+async def _aproduce(model, producer):
+    with await sync_to_async(_reads)(model):
+        return await producer()
+
+
+def _read_through(model, namespace, key, producer):
+    value = _lookup(namespace, key)
+    if value is None:
+        value = _produce(model, producer)
+        get_cache().set(key, value, timeout=_timeout())
+    return value
+
+
+def _object_entry(model, pk):
+    """(key, dependency versions to store with the payload or None, cached payload or None) of an object."""
+    key = f"gymadmin:{_label(model)}:{pk}"
+    if not DEPENDENCIES[model]:
+        return key, None, _lookup(_label(model), key)
+    # the dependency versions are stored with the payload rather than in the key, which `invalidate` deletes
+    versions = _versions(DEPENDENCIES[model])
+    cached = get_cache().get(key)
+    hit = cached is not None and cached[0] == versions
+    _count(_label(model), "hit" if hit else "miss")
+    return key, versions, cached[1] if hit else None
+
+
+def _stored(versions, value):
+    return value if versions is None else (versions, value)
+
+
+def cached_object(model, pk, producer):
+    if not is_enabled():
+        return producer()
+    key, versions, value = _object_entry(model, pk)
+    if value is None:
+        value = _produce(model, producer)
+        get_cache().set(key, _stored(versions, value), timeout=_timeout())
+    return value
+
+
+async def acached_object(model, pk, producer):
+    """`cached_object` for async views, where `producer` is a coroutine function."""
+    if not is_enabled():
+        return await producer()
+    key, versions, value = await sync_to_async(_object_entry)(model, pk)
+    if value is None:
+        value = await _aproduce(model, producer)
+        await get_cache().aset(key, _stored(versions, value), timeout=_timeout())
+    return value
+
+
+def _list_key(model, request):
+    # DRF requests expose query_params, plain Django requests (async views) only GET
+    params = getattr(request, "query_params", request.GET)
+    params = sorted((name, value) for name, values in params.lists() for value in values)
+    normalized = repr((request.get_host(), request.path, params)).encode()
+    version = _versions((model, *DEPENDENCIES[model]))
+    return f"gymadmin:{_label(model)}:list:{version}:{hashlib.sha1(normalized).hexdigest()}"
+
+
+def cached_list(model, request, producer):
+    if not is_enabled():
+        return producer()
+    return _read_through(model, f"{_label(model)}:list", _list_key(model, request), producer)
+
+
+async def acached_list(model, request, producer):
+    """`cached_list` for async views, where `producer` is a coroutine function."""
+    if not is_enabled():
+        return await producer()
+    key = await sync_to_async(_list_key)(model, request)
+    value = await sync_to_async(_lookup)(f"{_label(model)}:list", key)
+    if value is None:
+        value = await _aproduce(model, producer)
+        await get_cache().aset(key, value, timeout=_timeout())
+    return value
+
+
+def cached_validators(model, request, producer):
+    """ETag/Last-Modified validators of an object or list URL, stale after any write to the model."""
+    if not is_enabled():
+        return producer()
+    version = _versions((model, *DEPENDENCIES[model]))
+    key = f"gymadmin:{_label(model)}:validators:{version}:{hashlib.sha1(request.path.encode()).hexdigest()}"
+    return _read_through(model, f"{_label(model)}:validators", key, producer)
+
+
+def _bump(model):
+    try:
+        get_cache().incr(_version_key(model))
+    except ValueError:
+        get_cache().set(_version_key(model), time.time_ns(), timeout=None)
+    if routers.replicas():
+        get_cache().set(_written_key(model), True, timeout=routers.sticky_seconds())
+
+
+def invalidate(model, pk=None):
+    if pk is not None:
+        get_cache().delete(f"gymadmin:{_label(model)}:{pk}")
+    _bump(model)
+
+
+def invalidate_many(model, pks):
+    """Like `invalidate` for rows changed by a queryset update, which sends no signals."""
+    get_cache().delete_many([f"gymadmin:{_label(model)}:{pk}" for pk in pks])
+    _bump(model)
+
+
+def clear():
+    get_cache().clear()
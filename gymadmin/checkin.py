@@ -0,0 +1,117 @@
+"""
+Turnstile check-in and check-out.
+
+A check-in is a single conditional `INSERT ... SELECT` that only produces a row when the subscription
+covers today and the member has no open visit, so validation and the write share one round trip.
+The reason for a rejection is only looked up when nothing was inserted. The member's row is locked first:
+the natural key includes enter_time, so it does not keep two concurrent check-ins from both opening a visit.
+"""
+from django.db import connection, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+
+from gymadmin import cache, counts, statistics
+from gymadmin.models import Subscription, User, Visit
+from gymadmin.occupancy import first_open_date, open_visits, tracker
+
+
+class SubscriptionInactive(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "Subscription does not cover today."
+    default_code = "subscription_inactive"
+
+
+class AlreadyCheckedIn(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Member already has an open visit."
+    default_code = "already_checked_in"
+
+
+class NotCheckedIn(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "There is no open visit to close."
+    default_code = "not_checked_in"
+
+
+def _check_in_sql(by_user):
+    quote = connection.ops.quote_name
+    visit = quote(Visit._meta.db_table)
+    subscription = quote(Subscription._meta.db_table)
+    selector = "s.user_id = %s" if by_user else "s.id = %s"
+    return (
+        f"INSERT INTO {visit} (subscription_id, date, enter_time, exit_time, updated_at) "
+        f"SELECT s.id, %s, %s, NULL, %s FROM {subscription} s "
+        f"WHERE {selector} AND s.end_date >= %s AND s.start_date <= %s "
+        f"AND NOT EXISTS (SELECT 1 FROM {visit} v INNER JOIN {subscription} o ON v.subscription_id = o.id "
+        f"WHERE o.user_id = s.user_id AND v.exit_time IS NULL AND v.date >= %s) "
+        f"ORDER BY s.end_date LIMIT 1"
+    )
+
+
+def _rejection(subscription_id, user_id, today):
+    subscriptions = Subscription.objects.filter(pk=subscription_id) if subscription_id else \
+        Subscription.objects.filter(user_id=user_id)
+    if subscription_id and not subscriptions.exists():
+        return NotFound("Subscription does not exist.")
+    if not subscriptions.filter(start_date__lte=today, end_date__gte=today).exists():
+        return SubscriptionInactive()
+    return AlreadyCheckedIn()
+
+
+def _lock_member(subscription_id, user_id):
+    members = User.objects.filter(pk=user_id) if subscription_id is None else \
+        User.objects.filter(pk=Subquery(Subscription.objects.filter(pk=subscription_id).values("user_id")[:1]))
+    list(members.select_for_update().values_list("pk", flat=True))
+
+
+def check_in(subscription_id=None, user_id=None):
+    now = timezone.localtime()
+    today, enter_time = now.date(), now.time()
+    key = user_id if subscription_id is None else subscription_id
+    with transaction.atomic():
+        _lock_member(subscription_id, user_id)
+        with connection.cursor() as cursor:
+            day = connection.ops.adapt_datefield_value(today)
+            params = [day, connection.ops.adapt_timefield_value(enter_time),
+                      connection.ops.adapt_datetimefield_value(now), key, day, day,
+                      connection.ops.adapt_datefield_value(first_open_date(today))]
+            cursor.execute(_check_in_sql(by_user=subscription_id is None), params)
+            inserted, pk = cursor.rowcount, cursor.lastrowid
+        if not inserted:
+            raise _rejection(subscription_id, user_id, today)
+
+        if subscription_id is None:
+            subscription_id = Visit.objects.values_list("subscription_id", flat=True).get(pk=pk)
+        # the raw INSERT sends no post_save, so the signal bookkeeping is repeated here
+        statistics.count_visit_change(after=(today, enter_time, None))
+        statistics.count_visit(subscription_id, today)
+        transaction.on_commit(lambda: tracker.visit_opened(pk, subscription_id, enter_time))
+        transaction.on_commit(lambda: counts.adjust(Visit, 1))
+        transaction.on_commit(lambda: cache.invalidate(Visit))
+    return Visit(pk=pk, subscription_id=subscription_id, date=today, enter_time=enter_time)
+
+
+def check_out(subscription_id=None, user_id=None):
+    visits = open_visits()
+    if subscription_id is None:
+        visits = visits.filter(subscription__user_id=user_id)
+    else:
+        visits = visits.filter(subscription_id=subscription_id)
+
+    with transaction.atomic():
+        visit = visits.only("id", "subscription_id", "date", "enter_time").first()
+        # the exit_time condition makes a concurrent check-out of the same visit update nothing
+        now = timezone.localtime()
+        exit_time = now.time()
+        updated = visit is not None and Visit.objects.filter(pk=visit.pk, exit_time__isnull=True) \
+            .update(exit_time=exit_time, updated_at=now)
+        if not updated:
+            raise NotCheckedIn()
+        visit.exit_time = exit_time
+        # the visit duration goes into the hourly rollup
+        statistics.count_visit_change((visit.date, visit.enter_time, None), (visit.date, visit.enter_time, exit_time))
+        transaction.on_commit(lambda: tracker.visit_deleted(visit.pk))
+        transaction.on_commit(lambda: cache.invalidate(Visit, visit.pk))
+    return visit
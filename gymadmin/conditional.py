@@ -0,0 +1,96 @@
+"""
+Conditional GET for the detail endpoints and the visits of a subscription.
+
+The validators are read from the `updated_at` columns with one indexed query, cached like the responses,
+before the body is produced; a matching If-None-Match (or If-Modified-Since) is answered with 304.
+A list gets an ETag only: it is made of the row count and the newest `updated_at`, so a deleted row
+changes it while the Last-Modified of the remaining rows would not.
+"""
+import functools
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from gymadmin import cache
+
+
+def _microseconds(moment):
+    return int(moment.timestamp() * 1000000)
+
+
+def object_validators(*querysets):
+    """(version, last modified) of the first queryset holding the object, None when none does."""
+    for queryset in querysets:
+        updated_at = queryset.values_list("updated_at", flat=True).first()
+        if updated_at is not None:
+            return _microseconds(updated_at), updated_at
+    return None
+
+
+def list_validators(*querysets):
+    """(version, None) of the rows of all querysets together, None when there are none."""
+    count, newest = 0, None
+    for queryset in querysets:
+        totals = queryset.order_by().aggregate(count=Count("pk"), newest=Max("updated_at"))
+        count += totals["count"]
+        if totals["newest"] is not None and (newest is None or totals["newest"] > newest):
+            newest = totals["newest"]
+    if not count:
+        return None
+    return f"{count}-{_microseconds(newest)}", None
+
+
+def _validators(request, found):
+    version, last_modified = found
+    # the JSON and the browsable API representations differ; the async views only render JSON
+    renderer = getattr(request, "accepted_renderer", None)
+    etag = f'W/"{renderer.format if renderer else "json"}-{version}"'
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def _tag(response, etag, timestamp):
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+def conditional_get(model, validators):
+    """
+    Decorate the `get` of an APIView (or of an async view) serving `model` with ETag/Last-Modified handling.
+
+    `validators(**kwargs)` gets the URL arguments and returns (version, last modified or None), or None
+    when the resource does not exist, in which case the view answers as usual.
+    """
+    def decorator(method):
+        if iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def aget(view, request, *args, **kwargs):
+                found = await sync_to_async(cache.cached_validators)(model, request, lambda: validators(**kwargs))
+                if found is None:
+                    return await method(view, request, *args, **kwargs)
+                etag, timestamp = _validators(request, found)
+                response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+                if response is None:
+                    response = await method(view, request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                return _tag(response, etag, timestamp)
+            return aget
+
+        @functools.wraps(method)
+        def get(view, request, *args, **kwargs):
+            found = cache.cached_validators(model, request, lambda: validators(**kwargs))
+            if found is None:
+                return method(view, request, *args, **kwargs)
+            etag, timestamp = _validators(request, found)
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return _tag(response, etag, timestamp)
+        return get
+    return decorator
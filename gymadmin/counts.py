@@ -0,0 +1,112 @@
+"""
+Row counts of the big tables, exact or fast, picked per call site.
+
+An exact count is a COUNT(*), which reads a whole index and slows down as the table grows. A fast count
+is read from the cache, where it is kept with the time it was taken: the exact count, or the database's
+own row estimate for tables it estimates to hold more than GYMADMIN_COUNTS_EXACT_UP_TO rows. It is redone
+after GYMADMIN_COUNTS_MAX_AGE seconds, and the post_save/post_delete handlers add the rows created and
+deleted in between, so only writes that send no signals (bulk loads, raw SQL) wait for the recount.
+"""
+import datetime
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from gymadmin import cache
+from gymadmin.models import Visit
+from gymadmin.occupancy import tracker
+
+FAST, EXACT = "fast", "exact"
+MODES = (FAST, EXACT)
+
+# the server's own row estimate of a table, which it keeps for the query planner
+ESTIMATED_ROWS_SQL = {
+    "mysql": "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+    "postgresql": "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+}
+
+
+class Count(NamedTuple):
+    value: int
+    # when the value was taken; a fast count may be this old
+    as_of: datetime.datetime
+    # "exact", "cached", "estimate" or "tracker"
+    source: str
+
+
+def estimated_rows(model, using="default"):
+    """The number of rows of the model's table as estimated by the database, None where there is no estimate."""
+    connection = connections[using]
+    sql = ESTIMATED_ROWS_SQL.get(connection.vendor)
+    if sql is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [model._meta.db_table])
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 (or 0) for a table that was never analyzed
+    return row[0] if row and row[0] and row[0] > 0 else None
+
+
+def _key(model):
+    return f"gymadmin:counts:{model._meta.label_lower}"
+
+
+def _max_age():
+    return getattr(settings, "GYMADMIN_COUNTS_MAX_AGE", 60)
+
+
+def _take(queryset):
+    estimate = estimated_rows(queryset.model, queryset.db)
+    if estimate is not None and estimate > getattr(settings, "GYMADMIN_COUNTS_EXACT_UP_TO", 100000):
+        return estimate, "estimate"
+    return queryset.count(), "exact"
+
+
+def _check(mode):
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+
+
+def count(queryset, mode=FAST):
+    """
+    Count the rows of `queryset`. Fast counts only apply to a whole table; a filtered queryset is counted
+    exactly either way, and so is every queryset when the cache is disabled.
+    """
+    _check(mode)
+    if mode == EXACT or queryset.query.where or not cache.is_enabled():
+        return Count(queryset.count(), timezone.now(), EXACT)
+    key = _key(queryset.model)
+    found = cache.get_cache().get_many([key, f"{key}:as_of"])
+    if len(found) == 2 and time.time() - found[f"{key}:as_of"] <= _max_age():
+        return Count(found[key], datetime.datetime.fromtimestamp(found[f"{key}:as_of"], datetime.timezone.utc),
+                     "cached")
+    taken_at = time.time()
+    value, source = _take(queryset.order_by())
+    cache.get_cache().set_many({key: value, f"{key}:as_of": taken_at}, timeout=_max_age())
+    return Count(value, datetime.datetime.fromtimestamp(taken_at, datetime.timezone.utc), source)
+
+
+def adjust(model, delta):
+    """Add `delta` rows to the cached count of the model's table, if there is one."""
+    try:
+        cache.get_cache().incr(_key(model), delta)
+    except ValueError:
+        # not counted yet, or expired: the next fast count recounts
+        pass
+
+
+def forget(model):
+    """Drop the cached count of the model's table, for writes whose number of rows is unknown."""
+    key = _key(model)
+    cache.get_cache().delete_many([key, f"{key}:as_of"])
+
+
+def open_visits(mode=FAST):
+    """The visits without an exit time; fast counts come from the in-memory occupancy tracker."""
+    _check(mode)
+    if mode == FAST:
+        return Count(tracker.current_visits(), tracker.reconciled_at(), "tracker")
+    return count(Visit.objects.filter(exit_time__isnull=True), EXACT)
@@ -0,0 +1,60 @@
+"""
+Denormalized subscription status.
+
+`Subscription.status` is derived from the dates whenever a subscription is saved and moved along as
+the days pass by `sweep()`, which `sweep_subscriptions` runs on a schedule: subscriptions whose end date
+passed expire and upcoming ones whose start date came become active, a batch per transaction, found
+through the (status, end_date) index, and the `UserStats` of their members are recounted.
+Reads by status are as fresh as the last sweep.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from gymadmin import cache, statistics
+from gymadmin.models import Subscription, SubscriptionStatus
+
+
+def _transitions(today):
+    live = Subscription.objects.filter(status__in=[SubscriptionStatus.UPCOMING, SubscriptionStatus.ACTIVE])
+    # expiring first, so the upcoming subscriptions that already ended go straight to expired
+    yield SubscriptionStatus.EXPIRED, live.filter(end_date__lt=today)
+    yield SubscriptionStatus.ACTIVE, Subscription.objects.filter(status=SubscriptionStatus.UPCOMING,
+                                                                 start_date__lte=today)
+
+
+def sweep(today=None, batch_size=None):
+    """Bring the statuses up to date with `today`; yields (new status, number of subscriptions) per batch."""
+    today = today or timezone.localdate()
+    batch_size = batch_size or getattr(settings, "GYMADMIN_SUBSCRIPTION_SWEEP_BATCH_SIZE", 1000)
+    for status, subscriptions in _transitions(today):
+        while True:
+            with transaction.atomic():
+                pks = list(subscriptions.order_by("end_date", "id").values_list("id", flat=True)[:batch_size])
+                if not pks:
+                    break
+                # the same conditions again: a concurrent save may have moved a row in the meantime
+                subscriptions.filter(id__in=pks).update(status=status, updated_at=timezone.now())
+                # the current subscription of their members moves along with the calendar too
+                statistics.refresh_subscription_users(pks)
+                # queryset updates send no post_save
+                transaction.on_commit(lambda pks=pks: cache.invalidate_many(Subscription, pks))
+            yield status, len(pks)
+
+
+def expiring(days, today=None):
+    """Active subscriptions ending within the next `days` days, today included."""
+    today = today or timezone.localdate()
+    # a range past the last representable date covers every subscription already
+    days = min(days, (datetime.date.max - today).days)
+    return Subscription.objects.filter(status=SubscriptionStatus.ACTIVE,
+                                       end_date__range=[today, today + datetime.timedelta(days=days)])
+
+
+def counts_per_status():
+    # read off the (status, end_date) index
+    counts = dict(Subscription.objects.values_list("status").annotate(Count("id")).order_by())
+    return {status: counts.get(status, 0) for status in SubscriptionStatus.values}
@@ -0,0 +1,84 @@
+import csv
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+VISIT_EXPORT_FIELDS = (
+    ("id", "id"),
+    ("subscription_id", "subscription_id"),
+    ("date", "date"),
+    ("enter_time", "enter_time"),
+    ("exit_time", "exit_time"),
+)
+
+SUBSCRIPTION_EXPORT_FIELDS = (
+    ("id", "id"),
+    ("user_id", "user_id"),
+    ("type", "type__title"),
+    ("start_date", "start_date"),
+    ("end_date", "end_date"),
+    ("price", "price"),
+)
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def iterate_rows(queryset, columns, chunk_size=None):
+    """
+    Yield value tuples ordered by primary key, fetching one bounded chunk per query.
+
+    MySQLdb buffers the whole result set on the client even for `.iterator()`, so the chunks are
+    walked by primary key instead of relying on a server-side cursor.
+    """
+    chunk_size = chunk_size or getattr(settings, "GYMADMIN_EXPORT_CHUNK_SIZE", 2000)
+    rows = queryset.order_by("pk").values_list("pk", *columns)
+    last_pk = None
+    while True:
+        chunk = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        for row in chunk:
+            yield row[1:]
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1][0]
+
+
+def _plain(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows, names):
+    for row in rows:
+        yield json.dumps(dict(zip(names, map(_plain, row))), separators=(",", ":")) + "\n"
+
+
+def csv_lines(rows, names):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(["" if value is None else _plain(value) for value in row])
+
+
+def export_response(querysets, fields, export_format, filename):
+    names = [name for name, _ in fields]
+    columns = [column for _, column in fields]
+    rows = (row for queryset in querysets for row in iterate_rows(queryset, columns))
+    if export_format == "csv":
+        lines = csv_lines(rows, names)
+    else:
+        lines = ndjson_lines(rows, names)
+
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[export_format])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{export_format}"'
+    return response
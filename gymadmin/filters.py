@@ -0,0 +1,77 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+from rest_framework.exceptions import ParseError
+
+from gymadmin.subscription_types import registry
+
+
+def date_param(params, name):
+    """The date in `params[name]`, None when it is not given; a malformed one is a 400, not a query error."""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return models.DateField().to_python(value)
+    except ValidationError:
+        raise ParseError(f'{name} must be a date (YYYY-MM-DD)')
+
+
+def filter_users(users, params):
+    first_name = params.get('first_name')
+    if first_name:
+        users = users.filter(first_name=first_name)
+
+    last_name = params.get('last_name')
+    if last_name:
+        users = users.filter(last_name=last_name)
+
+    email = params.get('email')
+    if email:
+        users = users.filter(email=email)
+    return users
+
+
+def filter_visits(visits, params):
+    subscription_id = params.get('subscription_id')
+    if subscription_id:
+        visits = visits.filter(subscription_id=subscription_id)
+
+    date = date_param(params, 'date')
+    if date:
+        visits = visits.filter(date=date)
+
+    start_date = date_param(params, 'from')
+    if start_date:
+        visits = visits.filter(date__gte=start_date)
+
+    end_date = date_param(params, 'to')
+    if end_date:
+        visits = visits.filter(date__lte=end_date)
+
+    type = params.get('type')
+    if type:
+        visits = visits.filter(subscription__type_id__in=registry.ids(type))
+    return visits
+
+
+def filter_subscriptions(subscriptions, params):
+    type = params.get('type')
+    if type:
+        subscriptions = subscriptions.filter(type_id__in=registry.ids(type))
+
+    user_id = params.get('user_id')
+    if user_id:
+        subscriptions = subscriptions.filter(user_id=user_id)
+
+    status = params.get('status')
+    if status:
+        subscriptions = subscriptions.filter(status=status)
+
+    start_date = date_param(params, 'from')
+    if start_date:
+        subscriptions = subscriptions.filter(start_date__gte=start_date)
+
+    end_date = date_param(params, 'to')
+    if end_date:
+        subscriptions = subscriptions.filter(start_date__lte=end_date)
+    return subscriptions
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, must_update_salt
+
+
+class ProfiledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the iteration count of the GYMADMIN_PASSWORD_PROFILE cost profile.
+
+    The algorithm name is unchanged, so existing hashes keep verifying. A login rehashes a password
+    only to raise its iteration count: a cheaper profile applies to new hashes, never to stored ones.
+    """
+
+    @property
+    def iterations(self):
+        profiles = getattr(settings, "GYMADMIN_PASSWORD_PROFILES", {})
+        iterations = profiles.get(getattr(settings, "GYMADMIN_PASSWORD_PROFILE", None))
+        # None stands for Django's own default, which rises with every release
+        return PBKDF2PasswordHasher.iterations if iterations is None else iterations
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return decoded["iterations"] < self.iterations or must_update_salt(decoded["salt"], self.salt_entropy)
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from django.utils import timezone
+
+from gymadmin import archive, cache
+from gymadmin.models import Visit
+from gymadmin.occupancy import tracker
+
+
+class Command(BaseCommand):
+    help = "Move visits older than the hot horizon from the visit table into the visit archive, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=None,
+                            help="Archive visits dated more than this many days ago (default: GYMADMIN_VISIT_HOT_DAYS)")
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Visits moved per transaction (default: GYMADMIN_ARCHIVE_BATCH_SIZE)")
+        parser.add_argument("--pause", type=float, default=0, help="Seconds to sleep between batches")
+
+    def handle(self, *args, older_than_days=None, batch_size=None, pause=0, **options):
+        older_than_days = archive.hot_days() if older_than_days is None else older_than_days
+        if older_than_days < 0 or (batch_size is not None and batch_size < 1) or pause < 0:
+            raise CommandError("--older-than-days, --batch-size and --pause must not be negative")
+        cutoff = timezone.localdate() - timedelta(days=older_than_days)
+
+        moved = 0
+        try:
+            for size in archive.archive_before(cutoff, batch_size, pause):
+                moved += size
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"Archived {moved} visits so far.")
+        except IntegrityError as error:
+            # the failed batch was rolled back, its visits are still in the visit table
+            raise CommandError(f"Stopped after {moved} visits: a visit id of the next batch is already archived "
+                               f"({error}).")
+        finally:
+            if moved:
+                # the raw deletes send no model signals
+                archive.forget_newest_date()
+                cache.invalidate(Visit)
+                tracker.mark_stale()
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} visits dated before {cutoff}."))
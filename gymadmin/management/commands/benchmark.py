@@ -0,0 +1,268 @@
+import json
+import os
+import uuid
+from datetime import time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+
+from rest_framework.renderers import JSONRenderer
+
+from gymadmin import benchmarks, cache, passwords
+from gymadmin.models import Subscription, SubscriptionType, User, Visit
+from gymadmin.renderers import FastJSONRenderer
+from gymadmin.serializers import SubscriptionSerializer, SubscriptionValuesSerializer, UserSerializer, \
+    UserValuesSerializer, VisitSerializer, VisitValuesSerializer
+
+
+# Rows whose primary key fills the <int:pk> of these URL names in the urls suite
+PK_MODELS = {
+    "users": User, "async-users": User,
+    "subscriptions": Subscription, "async-subscriptions": Subscription, "subscription-visits": Subscription,
+    "visits": Visit, "async-visits": Visit,
+}
+STRING_ARGUMENTS = {"export_format": "ndjson", "format": ".json"}
+
+
+class Command(BaseCommand):
+    help = "Run a latency/throughput benchmark suite against the configured database."
+
+    suites = ("checkin", "asgi", "signup", "urls", "serialization")
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=self.suites)
+        parser.add_argument("--iterations", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument("--fail-above-p99-ms", type=float,
+                            help="Exit with an error when the measured p99 latency is above this value")
+        parser.add_argument("--output", help="Also write the results as JSON to this file")
+        parser.add_argument("--compare", help="JSON results of an earlier run (--output) to compare against")
+        parser.add_argument("--max-regression-percent", type=float,
+                            help="With --compare, exit with an error when a p99 latency grew by more than this")
+        parser.add_argument("--no-cache", action="store_true", help="Measure with the response cache disabled")
+        parser.add_argument("--rows", type=int, default=100000, help="Rows per list in the serialization suite")
+
+    def handle(self, *args, suite, **options):
+        if options["iterations"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--iterations and --concurrency must be positive")
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as source:
+                baseline = json.load(source)
+            if baseline.get("suite") != suite:
+                raise CommandError(f"{options['compare']} holds results of the {baseline.get('suite')} suite")
+
+        with benchmarks.allow_test_client(), override_settings(
+                GYMADMIN_CACHE_ENABLED=not options["no_cache"] and cache.is_enabled()):
+            results = getattr(self, f"bench_{suite}")(**options)
+
+        for name, summary in results.items():
+            self.stdout.write(f"{name}: " + ", ".join(f"{key}={value}" for key, value in summary.items()))
+        if options["output"]:
+            options_used = {key: options[key] for key in ("iterations", "concurrency", "no_cache")}
+            with open(options["output"], "w") as output:
+                json.dump({"suite": suite, "environment": benchmarks.environment(), "options": options_used,
+                           "results": results}, output, indent=2)
+
+        limit = options["fail_above_p99_ms"]
+        slow = [name for name, summary in results.items() if limit is not None and summary["p99_ms"] > limit]
+        if baseline is not None:
+            changes = benchmarks.compare(baseline["results"], results)
+            for name, change in changes.items():
+                self.stdout.write(f"{name} vs {options['compare']}: " +
+                                  ", ".join(f"{key} {value:+}%" for key, value in change.items() if value is not None))
+            allowed = options["max_regression_percent"]
+            if allowed is not None:
+                slow += [name for name, change in changes.items() if (change["p99_ms"] or 0) > allowed]
+        if slow:
+            raise CommandError(f"p99 above the limit: {', '.join(slow)}")
+
+    def bench_checkin(self, iterations, concurrency, **options):
+        marker = uuid.uuid4().hex[:8]
+        today = timezone.localdate()
+        type, created_type = SubscriptionType.objects.get_or_create(title="benchmark")
+        User.objects.bulk_create([
+            User(email=f"bench-{marker}-{index}@example.com", first_name="Bench", last_name=str(index),
+                 birth_date="1990-01-01", password="!")
+            for index in range(iterations)
+        ])
+        users = list(User.objects.filter(email__startswith=f"bench-{marker}-").values_list("id", flat=True))
+        Subscription.objects.bulk_create([
+            Subscription(user_id=user_id, type=type, start_date=today - timedelta(days=30),
+                         end_date=today + timedelta(days=30), price=0)
+            for user_id in users
+        ])
+        subscriptions = list(Subscription.objects.filter(user_id__in=users).values_list("id", flat=True))
+
+        def post(url, subscription_id):
+            response = Client().post(url, {"subscription_id": subscription_id}, content_type="application/json")
+            if response.status_code >= 300:
+                raise CommandError(f"{url} answered {response.status_code}: {response.content[:200]!r}")
+
+        try:
+            return {
+                "check-in": benchmarks.run(lambda pk: post(reverse("visits-check-in"), pk), subscriptions, concurrency),
+                "check-out": benchmarks.run(lambda pk: post(reverse("visits-check-out"), pk), subscriptions, concurrency),
+            }
+        finally:
+            User.objects.filter(id__in=users).delete()
+            if created_type:
+                type.delete()
+
+    def bench_asgi(self, iterations, concurrency, **options):
+        """Same payloads served by the sync APIViews (WSGI handler) and the async views (ASGI handler)."""
+        marker = uuid.uuid4().hex[:8]
+        today = timezone.localdate()
+        type, created_type = SubscriptionType.objects.get_or_create(title="benchmark")
+        user = User.objects.create(email=f"bench-{marker}@example.com", first_name="Bench", last_name="Asgi",
+                                   birth_date="1990-01-01", password="!")
+        subscription = Subscription.objects.create(user=user, type=type, start_date=today, end_date=today, price=0)
+        endpoints = {
+            "user-detail": (reverse("users", kwargs={"pk": user.pk}), reverse("async-users", kwargs={"pk": user.pk})),
+            "subscription-list": (reverse("subscriptions") + f"?user_id={user.pk}",
+                                  reverse("async-subscriptions") + f"?user_id={user.pk}"),
+            "statistics": (reverse("statistics") + "?from=2020-01-01", reverse("async-statistics") + "?from=2020-01-01"),
+        }
+
+        def get(url):
+            response = Client().get(url)
+            if response.status_code != 200:
+                raise CommandError(f"{url} answered {response.status_code}")
+
+        async def aget(url):
+            response = await AsyncClient().get(url)
+            if response.status_code != 200:
+                raise CommandError(f"{url} answered {response.status_code}")
+
+        results = {}
+        try:
+            for name, (sync_url, async_url) in endpoints.items():
+                results[f"{name} wsgi"] = benchmarks.run(get, [sync_url] * iterations, concurrency)
+                results[f"{name} asgi"] = benchmarks.arun(aget, [async_url] * iterations, concurrency)
+        finally:
+            subscription.delete()
+            user.delete()
+            if created_type:
+                type.delete()
+        return results
+
+    def bench_signup(self, iterations, concurrency, **options):
+        """Registrations per second with passwords hashed inline and by pools of 1, 2, 4... up to one process per core."""
+        marker = uuid.uuid4().hex[:8]
+        pool_sizes = [0] + [size for size in (1, 2, 4, 8, 16, 32, 64) if size < os.cpu_count()] + [os.cpu_count()]
+
+        def register(email):
+            response = Client().post(reverse("register"), {"email": email, "first_name": "Bench", "last_name": "Signup",
+                                                           "birth_date": "1990-01-01", "password": email},
+                                     content_type="application/json")
+            if response.status_code != 201:
+                raise CommandError(f"register answered {response.status_code}: {response.content[:200]!r}")
+
+        results = {}
+        try:
+            for workers in sorted(set(pool_sizes)):
+                emails = [f"bench-{marker}-{workers}-{index}@example.com" for index in range(iterations)]
+                # enough request threads to keep every hashing process busy
+                threads = max(concurrency, workers)
+                with override_settings(GYMADMIN_PASSWORD_WORKERS=workers, GYMADMIN_REGISTRATION_RATE=None,
+                                       GYMADMIN_PASSWORD_MAX_PENDING=max(threads, 1)):
+                    name = f"signup workers={workers}" if workers else "signup inline"
+                    results[name] = benchmarks.run(register, emails, threads)
+        finally:
+            passwords.shutdown()
+            User.objects.filter(email__startswith=f"bench-{marker}-").delete()
+        return results
+
+    def url_targets(self):
+        """Every GET endpoint of the URLconf with its arguments taken from the data in the database."""
+        today = timezone.localdate()
+        year_ago = str(today - timedelta(days=365))
+        month_ago = str(today - timedelta(days=30))
+        # keep the exports and list filters to a recent slice of a large dataset
+        query_strings = {
+            "statistics": f"?from={year_ago}", "async-statistics": f"?from={year_ago}",
+            "visits-export": f"?from={month_ago}", "subscriptions-export": f"?from={month_ago}",
+            "visit-analytics": f"?from={year_ago}", "users-search": "?q=shev",
+            # the spec behind the UI pages, their HTML needs drf_yasg's templates
+            "schema-swagger-ui": "?format=openapi", "schema-redoc": "?format=openapi",
+        }
+        pks = {model: model.objects.order_by("-pk").values_list("pk", flat=True).first() for model in {*PK_MODELS.values()}}
+
+        targets, skipped = {}, []
+        for pattern in get_resolver().url_patterns:
+            view_class = getattr(getattr(pattern, "callback", None), "view_class", None)
+            if not isinstance(pattern, URLPattern) or not hasattr(view_class, "get"):
+                continue
+            kwargs = {}
+            for argument in pattern.pattern.converters:
+                if argument == "pk":
+                    kwargs[argument] = pks.get(PK_MODELS.get(pattern.name))
+                else:
+                    kwargs[argument] = STRING_ARGUMENTS.get(argument)
+            if None in kwargs.values():
+                skipped.append(str(pattern.pattern))
+                continue
+            name = str(pattern.pattern) if not kwargs else f"{pattern.pattern} {kwargs}"
+            targets[name] = reverse(pattern.name, kwargs=kwargs) + query_strings.get(pattern.name, "")
+        if skipped:
+            self.stderr.write(f"Skipped, no data to fill in: {', '.join(skipped)}")
+        return targets
+
+    def bench_urls(self, iterations, concurrency, **options):
+        """Every GET endpoint against the data in the database, e.g. as made by `generate_gym_data`."""
+        def get(url):
+            response = Client().get(url)
+            if response.status_code != 200:
+                raise CommandError(f"{url} answered {response.status_code}")
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+
+        return {name: benchmarks.run(get, [url] * iterations, concurrency) for name, url in self.url_targets().items()}
+
+    def bench_serialization(self, iterations, rows, **options):
+        """
+        One list of --rows rows per iteration (keep --iterations small), in memory: the DRF serializers over
+        model instances and JSONRenderer, against the values serializers over `.values()` rows and FastJSONRenderer.
+        """
+        today = timezone.localdate()
+        subscription_type = SubscriptionType(id=1, title="gym")
+        lists = {
+            "users": (UserSerializer, UserValuesSerializer, [
+                User(id=pk, first_name="Anna", last_name="Shevchenko", email=f"anna.{pk}@example.com")
+                for pk in range(1, rows + 1)
+            ]),
+            "subscriptions": (SubscriptionSerializer, SubscriptionValuesSerializer, [
+                Subscription(id=pk, user_id=pk, type=subscription_type, start_date=today,
+                             end_date=today + timedelta(days=30), price=60000)
+                for pk in range(1, rows + 1)
+            ]),
+            "visits": (VisitSerializer, VisitValuesSerializer, [
+                Visit(id=pk, subscription_id=pk, date=today, enter_time=time(18, 30), exit_time=time(20, 0))
+                for pk in range(1, rows + 1)
+            ]),
+        }
+
+        results = {}
+        for name, (serializer_class, values_class, instances) in lists.items():
+            values = [{column: benchmarks.attribute(instance, column) for _, column, _ in values_class.fields}
+                      for instance in instances]
+            payloads = {
+                "drf": lambda _: serializer_class(instances, many=True).data,
+                "values": lambda _: values_class.serialize(values),
+            }
+            renderers = {"drf": JSONRenderer(), "values": FastJSONRenderer()}
+            for mode, build in payloads.items():
+                results[f"{name} {mode} serialize"] = benchmarks.run(build, range(iterations))
+                payload = build(None)
+                results[f"{name} {mode} render"] = benchmarks.run(lambda _: renderers[mode].render(payload),
+                                                                  range(iterations))
+            if JSONRenderer().render(payloads["drf"](None)) != FastJSONRenderer().render(payloads["values"](None)):
+                raise CommandError(f"The values serializer renders different {name} than the DRF serializer")
+            drf, fast = ([results[f"{name} {mode} {step}"]["mean_ms"] for step in ("serialize", "render")]
+                         for mode in ("drf", "values"))
+            self.stdout.write(f"{name}: values serializer {drf[0] / fast[0]:.1f}x faster than DRF, "
+                              f"{sum(drf) / sum(fast):.1f}x with rendering")
+        return results
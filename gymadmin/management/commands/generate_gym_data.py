@@ -0,0 +1,153 @@
+import random
+from datetime import date, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from gymadmin import cache
+from gymadmin.models import Subscription, SubscriptionType, User, Visit
+from gymadmin.occupancy import tracker
+from gymadmin.search import index
+
+FIRST_NAMES = (
+    "Anna", "Andrii", "Bohdan", "Daria", "Dmytro", "Iryna", "Ivan", "Kateryna", "Maksym", "Maria", "Mykola",
+    "Nazar", "Oksana", "Oleh", "Olena", "Oleksandr", "Pavlo", "Roman", "Sofia", "Taras", "Viktoria", "Yulia",
+)
+LAST_NAMES = (
+    "Bondarenko", "Boyko", "Hnatiuk", "Kovalenko", "Kovalchuk", "Kravchenko", "Lysenko", "Marchenko", "Melnyk",
+    "Moroz", "Oliynyk", "Pavlenko", "Petrenko", "Savchenko", "Shevchenko", "Shevchuk", "Tkachenko", "Tkachuk",
+)
+# title: monthly price in cents
+TYPES = {"gym": 60000, "pool": 45000, "yoga": 50000, "crossfit": 80000, "full": 120000}
+DURATIONS = (30, 30, 30, 90, 90, 180, 365)
+# weights of the hour of entry, 06:00 to 22:00: a morning and an evening peak
+ENTRY_HOURS = {6: 3, 7: 6, 8: 8, 9: 6, 10: 4, 11: 3, 12: 4, 13: 4, 14: 3, 15: 3, 16: 5, 17: 8, 18: 10, 19: 9,
+               20: 6, 21: 3}
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic members, subscriptions and visits for load tests, inserting them in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--subscriptions", type=int, default=3000)
+        parser.add_argument("--visits", type=int, default=100000)
+        parser.add_argument("--days", type=int, default=730, help="Spread the history over this many past days")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, the same seed generates the same data")
+        parser.add_argument("--chunk-size", type=int, default=getattr(settings, "GYMADMIN_BULK_BATCH_SIZE", 1000))
+        parser.add_argument("--skip-statistics", action="store_true",
+                            help="Do not rebuild the statistics rollups and member stats afterwards")
+
+    def handle(self, *args, users, subscriptions, visits, days, seed, chunk_size, skip_statistics, **options):
+        if min(users, days, chunk_size) < 1 or subscriptions < 0 or visits < 0:
+            raise CommandError("--users, --days and --chunk-size must be positive, the other counts not negative")
+        self.verbosity = options["verbosity"]
+        self.random = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.today = timezone.localdate()
+        self.first_day = self.today - timedelta(days=days)
+
+        user_ids = self.create_users(users)
+        subscription_rows = self.create_subscriptions(user_ids, subscriptions)
+        visit_count = self.create_visits(subscription_rows, visits)
+
+        # bulk_create sends no model signals
+        if not skip_statistics:
+            call_command("rebuild_statistics", "--from", str(self.first_day), "--to", str(self.today),
+                         stdout=self.stdout)
+            call_command("rebuild_user_stats", "--batch-size", str(self.chunk_size), stdout=self.stdout)
+            call_command("rebuild_revenue", stdout=self.stdout)
+        index.mark_stale()
+        tracker.mark_stale()
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(user_ids)} users, {len(subscription_rows)} subscriptions and {visit_count} visits."
+        ))
+
+    def insert(self, model, rows):
+        chunk, inserted = [], 0
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                inserted += self.insert_chunk(model, chunk)
+                chunk = []
+        if chunk:
+            inserted += self.insert_chunk(model, chunk)
+        return inserted
+
+    def insert_chunk(self, model, chunk):
+        with transaction.atomic():
+            model.objects.bulk_create(chunk)
+        if self.verbosity > 1:
+            self.stdout.write(f"{model.__name__}: +{len(chunk)}")
+        return len(chunk)
+
+    def create_users(self, count):
+        # one shared hash: hashing every generated password would dominate the run
+        password = make_password("password")
+        offset = (User.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+        now, span = timezone.now(), (self.today - self.first_day).days
+
+        def users():
+            for number in range(offset, offset + count):
+                first_name, last_name = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+                birth_date = date(1960, 1, 1) + timedelta(days=self.random.randrange(45 * 365))
+                # spread over the history, so the revenue report has cohorts
+                date_joined = now - timedelta(days=self.random.randrange(span + 1))
+                yield User(email=f"{first_name}.{last_name}.{number}@example.com".lower(), first_name=first_name,
+                           last_name=last_name, birth_date=birth_date, password=password, date_joined=date_joined)
+
+        self.insert(User, users())
+        return list(User.objects.filter(id__gte=offset).order_by("id").values_list("id", flat=True))
+
+    def create_subscriptions(self, user_ids, count):
+        types = {title: SubscriptionType.objects.get_or_create(title=title)[0].id for title in TYPES}
+        offset = (Subscription.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+        span = (self.today - self.first_day).days
+
+        def subscriptions():
+            for _ in range(count):
+                title = self.random.choice(list(TYPES))
+                duration = self.random.choice(DURATIONS)
+                start_date = self.first_day + timedelta(days=self.random.randrange(span + 1))
+                end_date = start_date + timedelta(days=duration)
+                # bulk_create skips the pre_save handler deriving the status
+                yield Subscription(user_id=self.random.choice(user_ids), type_id=types[title], start_date=start_date,
+                                   end_date=end_date, price=TYPES[title] * duration // 30,
+                                   status=Subscription.status_on(self.today, start_date, end_date))
+
+        self.insert(Subscription, subscriptions())
+        return list(Subscription.objects.filter(id__gte=offset).order_by("id")
+                    .values_list("id", "start_date", "end_date"))
+
+    def create_visits(self, subscription_rows, count):
+        if not subscription_rows or not count:
+            return 0
+        hours, weights = list(ENTRY_HOURS), list(ENTRY_HOURS.values())
+        # days each subscription can be visited on (up to today), visits are shared out in proportion
+        spans = [max(0, (min(end_date, self.today) - start_date).days + 1) for _, start_date, end_date in subscription_rows]
+        total_span = sum(spans)
+        if not total_span:
+            return 0
+
+        def visits():
+            remaining = count
+            for (subscription_id, start_date, _), span in zip(subscription_rows, spans):
+                share = min(span, remaining, round(count * span / total_span))
+                remaining -= share
+                # one visit per subscription and day keeps the (subscription, date, enter_time) key unique
+                for offset in sorted(self.random.sample(range(span), share)):
+                    hour = self.random.choices(hours, weights)[0]
+                    enter_time = time(hour, self.random.randrange(60))
+                    # entries end at 21:59, so visits of up to two hours end before midnight
+                    minutes = hour * 60 + enter_time.minute + self.random.randint(30, 120)
+                    exit_time = time(minutes // 60, minutes % 60)
+                    yield Visit(subscription_id=subscription_id, date=start_date + timedelta(days=offset),
+                                enter_time=enter_time, exit_time=exit_time)
+
+        return self.insert(Visit, visits())
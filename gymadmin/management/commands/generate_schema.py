@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from gymadmin import schema
+
+
+class Command(BaseCommand):
+    help = "Write the OpenAPI document to GYMADMIN_SCHEMA_DIR, for the schema endpoint to serve without generating it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="Base URL of the API (scheme and host) to put in the document; "
+                                          "without it clients use the host serving the document")
+
+    def handle(self, *args, url=None, **options):
+        paths = schema.write(url)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {', '.join(str(path) for path in paths)}."))
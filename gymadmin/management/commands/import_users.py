@@ -0,0 +1,70 @@
+import csv
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gymadmin import cache, passwords
+from gymadmin import counts as row_counts
+from gymadmin.models import User, UserStats
+from gymadmin.search import index
+from gymadmin.serializers import UserSerializer
+
+
+class Command(BaseCommand):
+    help = ("Import members from a CSV file with first_name, last_name, email, birth_date and password columns, "
+            "hashing passwords in parallel and inserting them in batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to import, - for standard input")
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "GYMADMIN_BULK_BATCH_SIZE", 1000))
+
+    def handle(self, *args, path, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+        source = sys.stdin if path == "-" else open(path, newline="")
+        counts = {"imported": 0, "existing": 0, "invalid": 0}
+        try:
+            batch = []
+            for line, row in enumerate(csv.DictReader(source), start=2):
+                serializer = UserSerializer(data=row)
+                if not serializer.is_valid():
+                    counts["invalid"] += 1
+                    self.stderr.write(f"line {line}: {serializer.errors}")
+                    continue
+                batch.append(serializer.validated_data)
+                if len(batch) == batch_size:
+                    self.import_batch(batch, counts)
+                    batch = []
+            if batch:
+                self.import_batch(batch, counts)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        # bulk_create sends no model signals
+        index.mark_stale()
+        cache.invalidate(User)
+        row_counts.forget(User)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['imported']} users, skipped {counts['existing']} existing and {counts['invalid']} invalid rows."
+        ))
+
+    def import_batch(self, rows, counts):
+        by_email = {}
+        for row in rows:
+            by_email.setdefault(User.objects.normalize_email(row["email"]), row)
+        existing = set(User.objects.filter(email__in=by_email).values_list("email", flat=True))
+        fresh = {email: row for email, row in by_email.items() if email not in existing}
+        counts["existing"] += len(rows) - len(fresh)
+
+        hashes = passwords.hash_passwords(row["password"] for row in fresh.values())
+        User.objects.bulk_create([
+            User(email=email, first_name=row["first_name"], last_name=row["last_name"], birth_date=row["birth_date"],
+                 password=password)
+            for (email, row), password in zip(fresh.items(), hashes)
+        ], ignore_conflicts=True)
+        # the ids are not returned by every backend, and new members have nothing to count yet
+        UserStats.objects.bulk_create([UserStats(user_id=pk) for pk in User.objects.filter(email__in=fresh)
+                                      .values_list("id", flat=True)], ignore_conflicts=True)
+        counts["imported"] += len(fresh)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gymadmin import revenue
+
+
+class Command(BaseCommand):
+    help = "Recount the monthly revenue per subscription type and member cohort from the subscriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="first_month", type=revenue.parse_month,
+                            help="First month to rebuild, YYYY-MM (default: the first month any subscription covers)")
+        parser.add_argument("--to", dest="last_month", type=revenue.parse_month,
+                            help="Last month to rebuild, YYYY-MM (default: the last month any subscription covers)")
+
+    def handle(self, *args, first_month=None, last_month=None, **options):
+        covered = revenue.covered_months()
+        if covered is None and (first_month is None or last_month is None):
+            self.stdout.write("Nothing to rebuild.")
+            return
+        first_month = first_month or covered[0]
+        last_month = last_month or covered[1]
+        if first_month > last_month:
+            raise CommandError("--from must not be after --to")
+        rows = revenue.refresh_months(first_month, last_month)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} revenue rows from {first_month:%Y-%m} to {last_month:%Y-%m}."
+        ))
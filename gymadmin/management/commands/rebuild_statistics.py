@@ -0,0 +1,38 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from gymadmin import statistics
+from gymadmin.models import Subscription, Visit
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily and hourly visit and the daily subscription rollups used by the statistics endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start_date", type=date.fromisoformat,
+                            help="First day to rebuild (default: earliest visit or subscription)")
+        parser.add_argument("--to", dest="end_date", type=date.fromisoformat,
+                            help="Last day to rebuild (default: latest visit or subscription)")
+        parser.add_argument("--days-per-batch", type=int, default=31)
+
+    def handle(self, *args, start_date=None, end_date=None, days_per_batch=31, **options):
+        if days_per_batch < 1:
+            raise CommandError("--days-per-batch must be positive")
+        visits = Visit.objects.aggregate(first=Min("date"), last=Max("date"))
+        subscriptions = Subscription.objects.aggregate(first=Min("start_date"), last=Max("start_date"))
+        start_date = start_date or min(filter(None, [visits["first"], subscriptions["first"]]), default=None)
+        end_date = end_date or max(filter(None, [visits["last"], subscriptions["last"]]), default=None)
+        if start_date is None or end_date is None:
+            self.stdout.write("Nothing to rebuild.")
+            return
+
+        day = start_date
+        while day <= end_date:
+            batch = [day + timedelta(days=offset) for offset in range(days_per_batch)
+                     if day + timedelta(days=offset) <= end_date]
+            statistics.refresh_visit_days(batch)
+            statistics.refresh_subscription_days(batch)
+            day += timedelta(days=days_per_batch)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt statistics from {start_date} to {end_date}."))
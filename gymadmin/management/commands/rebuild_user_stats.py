@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from gymadmin import statistics
+from gymadmin.models import User
+
+
+class Command(BaseCommand):
+    help = "Recount the visits, last visit and current subscription of every member into UserStats, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "GYMADMIN_BULK_BATCH_SIZE", 1000),
+                            help="Members recounted per transaction")
+
+    def handle(self, *args, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+        users = User.objects.order_by("id").values_list("id", flat=True)
+        last, rebuilt = 0, 0
+        while True:
+            pks = list(users.filter(id__gt=last)[:batch_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                statistics.refresh_user_stats(pks)
+            last, rebuilt = pks[-1], rebuilt + len(pks)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{rebuilt} members so far")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the stats of {rebuilt} members."))
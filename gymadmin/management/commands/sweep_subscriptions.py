@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from gymadmin import expiry
+from gymadmin.exports import SUBSCRIPTION_EXPORT_FIELDS, iterate_rows, ndjson_lines
+
+
+class Command(BaseCommand):
+    help = ("Move subscription statuses along with the calendar, in batches: expire ended subscriptions and "
+            "activate started ones. Optionally list the subscriptions expiring soon as NDJSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Subscriptions updated per transaction (default: GYMADMIN_SUBSCRIPTION_SWEEP_BATCH_SIZE)")
+        parser.add_argument("--expiring-days", type=int, default=None,
+                            help="Afterwards write the active subscriptions ending within this many days")
+        parser.add_argument("--every", type=float, default=None,
+                            help="Keep running, sweeping again every this many seconds")
+
+    def handle(self, *args, batch_size=None, expiring_days=None, every=None, **options):
+        if (batch_size is not None and batch_size < 1) or (expiring_days is not None and expiring_days < 0) \
+                or (every is not None and every <= 0):
+            raise CommandError("--batch-size and --every must be positive, --expiring-days not negative")
+        self.verbosity = options["verbosity"]
+        # stdout carries the NDJSON list when there is one
+        self.log = self.stderr if expiring_days is not None else self.stdout
+        while True:
+            self.sweep(batch_size)
+            if expiring_days is not None:
+                self.write_expiring(expiring_days)
+            if every is None:
+                return
+            # a long-running process must not keep a connection past CONN_MAX_AGE
+            close_old_connections()
+            try:
+                time.sleep(every)
+            except KeyboardInterrupt:
+                return
+
+    def sweep(self, batch_size):
+        today = timezone.localdate()
+        changed = {}
+        for status, size in expiry.sweep(today, batch_size):
+            changed[status] = changed.get(status, 0) + size
+            if self.verbosity > 1:
+                self.log.write(f"{status}: {changed[status]} so far", style_func=str)
+        summary = ", ".join(f"{size} {status}" for status, size in changed.items()) or "nothing to change"
+        self.log.write(f"Swept subscriptions for {today}: {summary}.", style_func=self.style.SUCCESS)
+
+    def write_expiring(self, days):
+        names = [name for name, _ in SUBSCRIPTION_EXPORT_FIELDS]
+        columns = [column for _, column in SUBSCRIPTION_EXPORT_FIELDS]
+        for line in ndjson_lines(iterate_rows(expiry.expiring(days), columns), names):
+            self.stdout.write(line, ending="")
@@ -0,0 +1,173 @@
+"""
+In-process request metrics in the Prometheus text format.
+
+`MetricsMiddleware` times each request and labels it with the view class and method. The database
+time and query count are collected by an execute wrapper installed on every connection, and the
+serializer time by the serializers in `gymadmin.serializers`. A thread records into one of a fixed set
+of shards, picked by its thread id, under that shard's lock, so concurrent requests seldom wait on each
+other and threads that come and go leave nothing behind; `render()` adds the shards up when /metrics is
+scraped.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# positions in a shard row after the latency buckets
+COUNT, LATENCY, QUERIES, DB_SECONDS, SERIALIZER_SECONDS, RESPONSE_BYTES = range(len(LATENCY_BUCKETS),
+                                                                                 len(LATENCY_BUCKETS) + 6)
+ROW_SIZE = RESPONSE_BYTES + 1
+
+# number of shards of the registry, shared by all the threads of the process
+SHARDS = 16
+
+_current = contextvars.ContextVar("gymadmin_metrics_request", default=None)
+
+
+def is_enabled():
+    return getattr(settings, "GYMADMIN_METRICS_ENABLED", True)
+
+
+class RequestMetrics:
+    __slots__ = ("queries", "db_seconds", "serializer_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+
+class Registry:
+    def __init__(self, shards=SHARDS):
+        self._shards = [(threading.Lock(), {}) for _ in range(shards)]
+
+    def _shard(self):
+        return self._shards[threading.get_ident() % len(self._shards)]
+
+    def record(self, view, method, status, seconds, request, response_bytes):
+        lock, shard = self._shard()
+        key = (view, method, str(status))
+        with lock:
+            row = shard.get((view, method))
+            if row is None:
+                row = shard[(view, method)] = [0] * ROW_SIZE
+            for position, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    row[position] += 1
+            row[COUNT] += 1
+            row[LATENCY] += seconds
+            row[QUERIES] += request.queries
+            row[DB_SECONDS] += request.db_seconds
+            row[SERIALIZER_SECONDS] += request.serializer_seconds
+            row[RESPONSE_BYTES] += response_bytes
+            shard[key] = shard.get(key, 0) + 1
+
+    def snapshot(self):
+        rows, statuses = {}, {}
+        for lock, shard in self._shards:
+            # copied under the lock, so a row is never read halfway through a record()
+            with lock:
+                items = [(key, value if len(key) == 3 else list(value)) for key, value in shard.items()]
+            for key, value in items:
+                if len(key) == 3:
+                    statuses[key] = statuses.get(key, 0) + value
+                else:
+                    total = rows.setdefault(key, [0] * ROW_SIZE)
+                    for position, amount in enumerate(value):
+                        total[position] += amount
+        return rows, statuses
+
+    def clear(self):
+        for lock, shard in self._shards:
+            with lock:
+                shard.clear()
+
+
+registry = Registry()
+
+
+def start_request():
+    return _current.set(RequestMetrics())
+
+
+def finish_request(token):
+    request = _current.get()
+    _current.reset(token)
+    return request
+
+
+@contextmanager
+def measure_serializer():
+    request = _current.get()
+    if request is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.serializer_seconds += time.perf_counter() - started
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    request = _current.get()
+    if request is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request.queries += 1
+        request.db_seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_wrapper(sender, connection, **kwargs):
+    if _query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_wrapper)
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def render():
+    rows, statuses = registry.snapshot()
+    lines = [
+        "# HELP gymadmin_requests_total Requests per view, method and status code.",
+        "# TYPE gymadmin_requests_total counter",
+    ]
+    for (view, method, status), count in sorted(statuses.items()):
+        lines.append(f"gymadmin_requests_total{{{_labels(view=view, method=method, status=status)}}} {count}")
+
+    lines += [
+        "# HELP gymadmin_request_duration_seconds Request latency per view and method.",
+        "# TYPE gymadmin_request_duration_seconds histogram",
+    ]
+    for (view, method), row in sorted(rows.items()):
+        labels = _labels(view=view, method=method)
+        for position, bound in enumerate(LATENCY_BUCKETS):
+            lines.append(f'gymadmin_request_duration_seconds_bucket{{{labels},le="{bound}"}} {row[position]}')
+        lines.append(f'gymadmin_request_duration_seconds_bucket{{{labels},le="+Inf"}} {row[COUNT]}')
+        lines.append(f"gymadmin_request_duration_seconds_sum{{{labels}}} {row[LATENCY]:.6f}")
+        lines.append(f"gymadmin_request_duration_seconds_count{{{labels}}} {row[COUNT]}")
+
+    for name, position, kind, description in (
+        ("gymadmin_db_queries_total", QUERIES, "counter", "Database queries run by requests per view and method."),
+        ("gymadmin_db_query_seconds_total", DB_SECONDS, "counter", "Time spent in database queries per view and method."),
+        ("gymadmin_serializer_seconds_total", SERIALIZER_SECONDS, "counter",
+         "Time spent serializing payloads per view and method."),
+        ("gymadmin_response_bytes_total", RESPONSE_BYTES, "counter",
+         "Size of the non-streaming response bodies per view and method."),
+    ):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for (view, method), row in sorted(rows.items()):
+            value = f"{row[position]:.6f}" if isinstance(row[position], float) else row[position]
+            lines.append(f"{name}{{{_labels(view=view, method=method)}}} {value}")
+    return "\n".join(lines) + "\n"
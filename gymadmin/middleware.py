@@ -0,0 +1,117 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from gymadmin import metrics, routers
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class HybridMiddleware:
+    """
+    Runs in the sync (WSGI) and in the async (ASGI) handler chain without an adapter thread. Subclasses
+    override `call` and `__acall__`, which pass the request on unchanged by default.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.call(request)
+
+    def call(self, request):
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """
+    Lets safe requests read from replicas, and pins a client to the primary for a short window after
+    it wrote so it reads its own writes despite replication lag.
+    """
+    cookie_name = "gymadmin_primary_until"
+
+    def sticky_seconds(self):
+        return routers.sticky_seconds()
+
+    def allow_replica_reads(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            pinned_until = 0
+        return routers.allow_replica_reads(request.method in SAFE_METHODS and pinned_until < time.time())
+
+    def pin(self, request, response, wrote):
+        if wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(self.cookie_name, str(time.time() + self.sticky_seconds()),
+                                max_age=self.sticky_seconds(), httponly=True, samesite="Lax")
+        return response
+
+    def call(self, request):
+        tokens = self.allow_replica_reads(request)
+        try:
+            response = self.get_response(request)
+            wrote = routers.wrote()
+        finally:
+            routers.reset(tokens)
+        return self.pin(request, response, wrote)
+
+    async def __acall__(self, request):
+        tokens = self.allow_replica_reads(request)
+        try:
+            response = await self.get_response(request)
+            wrote = routers.wrote()
+        finally:
+            routers.reset(tokens)
+        return self.pin(request, response, wrote)
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Records latency, database and serializer time and response size per view, see gymadmin.metrics."""
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return "unresolved"
+        view_class = getattr(match.func, "view_class", None)
+        return view_class.__name__ if view_class else getattr(match.func, "__name__", "unknown")
+
+    def record(self, request, response, started, request_metrics):
+        seconds = time.perf_counter() - started
+        size = 0 if response.streaming else len(response.content)
+        metrics.registry.record(self.view_name(request), request.method, response.status_code, seconds,
+                                request_metrics, size)
+        return response
+
+    def call(self, request):
+        if not metrics.is_enabled():
+            return self.get_response(request)
+
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_metrics = metrics.finish_request(token)
+        return self.record(request, response, started, request_metrics)
+
+    async def __acall__(self, request):
+        if not metrics.is_enabled():
+            return await self.get_response(request)
+
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_metrics = metrics.finish_request(token)
+        return self.record(request, response, started, request_metrics)
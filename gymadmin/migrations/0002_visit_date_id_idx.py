@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['date', 'id'], name='visit_date_id_idx'),
+        ),
+    ]
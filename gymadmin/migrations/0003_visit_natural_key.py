@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:18
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def remove_duplicate_visits(apps, schema_editor):
+    """Keep the first visit of every (subscription, date, enter_time), with the latest exit time of its copies."""
+    Visit = apps.get_model("gymadmin", "Visit")
+    duplicates = (Visit.objects.values("subscription_id", "date", "enter_time")
+                  .annotate(first=Min("id"), copies=Count("id"), last_exit=Max("exit_time"))
+                  .filter(copies__gt=1).order_by())
+    for row in duplicates.iterator():
+        Visit.objects.filter(pk=row["first"], exit_time__isnull=True).update(exit_time=row["last_exit"])
+        Visit.objects.filter(subscription_id=row["subscription_id"], date=row["date"],
+                             enter_time=row["enter_time"]).exclude(pk=row["first"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0002_visit_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_visits, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='visit',
+            constraint=models.UniqueConstraint(fields=('subscription', 'date', 'enter_time'), name='visit_natural_key'),
+        ),
+    ]
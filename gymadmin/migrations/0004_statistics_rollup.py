@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0003_visit_natural_key'),
+    ]
+
+    # the daily rollups of the existing rows are filled in by 0013_backfill_rollups
+    operations = [
+        migrations.CreateModel(
+            name='DailySubscriptionStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('subscriptions', models.PositiveIntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyVisitStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('visits', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['start_date', 'type'], name='subscription_start_type_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailysubscriptionstatistics',
+            name='type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='gymadmin.subscriptiontype'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysubscriptionstatistics',
+            constraint=models.UniqueConstraint(fields=('date', 'type'), name='daily_subscription_statistics_key'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0004_statistics_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['exit_time', 'date'], name='visit_exit_time_date_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0005_visit_exit_time_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'end_date'], name='subscription_user_end_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0006_subscription_user_end_idx'),
+    ]
+
+    # the hourly rollup of the existing rows are filled in by 0013_backfill_rollups
+    operations = [
+        migrations.CreateModel(
+            name='HourlyVisitStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('finished_visits', models.PositiveIntegerField(default=0)),
+                ('duration_seconds', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['date', 'enter_time', 'exit_time'], name='visit_date_times_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlyvisitstatistics',
+            constraint=models.UniqueConstraint(fields=('date', 'hour'), name='hourly_visit_statistics_key'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0007_hourly_visit_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('enter_time', models.TimeField()),
+                ('exit_time', models.TimeField(blank=True, null=True)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_visits', to='gymadmin.subscription')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'id'], name='visit_archive_date_id_idx'), models.Index(fields=['subscription', 'date'], name='visit_archive_subscription_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:01
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def derive_statuses(apps, schema_editor):
+    Subscription = apps.get_model('gymadmin', 'Subscription')
+    today = timezone.localdate()
+    Subscription.objects.filter(end_date__lt=today).update(status='expired')
+    Subscription.objects.filter(start_date__gt=today, end_date__gte=today).update(status='upcoming')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='status',
+            field=models.CharField(choices=[('upcoming', 'Upcoming'), ('active', 'Active'), ('expired', 'Expired')], default='active', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['status', 'end_date'], name='subscription_status_end_idx'),
+        ),
+        migrations.RunPython(derive_statuses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0010_subscription_status'),
+    ]
+
+    # the member stats of the existing rows are filled in by 0013_backfill_rollups
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('last_visit_date', models.DateField(blank=True, null=True)),
+                ('current_subscription', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='gymadmin.subscription')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['visits', 'user'], name='user_stats_visits_idx'), models.Index(fields=['last_visit_date', 'user'], name='user_stats_last_visit_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0011_user_stats'),
+    ]
+
+    # the monthly revenue of the existing rows are filled in by 0013_backfill_rollups
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('cohort', models.DateField()),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('subscriptions', models.PositiveIntegerField(default=0)),
+                ('type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='gymadmin.subscriptiontype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('month', 'type', 'cohort'), name='monthly_revenue_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:20
+
+import io
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def backfill_rollups(apps, schema_editor):
+    # the rollup tables of 0004, 0007, 0011 and 0012 are created empty and the signals only count the
+    # writes made after them. The rebuild commands work on the current models, whose columns all exist
+    # from here on; on large tables this migration can be faked and the same commands run afterwards.
+    for command in ("rebuild_statistics", "rebuild_user_stats", "rebuild_revenue"):
+        call_command(command, stdout=io.StringIO())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gymadmin', '0012_monthly_revenue'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
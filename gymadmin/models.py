@@ -1,6 +1,8 @@
 from django.contrib.auth import models as auth_models
 from django.db import models
 
+from gymadmin import passwords
+
 class UserManager(auth_models.BaseUserManager):
     def create_user(self, first_name: str, last_name: str, email:str, birth_date:str, password: str = None, is_staff=False, is_superuser=False ) -> "User":
         if not email:
@@ -13,7 +15,7 @@ class UserManager(auth_models.BaseUserManager):
         user = self.model(email=self.normalize_email(email))
         user.first_name = first_name
         user.last_name = last_name
-        user.set_password(password)
+        user.password = passwords.hash_password(password)
         user.birth_date = birth_date
         user.is_active = True
         user.is_staff = is_staff
@@ -44,6 +46,7 @@ class User(auth_models.AbstractUser):
     email = models.EmailField(verbose_name="Email", max_length=200, unique=True, db_index=True)
     birth_date = models.DateField()
     password = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
     username = None
 
     objects = UserManager()
@@ -58,6 +61,12 @@ class SubscriptionType(models.Model):
         return self.title
 
 
+class SubscriptionStatus(models.TextChoices):
+    UPCOMING = "upcoming"
+    ACTIVE = "active"
+    EXPIRED = "expired"
+
+
 class Subscription(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=True)
@@ -65,6 +74,25 @@ class Subscription(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     price = models.IntegerField()
+    # derived from the dates on save and moved along by `sweep_subscriptions`, see gymadmin.expiry
+    status = models.CharField(max_length=10, choices=SubscriptionStatus.choices, default=SubscriptionStatus.ACTIVE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["start_date", "type"], name="subscription_start_type_idx"),
+            models.Index(fields=["user", "end_date"], name="subscription_user_end_idx"),
+            # the sweep, the expiring list and the counts per status
+            models.Index(fields=["status", "end_date"], name="subscription_status_end_idx"),
+        ]
+
+    @staticmethod
+    def status_on(day, start_date, end_date):
+        if end_date < day:
+            return SubscriptionStatus.EXPIRED
+        if start_date > day:
+            return SubscriptionStatus.UPCOMING
+        return SubscriptionStatus.ACTIVE
 
     def __str__(self):
         return f"Subscription : {self.type}, {self.user}, start: {self.start_date}, end: {self.end_date}, price: {self.price}"
@@ -76,10 +104,118 @@ class Visit(models.Model):
     date = models.DateField(db_index=True)
     enter_time = models.TimeField()
     exit_time = models.TimeField(null=True, blank=True)
-
+    # set by every write, including the raw check-in and the bulk upserts; validators of conditional GETs
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "id"], name="visit_date_id_idx"),
+            # count and newest change of a subscription's visits, read without touching the table
+            models.Index(fields=["subscription", "updated_at"], name="visit_subscription_updated_idx"),
+            models.Index(fields=["exit_time", "date"], name="visit_exit_time_date_idx"),
+            # covers the per-hour recount of a day in statistics.refresh_visit_days
+            models.Index(fields=["date", "enter_time", "exit_time"], name="visit_date_times_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["subscription", "date", "enter_time"], name="visit_natural_key"),
+        ]
 
     def __str__(self):
         return f"Visit : {self.date}, from {self.enter_time}, to: {self.exit_time}"
 
 
+class VisitArchive(models.Model):
+    """Visits older than GYMADMIN_VISIT_HOT_DAYS, moved out of Visit with their ids by `archive_visits`."""
+    id = models.BigIntegerField(primary_key=True)
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name="archived_visits")
+    date = models.DateField()
+    enter_time = models.TimeField()
+    exit_time = models.TimeField(null=True, blank=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "id"], name="visit_archive_date_id_idx"),
+            models.Index(fields=["subscription", "date"], name="visit_archive_subscription_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived visit : {self.date}, from {self.enter_time}, to: {self.exit_time}"
+
+
+class UserStats(models.Model):
+    """Per-member summary kept by `statistics.refresh_user_stats`, rebuilt by `rebuild_user_stats`."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    visits = models.PositiveIntegerField(default=0)
+    last_visit_date = models.DateField(null=True, blank=True)
+    # the subscription covering today that ends last
+    current_subscription = models.ForeignKey(Subscription, on_delete=models.SET_NULL, null=True, blank=True,
+                                             related_name="+")
+
+    class Meta:
+        indexes = [
+            # keyset pagination of users/?ordering=
+            models.Index(fields=["visits", "user"], name="user_stats_visits_idx"),
+            models.Index(fields=["last_visit_date", "user"], name="user_stats_last_visit_idx"),
+        ]
+
+    def __str__(self):
+        return f"Stats of {self.user_id}: {self.visits} visits, last on {self.last_visit_date}"
+
+
+class DailyVisitStatistics(models.Model):
+    date = models.DateField(unique=True)
+    visits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Visits on {self.date}: {self.visits}"
+
+
+class HourlyVisitStatistics(models.Model):
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    visits = models.PositiveIntegerField(default=0)
+    finished_visits = models.PositiveIntegerField(default=0)
+    duration_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "hour"], name="hourly_visit_statistics_key"),
+        ]
+
+    def __str__(self):
+        return f"Visits on {self.date} entering at {self.hour:02d}:00: {self.visits}"
+
+
+class DailySubscriptionStatistics(models.Model):
+    date = models.DateField()
+    type = models.ForeignKey(SubscriptionType, on_delete=models.CASCADE)
+    subscriptions = models.PositiveIntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "type"], name="daily_subscription_statistics_key"),
+        ]
+
+    def __str__(self):
+        return f"Subscriptions on {self.date}, {self.type}: {self.subscriptions}, revenue: {self.revenue}"
+
+
+class MonthlyRevenue(models.Model):
+    """Subscription prices spread over the days they cover, per month, type and signup month; see gymadmin.revenue."""
+    month = models.DateField()
+    type = models.ForeignKey(SubscriptionType, on_delete=models.CASCADE)
+    # first day of the month the members joined in
+    cohort = models.DateField()
+    revenue = models.BigIntegerField(default=0)
+    # subscriptions covering at least a day of the month
+    subscriptions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["month", "type", "cohort"], name="monthly_revenue_key"),
+        ]
+
+    def __str__(self):
+        return f"Revenue of {self.month:%Y-%m}, {self.type}, cohort {self.cohort:%Y-%m}: {self.revenue}"
@@ -0,0 +1,98 @@
+"""
+In-memory index of the visits that are still open: no exit_time yet, entered today or, running past
+midnight, yesterday. An older visit nobody closed is not in the gym any more.
+
+The index is seeded from the database on first use and kept current by the Visit signals once the
+writing transaction commits. Writes made by other processes are picked up by a reconcile that reruns
+the seed query after GYMADMIN_OCCUPANCY_RECONCILE_SECONDS.
+"""
+import datetime
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+from gymadmin.models import Subscription, Visit
+from gymadmin.subscription_types import registry
+
+
+def first_open_date(today=None):
+    """The earliest date of a visit that still counts as open, the same for check-in and check-out."""
+    return (today or timezone.localdate()) - datetime.timedelta(days=1)
+
+
+def open_visits(today=None):
+    return Visit.objects.filter(exit_time__isnull=True, date__gte=first_open_date(today))
+
+
+class OccupancyTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open_visits = {}
+        self._seeded_at = None
+        self._seeded_on = None
+
+    def _reconcile_interval(self):
+        return getattr(settings, "GYMADMIN_OCCUPANCY_RECONCILE_SECONDS", 5)
+
+    def _is_stale(self):
+        return self._seeded_at is None or time.monotonic() - self._seeded_at > self._reconcile_interval()
+
+    def reconcile(self):
+        rows = open_visits().values_list("id", "subscription__type_id", "enter_time")
+        entries = {pk: (type_id, enter_time.hour) for pk, type_id, enter_time in rows}
+        with self._lock:
+            self._open_visits = entries
+            self._seeded_at = time.monotonic()
+            self._seeded_on = datetime.datetime.now(datetime.timezone.utc)
+
+    def mark_stale(self):
+        with self._lock:
+            self._seeded_at = None
+
+    def visit_saved(self, visit):
+        date = Visit._meta.get_field("date").to_python(visit.date)
+        if visit.exit_time is not None or date < first_open_date():
+            self.visit_deleted(visit.pk)
+        else:
+            self.visit_opened(visit.pk, visit.subscription_id, visit.enter_time)
+
+    def visit_opened(self, pk, subscription_id, enter_time):
+        enter_time = Visit._meta.get_field("enter_time").to_python(enter_time)
+        type_id = Subscription.objects.filter(pk=subscription_id).values_list("type_id", flat=True).first()
+        with self._lock:
+            self._open_visits[pk] = (type_id, enter_time.hour)
+
+    def visit_deleted(self, pk):
+        with self._lock:
+            self._open_visits.pop(pk, None)
+
+    def _entries(self):
+        if self._is_stale():
+            self.reconcile()
+        with self._lock:
+            return list(self._open_visits.values())
+
+    def reconciled_at(self):
+        """When the index was last reloaded; it holds this process's writes since then, other processes' may be missing."""
+        with self._lock:
+            return self._seeded_on
+
+    def current_visits(self):
+        return len(self._entries())
+
+    def snapshot(self):
+        entries = self._entries()
+        # titles are looked up when read, so a renamed type shows its new title
+        per_type = Counter(registry.title(type_id) for type_id, _ in entries)
+        per_hour = Counter(hour for _, hour in entries)
+        return {
+            "current_visits": len(entries),
+            "per_type": dict(sorted(per_type.items())),
+            "per_hour": {f"{hour:02d}:00": count for hour, count in sorted(per_hour.items())},
+        }
+
+
+tracker = OccupancyTracker()
@@ -0,0 +1,176 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+from gymadmin import counts
+
+
+class KeysetPagination:
+    """
+    Cursor pagination over a fixed, indexed ordering key.
+
+    Every page is fetched with a `WHERE key > last_key ORDER BY key LIMIT n` query, so deep pages
+    cost the same as the first one. The cursor is an opaque token holding the boundary key values.
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+        self.fields = tuple(name.lstrip("-") for name in self.ordering)
+
+    def paginate_queryset(self, queryset, request):
+        return self._page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self._page([row async for row in self._page_queryset(queryset, request)])
+
+    def paginate_querysets(self, querysets, request):
+        """Paginate the union of querysets holding disjoint rows, such as a table and its archive."""
+        return self._merged_page([list(self._page_queryset(queryset, request)) for queryset in querysets])
+
+    async def apaginate_querysets(self, querysets, request):
+        return self._merged_page([[row async for row in self._page_queryset(queryset, request)]
+                                  for queryset in querysets])
+
+    def _merged_page(self, pages):
+        # each page is already the first page_size + 1 rows of its queryset, so the merged page is too
+        directions = {name.startswith("-") for name in self.ordering}
+        if len(directions) != 1:
+            raise ValueError("Merging querysets needs an ordering in a single direction")
+        rows = sorted((row for page in pages for row in page), key=self.row_key,
+                      reverse=directions.pop() != self.reverse)
+        return self._page(rows[:self.page_size + 1])
+
+    def _page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.key, self.reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = self._reversed_ordering() if self.reverse else self.ordering
+        if self.key is not None:
+            queryset = queryset.filter(self._after(self.key, ordering))
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def _page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next = self.key is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.key is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, "GYMADMIN_PAGE_SIZE", 100)
+        max_page_size = getattr(settings, "GYMADMIN_MAX_PAGE_SIZE", 1000)
+        try:
+            requested = int(self._params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            requested = page_size
+        return max(1, min(requested, max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+    def get_links(self):
+        return {"next": self.get_next_link(), "previous": self.get_previous_link()}
+
+    def decode_cursor(self, request, model):
+        encoded = self._params(request).get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            values = payload["k"]
+            reverse = bool(payload.get("r"))
+            if len(values) != len(self.fields):
+                raise ValueError
+            key = tuple(self._field(model, name).to_python(value) for name, value in zip(self.fields, values))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return key, reverse
+
+    def encode_cursor(self, key, reverse):
+        payload = {"k": [value.isoformat() if hasattr(value, "isoformat") else value for value in key]}
+        if reverse:
+            payload["r"] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode("ascii")).decode("ascii")
+
+    def row_key(self, row):
+        if isinstance(row, dict):
+            return tuple(row[name] for name in self.fields)
+        return tuple(self._attribute(row, name) for name in self.fields)
+
+    def _link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.row_key(row), reverse))
+
+    def _reversed_ordering(self):
+        return tuple(name[1:] if name.startswith("-") else "-" + name for name in self.ordering)
+
+    def _after(self, key, ordering):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), spelled out so every branch can use the index.
+        conditions = []
+        for position, name in enumerate(ordering):
+            field = name.lstrip("-")
+            lookup = "lt" if name.startswith("-") else "gt"
+            equal = {self.fields[i]: key[i] for i in range(position)}
+            conditions.append(Q(**equal, **{f"{field}__{lookup}": key[position]}))
+        return reduce(or_, conditions)
+
+    @staticmethod
+    def _params(request):
+        # DRF requests expose query_params, plain Django requests (async views) only GET
+        return getattr(request, "query_params", request.GET)
+
+    @staticmethod
+    def _field(model, name):
+        *path, last = name.split("__")
+        for part in path:
+            model = model._meta.get_field(part).related_model
+        return model._meta.get_field(last)
+
+    @staticmethod
+    def _attribute(row, name):
+        for part in name.split("__"):
+            row = getattr(row, part)
+        return row
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists of big tables, where an exact COUNT(*) scans the whole table.
+
+    Unfiltered lists get the fast count of the table (see `gymadmin.counts`). Filtered lists are counted
+    exactly up to GYMADMIN_ADMIN_COUNT_LIMIT rows, past which the pages end.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return counts.count(queryset).value
+        return queryset.order_by()[:getattr(settings, "GYMADMIN_ADMIN_COUNT_LIMIT", 100000)].count()
@@ -0,0 +1,146 @@
+"""
+Password hashing off the request threads.
+
+Hashes are computed by a process pool of GYMADMIN_PASSWORD_WORKERS processes (0 hashes inline), so a
+signup burst queues behind a fixed number of cores instead of taking a CPU from every worker thread.
+Every web process has its own pool, so the pools share GYMADMIN_PASSWORD_WORKERS slots per host: a
+hash runs while holding a lock on one of the slot files in GYMADMIN_PASSWORD_LOCK_DIR, and waits for
+one otherwise; without fcntl (Windows) there are no host slots and each pool only limits its own process.
+At most GYMADMIN_PASSWORD_MAX_PENDING single hashes of a process wait; beyond that
+`hash_password` raises `PasswordPoolBusy`, which the registration views answer with 429.
+`ahash_password` awaits the pool instead of holding a thread, for the async registration view.
+"""
+import asyncio
+import contextlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, make_password
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+_lock = threading.Lock()
+_pool = None
+
+
+def _workers():
+    workers = getattr(settings, "GYMADMIN_PASSWORD_WORKERS", os.cpu_count())
+    return os.cpu_count() if workers is None else workers
+
+
+def _max_pending():
+    return getattr(settings, "GYMADMIN_PASSWORD_MAX_PENDING", 64)
+
+
+def _slots():
+    directory = getattr(settings, "GYMADMIN_PASSWORD_LOCK_DIR", None) or \
+        os.path.join(tempfile.gettempdir(), "gymadmin-passwords")
+    return directory, _workers()
+
+
+@contextlib.contextmanager
+def _host_slot(directory, slots):
+    """Hold one of the host's `slots` hashing slots, waiting for one when all are held by other processes."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    # start at a different slot per process, so waiting processes spread over the slots
+    order = [(os.getpid() + offset) % slots for offset in range(slots)]
+    descriptors = []
+    try:
+        for slot in order:
+            descriptors.append(os.open(os.path.join(directory, f"slot-{slot}"), os.O_CREAT | os.O_RDWR, 0o600))
+            try:
+                fcntl.flock(descriptors[-1], fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                continue
+        else:
+            fcntl.flock(descriptors[0], fcntl.LOCK_EX)
+            descriptors.append(descriptors.pop(0))
+        yield
+    finally:
+        # closing a descriptor releases its lock
+        for descriptor in descriptors:
+            os.close(descriptor)
+
+
+def _get_pool():
+    global _pool
+    config = (_workers(), _max_pending())
+    with _lock:
+        if _pool is None or _pool[0] != config:
+            if _pool is not None:
+                _pool[1].shutdown(wait=False)
+            _pool = (config, ProcessPoolExecutor(max_workers=config[0], initializer=django.setup),
+                     threading.BoundedSemaphore(config[1]))
+        return _pool[1], _pool[2]
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool[1].shutdown()
+            _pool = None
+
+
+def _encode(hasher, password, salt, iterations, slots):
+    with _host_slot(*slots):
+        if iterations is None:
+            return hasher.encode(password, salt)
+        return hasher.encode(password, salt, iterations)
+
+
+def _job(password):
+    # The cost profile is resolved here, so the pool hashes with the settings of the calling process
+    hasher = get_hasher()
+    iterations = hasher.iterations if isinstance(hasher, PBKDF2PasswordHasher) else None
+    return hasher, password, hasher.salt(), iterations, _slots()
+
+
+def _submit(password):
+    pool, pending = _get_pool()
+    if not pending.acquire(blocking=False):
+        raise PasswordPoolBusy
+    try:
+        future = pool.submit(_encode, *_job(password))
+    except BaseException:
+        pending.release()
+        raise
+    future.add_done_callback(lambda _: pending.release())
+    return future
+
+
+def hash_password(password):
+    if password is None or not _workers():
+        return make_password(password)
+    return _submit(password).result()
+
+
+async def ahash_password(password):
+    if password is None or not _workers():
+        return await sync_to_async(make_password)(password)
+    return await asyncio.wrap_future(_submit(password))
+
+
+def hash_passwords(passwords):
+    """Hash many passwords in parallel across the pool, in order; used by bulk imports."""
+    passwords = list(passwords)
+    if not _workers():
+        return [make_password(password) for password in passwords]
+    pool, _ = _get_pool()
+    jobs = [_job(password) for password in passwords]
+    chunksize = max(1, len(jobs) // (4 * _workers()))
+    return list(pool.map(_encode, *zip(*jobs), chunksize=chunksize)) if jobs else []
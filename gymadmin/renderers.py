@@ -0,0 +1,27 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library encoder is used without it
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders the same bytes as DRF's JSONRenderer, with orjson when it is installed.
+
+    Dates, times and anything orjson does not know natively go through DRF's encoder, so their format
+    is unchanged; indented output and payloads orjson rejects (e.g. integers above 64 bits) fall back
+    to the standard renderer.
+    """
+    options = 0 if orjson is None else orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            rendered = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # same escapes as JSONRenderer: the two separators are valid JSON but not valid JavaScript
+        return rendered.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
@@ -0,0 +1,147 @@
+"""
+Monthly revenue per subscription type and member cohort (the month the member joined).
+
+The price of a subscription is spread over the days from its start to its end date, both included, and
+each month gets the share of its days. `MonthlyRevenue` is kept up to date by the subscription
+signals, which subtract the shares of the previous state of a subscription and add those of the new
+one, so a write touches only the months it spans. `refresh_months` recounts a range of months from the
+subscriptions, as `rebuild_revenue` does after bulk loads.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import DateField, F, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+
+from gymadmin.models import MonthlyRevenue, Subscription, User
+
+# columns of a subscription that decide its shares, in the order of `state`
+STATE = ("start_date", "end_date", "price", "type_id")
+
+REPORT_GROUPS = {"month": "month", "type": "type__title", "cohort": "cohort"}
+
+
+def parse_month(value):
+    """The first day of a YYYY-MM month; raises ValueError."""
+    return datetime.date.fromisoformat(f"{value}-01")
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def spread(price, start_date, end_date):
+    """(month, share) for every month the subscription covers; the shares add up to the price exactly."""
+    days = (end_date - start_date).days + 1
+    shares, covered, allocated = [], 0, 0
+    day = start_date
+    while day <= end_date:
+        following = next_month(month_of(day))
+        covered += (min(end_date + datetime.timedelta(days=1), following) - day).days
+        share = price * covered // days - allocated
+        shares.append((month_of(day), share))
+        allocated += share
+        day = following
+    return shares
+
+
+def _cohort(path="date_joined"):
+    return TruncMonth(path, output_field=DateField())
+
+
+def state(subscription_id):
+    """The stored (start_date, end_date, price, type_id, cohort) of a subscription, None if there is none."""
+    return Subscription.objects.filter(pk=subscription_id).values_list(*STATE, _cohort("user__date_joined")).first()
+
+
+def state_of(instance):
+    """The same for a subscription instance, such as one just deleted."""
+    cohort = User.objects.filter(pk=instance.user_id).values_list(_cohort(), flat=True).first()
+    if cohort is None:
+        return None
+    fields = Subscription._meta
+    return (fields.get_field("start_date").to_python(instance.start_date),
+            fields.get_field("end_date").to_python(instance.end_date), int(instance.price), instance.type_id, cohort)
+
+
+def _deltas(states):
+    deltas = {}
+    for sign, subscription in states:
+        if subscription is None:
+            continue
+        start_date, end_date, price, type_id, cohort = subscription
+        for month, share in spread(price, start_date, end_date):
+            revenue, subscriptions = deltas.get((month, type_id, cohort), (0, 0))
+            deltas[month, type_id, cohort] = (revenue + sign * share, subscriptions + sign)
+    return {key: delta for key, delta in deltas.items() if delta != (0, 0)}
+
+
+def subscription_changed(previous, current):
+    """Move the shares of a subscription from its `previous` state to its `current` one (either may be None)."""
+    recount = set()
+    for (month, type_id, cohort), (revenue, subscriptions) in _deltas([(-1, previous), (1, current)]).items():
+        rows = MonthlyRevenue.objects.filter(month=month, type_id=type_id, cohort=cohort)
+        changes = {"revenue": F("revenue") + revenue, "subscriptions": F("subscriptions") + subscriptions}
+        if rows.update(**changes):
+            if subscriptions < 0:
+                rows.filter(subscriptions=0).delete()
+            continue
+        if revenue < 0 or subscriptions < 0:
+            # nothing to subtract from: the month was never counted, so it is recounted instead
+            recount.add(month)
+            continue
+        try:
+            with transaction.atomic():
+                MonthlyRevenue.objects.create(month=month, type_id=type_id, cohort=cohort, revenue=revenue,
+                                              subscriptions=subscriptions)
+        except IntegrityError:
+            # created by a concurrent write in the meantime
+            rows.update(**changes)
+    for month in sorted(recount):
+        refresh_months(month, month)
+
+
+def refresh_months(first_month, last_month):
+    """Recount the months from `first_month` to `last_month` from every subscription overlapping them."""
+    first_month, last_month = month_of(first_month), month_of(last_month)
+    overlapping = Subscription.objects.filter(start_date__lt=next_month(last_month), end_date__gte=first_month)
+    totals = {}
+    rows = overlapping.values_list(*STATE, _cohort("user__date_joined")).order_by()
+    for subscription in rows.iterator(chunk_size=2000):
+        for key, (revenue, subscriptions) in _deltas([(1, subscription)]).items():
+            if first_month <= key[0] <= last_month:
+                total, count = totals.get(key, (0, 0))
+                totals[key] = (total + revenue, count + subscriptions)
+    with transaction.atomic():
+        MonthlyRevenue.objects.filter(month__range=[first_month, last_month]).delete()
+        MonthlyRevenue.objects.bulk_create([
+            MonthlyRevenue(month=month, type_id=type_id, cohort=cohort, revenue=revenue, subscriptions=subscriptions)
+            for (month, type_id, cohort), (revenue, subscriptions) in totals.items()
+        ], batch_size=getattr(settings, "GYMADMIN_BULK_BATCH_SIZE", 1000))
+    return len(totals)
+
+
+def covered_months():
+    """(first, last) month any subscription covers, None when there are no subscriptions."""
+    span = Subscription.objects.aggregate(first=Min("start_date"), last=Max("end_date"))
+    if span["first"] is None:
+        return None
+    return month_of(span["first"]), month_of(span["last"])
+
+
+def report(first_month, last_month, group_by):
+    """Revenue and subscriptions of the months in the range, grouped by some of month, type and cohort."""
+    columns = [REPORT_GROUPS[name] for name in group_by]
+    rows = (MonthlyRevenue.objects.filter(month__range=[month_of(first_month), month_of(last_month)])
+            .values(*columns).annotate(total=Sum("revenue"), count=Sum("subscriptions")).order_by(*columns))
+    return [
+        {**{name: row[column].strftime("%Y-%m") if name != "type" else row[column]
+            for name, column in zip(group_by, columns)},
+         "revenue": row["total"], "subscriptions": row["count"]}
+        for row in rows
+    ]
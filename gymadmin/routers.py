@@ -0,0 +1,74 @@
+"""
+Primary/replica routing.
+
+Reads go to a replica only while a safe (GET/HEAD/OPTIONS) request is being served, the client has
+not written within GYMADMIN_REPLICA_STICKY_SECONDS and no transaction is open on the primary.
+Everything else, including management commands and shell sessions, uses the primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica_reads_allowed = ContextVar("gymadmin_replica_reads_allowed", default=False)
+_wrote = ContextVar("gymadmin_wrote", default=False)
+
+
+def allow_replica_reads(allowed):
+    """Set for the current request; returns tokens for `reset`."""
+    return _replica_reads_allowed.set(allowed), _wrote.set(False)
+
+
+def reset(tokens):
+    replica_token, wrote_token = tokens
+    _replica_reads_allowed.reset(replica_token)
+    _wrote.reset(wrote_token)
+
+
+def wrote():
+    return _wrote.get()
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def sticky_seconds():
+    """How long a replica may lag behind a write; reads of what was written that recently go to the primary."""
+    return getattr(settings, "GYMADMIN_REPLICA_STICKY_SECONDS", 5)
+
+
+@contextmanager
+def primary_reads():
+    token = _replica_reads_allowed.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads_allowed.reset(token)
+
+
+class ReplicaRouter:
+    # apps that write on every request (request profiling) must not pin the client to the primary
+    unpinned_apps = ("silk", "sessions")
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or not _replica_reads_allowed.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in self.unpinned_apps:
+            # read-after-write: the rest of this request reads from the primary
+            _replica_reads_allowed.set(False)
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema through replication
+        return db not in replicas()
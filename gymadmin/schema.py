@@ -0,0 +1,82 @@
+"""
+The OpenAPI document of the API, generated once instead of on every request.
+
+`generate_schema` writes it at build/deploy time to GYMADMIN_SCHEMA_DIR, as swagger.json and
+swagger.yaml. `document()` reads the artifact the first time a process serves it, or generates it
+there and then when there is none, and keeps it in memory with its ETag.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+INFO = openapi.Info(
+    title="GymManagement API",
+    default_version='v1',
+    description="Test description",
+)
+
+schema_view = get_schema_view(INFO, public=True, permission_classes=(permissions.AllowAny,))
+
+# suffix of the URL and the file: codec, content type
+FORMATS = {
+    ".json": (OpenAPICodecJson, "application/json"),
+    ".yaml": (OpenAPICodecYaml, "application/yaml"),
+}
+
+_lock = threading.Lock()
+_documents = {}
+
+
+def directory():
+    return Path(getattr(settings, "GYMADMIN_SCHEMA_DIR", settings.BASE_DIR / "build" / "schema"))
+
+
+def artifact(format):
+    return directory() / f"swagger{format}"
+
+
+def generate(url=None):
+    """The encoded document per format; `url` sets the host and scheme, otherwise clients use the serving host."""
+    schema = OpenAPISchemaGenerator(INFO, url=url).get_schema(request=None, public=True)
+    return {format: codec([]).encode(schema) for format, (codec, _) in FORMATS.items()}
+
+
+def write(url=None):
+    """Generate the document and replace the artifacts with it; returns their paths."""
+    directory().mkdir(parents=True, exist_ok=True)
+    paths = []
+    for format, content in generate(url).items():
+        path = artifact(format)
+        # a process reading the artifact meanwhile sees the old or the new one, never half of it
+        partial = path.with_name(f".{path.name}.{os.getpid()}")
+        partial.write_bytes(content)
+        os.replace(partial, path)
+        paths.append(path)
+    return paths
+
+
+def document(format):
+    """(content, content type, ETag) of the document in `format`, loaded once per process."""
+    with _lock:
+        if not _documents:
+            try:
+                contents = {format: artifact(format).read_bytes() for format in FORMATS}
+            except FileNotFoundError:
+                contents = generate()
+            for name, content in contents.items():
+                _documents[name] = (content, FORMATS[name][1], f'"{hashlib.sha256(content).hexdigest()[:32]}"')
+        return _documents[format]
+
+
+def forget():
+    """Drop the loaded document, so the next request reads the artifact again."""
+    with _lock:
+        _documents.clear()
@@ -0,0 +1,238 @@
+"""
+In-memory member search over first name, last name and email.
+
+Every lowercased name word and the email are kept in a sorted token list for prefix lookups and in
+trigram posting lists for fuzzy matching. They are built from the database on first use into a snapshot
+that is never modified; the User signals record each member written since then (once the writing
+transaction commits) in a small overlay that searches check first. A background thread rebuilds the
+snapshot after GYMADMIN_SEARCH_RECONCILE_SECONDS, to pick up writes of other processes, or once the
+overlay grows large, while searches go on with the previous one.
+
+Each process holds its own snapshot: the tokens of every member, the sorted tokens with a parallel array of
+member ids, and the trigram postings as arrays of member ids, roughly 700 bytes per member (some 700 MB for
+a million members). Building it reads the whole member table, several seconds at that size, so the WSGI
+and ASGI entry points build it with `warm()` when the server starts (before the workers fork, with
+gunicorn --preload) rather than in the first search of each process.
+
+Ranking: members whose words all prefix-match one of their tokens come first (exact tokens before
+longer ones), then members whose every word has a trigram similarity (Jaccard, as pg_trgm) of at least
+GYMADMIN_SEARCH_SIMILARITY to one of their tokens, by mean similarity.
+"""
+import bisect
+import heapq
+import math
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from gymadmin.models import User
+
+
+def tokenize(first_name, last_name, email):
+    return tuple(dict.fromkeys(
+        [*(first_name or "").lower().split(), *(last_name or "").lower().split(), *(email or "").lower().split()]
+    ))
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(left, right):
+    shared = len(left & right)
+    return shared / (len(left) + len(right) - shared) if shared else 0.0
+
+
+class _Snapshot:
+    """The index of a full read of the members; never changed once built, so searches read it without a lock."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        # arrays of ids rather than tuples and sets of ints, which take several times the memory
+        prefixes = sorted((token, pk) for pk, member_tokens in tokens.items() for token in member_tokens)
+        self.prefix_tokens = [token for token, _ in prefixes]
+        self.prefix_pks = array("q", (pk for _, pk in prefixes))
+        del prefixes
+        postings = defaultdict(list)
+        for pk, member_tokens in tokens.items():
+            for gram in set().union(*map(trigrams, member_tokens)):
+                postings[gram].append(pk)
+        self.postings = {gram: array("q", pks) for gram, pks in postings.items()}
+        self.built_at = time.monotonic()
+
+    def _stored_prefixes(self, pivot, changed):
+        for position in range(bisect.bisect_left(self.prefix_tokens, pivot), len(self.prefix_tokens)):
+            token, pk = self.prefix_tokens[position], self.prefix_pks[position]
+            if pk not in changed:
+                yield token, pk
+
+    def prefix_matches(self, changed, words, limit):
+        # Scan the range of the longest word and check the other words against the member's tokens
+        pivot = max(words, key=len)
+        recent = sorted((token, pk) for pk, member_tokens in changed.items() for token in member_tokens or ()
+                        if token.startswith(pivot))
+        found = []
+        for token, pk in heapq.merge(self._stored_prefixes(pivot, changed), recent):
+            if len(found) == limit or not token.startswith(pivot):
+                break
+            member_tokens = changed.get(pk) or self.tokens[pk]
+            if pk not in found and all(any(t.startswith(word) for t in member_tokens) for word in words):
+                found.append(pk)
+        return found
+
+    def _similar_to_word(self, grams, threshold):
+        # A token reaching the threshold shares at least `needed` trigrams with the word, so the member is in
+        # one of the len(grams) - needed + 1 shortest posting lists; shared / len(grams) bounds the similarity
+        needed = max(1, math.ceil(threshold * len(grams)))
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set().union(*postings[:len(grams) - needed + 1])
+        shared = Counter()
+        for posting in postings:
+            shared.update(candidates.intersection(posting))
+        return {pk: count / len(grams) for pk, count in shared.items() if count >= needed}
+
+    @staticmethod
+    def _scores(word_grams, member_tokens):
+        member_grams = [trigrams(token) for token in member_tokens]
+        return [max(similarity(grams, other) for other in member_grams) for grams in word_grams]
+
+    def fuzzy_matches(self, changed, words, limit, exclude):
+        threshold = getattr(settings, "GYMADMIN_SEARCH_SIMILARITY", 0.3)
+        word_grams = [trigrams(word) for word in words]
+        bounds = None
+        for grams in word_grams:
+            word_bounds = self._similar_to_word(grams, threshold)
+            bounds = word_bounds if bounds is None else {
+                pk: bound + word_bounds[pk] for pk, bound in bounds.items() if pk in word_bounds
+            }
+        candidates = [(bound, pk) for pk, bound in bounds.items() if pk not in exclude and pk not in changed]
+        # members changed since the build have no postings; they are few, so their score is their bound
+        candidates += [(sum(self._scores(word_grams, member_tokens)), pk)
+                       for pk, member_tokens in changed.items() if member_tokens and pk not in exclude]
+        # Score members in order of their bound until it drops below the last score that still makes the cut
+        best = []
+        for bound, pk in sorted(candidates, reverse=True):
+            if len(best) == limit and bound / len(words) < best[0][0]:
+                break
+            scores = self._scores(word_grams, changed.get(pk) or self.tokens[pk])
+            if min(scores) >= threshold:
+                heapq.heappush(best, (sum(scores) / len(words), -pk))
+                if len(best) > limit:
+                    heapq.heappop(best)
+        return [-pk for _, pk in sorted(best, reverse=True)]
+
+
+class MemberSearchIndex:
+    # changes kept on top of the snapshot before it is rebuilt, however recent it is
+    max_changes = 1000
+
+    def __init__(self):
+        # guards the references below; searches only take them, and score outside of it
+        self._lock = threading.Lock()
+        # one build at a time
+        self._build_lock = threading.Lock()
+        self._snapshot = None
+        # pk -> (sequence, tokens or None when deleted), replaced rather than changed in place
+        self._changes = {}
+        self._sequence = 0
+        self._epoch = 0
+
+    def _reconcile_interval(self):
+        return getattr(settings, "GYMADMIN_SEARCH_RECONCILE_SECONDS", 300)
+
+    def _is_stale(self, snapshot, changes):
+        return time.monotonic() - snapshot.built_at > self._reconcile_interval() or len(changes) > self.max_changes
+
+    def reconcile(self):
+        """Rebuild the snapshot from the database; changes recorded while reading stay on top of it."""
+        with self._build_lock:
+            self._reconcile()
+
+    def _reconcile(self):
+        with self._lock:
+            sequence, epoch = self._sequence, self._epoch
+        snapshot = _Snapshot({
+            pk: tokenize(first_name, last_name, email)
+            for pk, first_name, last_name, email in User.objects.values_list("id", "first_name", "last_name", "email")
+        })
+        with self._lock:
+            # marked stale while reading: the read may predate the writes that made it stale
+            if epoch == self._epoch:
+                self._snapshot = snapshot
+                self._changes = {pk: change for pk, change in self._changes.items() if change[0] > sequence}
+
+    def _reconcile_in_background(self):
+        if not self._build_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._reconcile()
+            finally:
+                self._build_lock.release()
+                connections.close_all()
+
+        threading.Thread(target=run, name="member-search-reconcile", daemon=True).start()
+
+    def mark_stale(self):
+        """Drop the index after writes that sent no signals; the next search rebuilds it before answering."""
+        with self._lock:
+            self._snapshot, self._changes = None, {}
+            self._epoch += 1
+
+    def _record(self, pk, member_tokens):
+        with self._lock:
+            self._sequence += 1
+            self._changes = {**self._changes, pk: (self._sequence, member_tokens)}
+
+    def member_saved(self, user):
+        self._record(user.pk, tokenize(user.first_name, user.last_name, user.email))
+
+    def member_deleted(self, pk):
+        self._record(pk, None)
+
+    def _view(self):
+        """The snapshot and the changes on top of it; built first if there is none, refreshed in the background."""
+        while True:
+            with self._lock:
+                snapshot, changes = self._snapshot, self._changes
+            if snapshot is not None:
+                break
+            with self._build_lock:
+                if self._snapshot is None:
+                    self._reconcile()
+        if self._is_stale(snapshot, changes):
+            self._reconcile_in_background()
+        return snapshot, {pk: member_tokens for pk, (_, member_tokens) in changes.items()}
+
+    def search(self, query, limit):
+        words = query.lower().split()
+        if not words:
+            return []
+        snapshot, changed = self._view()
+        found = snapshot.prefix_matches(changed, words, limit)
+        if len(found) < limit:
+            found += snapshot.fuzzy_matches(changed, words, limit - len(found), set(found))
+        return found
+
+
+index = MemberSearchIndex()
+
+
+def warm():
+    """Build the index while the server starts, see GYMADMIN_SEARCH_WARM_ON_START."""
+    if not getattr(settings, "GYMADMIN_SEARCH_WARM_ON_START", True):
+        return
+    try:
+        index.reconcile()
+    except DatabaseError:
+        # not migrated or not reachable yet: the first search builds it then
+        pass
+    finally:
+        # no connection of the starting process is carried into the forked workers
+        connections.close_all()
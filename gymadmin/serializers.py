@@ -1,18 +1,69 @@
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
 from rest_framework import serializers
 
+from gymadmin import archive, cache, counts, metrics, passwords, statistics
 from gymadmin.models import User, Subscription, Visit
+from gymadmin.occupancy import tracker
+from gymadmin.subscription_types import registry
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with metrics.measure_serializer():
+            return super().data
+
+
+class TimedSerializer(serializers.Serializer):
+    """Adds the time spent producing `.data` to the request metrics."""
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with metrics.measure_serializer():
+            return super().data
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for lists: builds the payload of the matching Serializer from `.values()` rows.
+
+    `fields` lists (output key, column, converter) in the order of the Serializer's fields; the converter
+    is applied to non-null values only, as DRF does, and None copies the value unchanged.
+    """
+    fields = ()
+
+    @classmethod
+    def values(cls, queryset, *extra):
+        """`queryset.values()` with the serialized columns and `extra` ones, e.g. a pagination key."""
+        return queryset.values(*dict.fromkeys([*(column for _, column, _ in cls.fields), *extra]))
+
+    @classmethod
+    def serialize(cls, rows):
+        fields = cls.fields
+        with metrics.measure_serializer():
+            return [{name: value if (value := row[column]) is None or convert is None else convert(value)
+                     for name, column, convert in fields} for row in rows]
 
 
-class UserSerializer(serializers.Serializer):
+class UserSerializer(TimedSerializer):
     id = serializers.IntegerField(read_only=True)
     first_name = serializers.CharField()
     last_name = serializers.CharField()
     email = serializers.CharField()
+    birth_date = serializers.DateField(write_only=True)
     password = serializers.CharField(write_only=True)
 
     def create(self, validated_data):
-        user = User(email=validated_data['email'], first_name=validated_data["first_name"], last_name=validated_data["last_name"])
-        user.set_password(validated_data["password"])
+        user = User(email=validated_data['email'], first_name=validated_data["first_name"], last_name=validated_data["last_name"],
+                    birth_date=validated_data["birth_date"])
+        # the async registration view hashes first, awaiting the pool, and passes the hash to save()
+        user.password = validated_data.get("password_hash") or passwords.hash_password(validated_data["password"])
         user.save()
         return user
 
@@ -24,13 +75,35 @@ class UserSerializer(serializers.Serializer):
         instance.save()
         return instance
 
-class SubscriptionSerializer(serializers.Serializer):
+class SubscriptionTypeField(serializers.Field):
+    """A type given and rendered by its title, resolved through the registry: the model holds `type_id`."""
+    default_error_messages = {
+        "does_not_exist": "Object with title={value} does not exist.",
+        "invalid": "Invalid value.",
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail("invalid")
+        ids = registry.ids(data)
+        if not ids:
+            self.fail("does_not_exist", value=data)
+        if len(ids) > 1:
+            self.fail("invalid")
+        return ids[0]
+
+    def to_representation(self, value):
+        return registry.title(value)
+
+
+class SubscriptionSerializer(TimedSerializer):
     id = serializers.IntegerField(read_only=True)
     user_id = serializers.IntegerField()
     start_date = serializers.DateField()
     end_date =serializers.DateField()
     price=serializers.IntegerField()
-    type=serializers.CharField()
+    type = SubscriptionTypeField(source="type_id")
+    status = serializers.CharField(read_only=True)
 
     def validate(self, data):
         if data["start_date"] > data["end_date"]:
@@ -45,16 +118,18 @@ class SubscriptionSerializer(serializers.Serializer):
         if "start_date" in validated_data:
             instance.start_date = validated_data['start_date']
         if "end_date" in validated_data:
-            instance.first_name = validated_data['end_date']
+            instance.end_date = validated_data['end_date']
         if "price" in validated_data:
-            instance.first_name = validated_data['price']
-        if "type" in validated_data:
-            instance.first_name = validated_data['type']
+            instance.price = validated_data['price']
+        if "type_id" in validated_data:
+            instance.type_id = validated_data['type_id']
 
         instance.save()
         return instance
 
-class VisitSerializer(serializers.Serializer):
+class VisitSerializer(TimedSerializer):
+    duplicate_message = "A visit of this subscription with this date and enter_time already exists."
+
     subscription_id = serializers.PrimaryKeyRelatedField(queryset=Subscription.objects.all())
     date = serializers.DateField()
     enter_time = serializers.TimeField()
@@ -67,10 +142,26 @@ class VisitSerializer(serializers.Serializer):
         if exit_time and enter_time >= exit_time:
             raise serializers.ValidationError("Enter time must be before exit time")
 
+        # the related field resolves the subscription, the model is given its id
+        if isinstance(data.get('subscription_id'), Subscription):
+            data['subscription_id'] = data['subscription_id'].pk
         return data
 
+    def _save(self, visit):
+        # the natural key is checked by its unique constraint, so two concurrent requests cannot both pass
+        try:
+            with transaction.atomic():
+                visit.save()
+        except IntegrityError:
+            raise serializers.ValidationError({"non_field_errors": [self.duplicate_message]})
+        return visit
+
     def create(self, validated_data):
-        return Visit.objects.create(**validated_data)
+        # the constraint does not reach the archive, which keeps the natural keys of the visits moved there
+        key = (validated_data["subscription_id"], validated_data["date"], validated_data["enter_time"])
+        if archive.archived_keys({key}):
+            raise serializers.ValidationError({"non_field_errors": [self.duplicate_message]})
+        return self._save(Visit(**validated_data))
 
     def update(self, instance, validated_data):
         if 'subscription_id' in validated_data:
@@ -82,5 +173,122 @@ class VisitSerializer(serializers.Serializer):
         if 'exit_time' in validated_data:
             instance.exit_time = validated_data['exit_time']
 
-        instance.save()
-        return instance
+        return self._save(instance)
+
+
+class UserValuesSerializer(ValuesSerializer):
+    fields = (("id", "id", None), ("first_name", "first_name", None), ("last_name", "last_name", None),
+              ("email", "email", None))
+
+
+class UserWithStatsValuesSerializer(UserValuesSerializer):
+    fields = UserValuesSerializer.fields + (
+        ("visits", "stats__visits", None), ("last_visit_date", "stats__last_visit_date", datetime.date.isoformat),
+        ("current_subscription_id", "stats__current_subscription_id", None),
+    )
+
+
+class SubscriptionValuesSerializer(ValuesSerializer):
+    fields = (("id", "id", None), ("user_id", "user_id", None), ("start_date", "start_date", datetime.date.isoformat),
+              ("end_date", "end_date", datetime.date.isoformat), ("price", "price", None), ("type", "type_id", registry.title),
+              ("status", "status", None))
+
+
+class VisitValuesSerializer(ValuesSerializer):
+    fields = (("subscription_id", "subscription_id", None), ("date", "date", datetime.date.isoformat),
+              ("enter_time", "enter_time", datetime.time.isoformat), ("exit_time", "exit_time", datetime.time.isoformat))
+
+
+class CheckInSerializer(serializers.Serializer):
+    subscription_id = serializers.IntegerField(required=False)
+    user_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if ("subscription_id" in data) == ("user_id" in data):
+            raise serializers.ValidationError("Pass either subscription_id or user_id.")
+        return data
+
+
+class VisitBulkItemSerializer(VisitSerializer):
+    subscription_id = serializers.IntegerField()
+
+
+class VisitBulkSerializer:
+    """
+    Validates a batch of visits item by item and writes the valid ones in one transaction.
+
+    Subscriptions of the whole batch are resolved with a single IN query. Rows that repeat the
+    natural key (subscription, date, enter_time) are skipped, or have their exit_time updated with upsert;
+    visits already moved to the archive are skipped either way. `save()` returns the number of visits stored and leaves the number skipped in `duplicates`.
+    """
+    missing_subscription_message = 'Invalid pk "{pk}" - object does not exist.'
+
+    def __init__(self, data, upsert=False):
+        self.initial_data = data
+        self.upsert = upsert
+
+    def is_valid(self):
+        self.errors = []
+        self.validated_data = []
+        for index, item in enumerate(self.initial_data):
+            serializer = VisitBulkItemSerializer(data=item)
+            if serializer.is_valid():
+                self.validated_data.append((index, serializer.validated_data))
+            else:
+                self.errors.append({"index": index, "errors": serializer.errors})
+
+        subscription_ids = {data["subscription_id"] for _, data in self.validated_data}
+        # the owners are kept for the member stats refreshed by save()
+        self.owners = dict(Subscription.objects.filter(id__in=subscription_ids).values_list("id", "user_id"))
+        valid = []
+        for index, data in self.validated_data:
+            if data["subscription_id"] in self.owners:
+                valid.append((index, data))
+            else:
+                message = self.missing_subscription_message.format(pk=data["subscription_id"])
+                self.errors.append({"index": index, "errors": {"subscription_id": [message]}})
+        self.validated_data = valid
+        self.errors.sort(key=lambda error: error["index"])
+        return not self.errors
+
+    def save(self):
+        visits = {}
+        for _, data in self.validated_data:
+            visits[(data["subscription_id"], data["date"], data["enter_time"])] = Visit(**data)
+
+        options = {"ignore_conflicts": True}
+        if self.upsert:
+            options = {"update_conflicts": True, "update_fields": ["exit_time", "updated_at"]}
+            if connection.features.supports_update_conflicts_with_target:
+                options["unique_fields"] = ["subscription", "date", "enter_time"]
+
+        batch_size = getattr(settings, "GYMADMIN_BULK_BATCH_SIZE", 1000)
+        with transaction.atomic():
+            for key in archive.archived_keys(visits.keys()):
+                del visits[key]
+            existing = 0 if self.upsert else len({row[:3] for row in self._stored(visits)} & visits.keys())
+            Visit.objects.bulk_create(list(visits.values()), batch_size=batch_size, **options)
+            # the rows updated by an upsert have detail entries of their own, which the list version does not cover
+            pks = [row[3] for row in self._stored(visits, "id") if row[:3] in visits] if self.upsert else []
+            # bulk_create sends no post_save, so the daily rollup is refreshed here
+            statistics.refresh_visit_days({date for _, date, _ in visits})
+            statistics.refresh_user_stats({self.owners[subscription_id] for subscription_id, _, _ in visits})
+            # the ids of the stored rows are unknown after an ignore/update on conflict
+            transaction.on_commit(tracker.mark_stale)
+            transaction.on_commit(lambda: counts.forget(Visit))
+            transaction.on_commit(lambda: cache.invalidate_many(Visit, pks))
+        accepted = len(visits) - existing
+        self.duplicates = len(self.validated_data) - accepted
+        return accepted
+
+    @staticmethod
+    def _stored(visits, *fields):
+        """
+        The stored rows (subscription_id, date, enter_time, *fields) read off the natural key index; a superset
+        of the batch's natural keys, so callers match the first three columns against them.
+        """
+        if not visits:
+            return []
+        subscription_ids, dates, times = (set(column) for column in zip(*visits))
+        return Visit.objects.filter(subscription_id__in=subscription_ids, date__in=dates, enter_time__in=times) \
+            .values_list("subscription_id", "date", "enter_time", *fields)
@@ -0,0 +1,152 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from gymadmin import archive, cache, counts, revenue, statistics
+from gymadmin.occupancy import tracker
+from gymadmin.search import index
+from gymadmin.subscription_types import registry
+from gymadmin.models import Subscription, SubscriptionType, User, UserStats, Visit, VisitArchive
+
+
+@receiver(pre_save, sender=Visit)
+def remember_visit_date(sender, instance, **kwargs):
+    instance._previous_visit = instance._previous_subscription_id = None
+    if not instance._state.adding and instance.pk:
+        previous = Visit.objects.filter(pk=instance.pk).values_list(
+            "date", "enter_time", "exit_time", "subscription_id").first()
+        if previous is not None:
+            *instance._previous_visit, instance._previous_subscription_id = previous
+
+
+@receiver(post_save, sender=Visit)
+def visit_saved(sender, instance, created, **kwargs):
+    statistics.count_visit_change(getattr(instance, "_previous_visit", None),
+                                  (instance.date, instance.enter_time, instance.exit_time))
+    if created:
+        statistics.count_visit(instance.subscription_id, instance.date)
+    else:
+        statistics.refresh_subscription_users([instance.subscription_id,
+                                               getattr(instance, "_previous_subscription_id", None)])
+    transaction.on_commit(lambda: tracker.visit_saved(instance))
+
+
+@receiver(post_delete, sender=Visit)
+def visit_deleted(sender, instance, **kwargs):
+    statistics.count_visit_change(before=(instance.date, instance.enter_time, instance.exit_time))
+    statistics.refresh_subscription_users([instance.subscription_id], existing_only=True)
+    pk = instance.pk
+    transaction.on_commit(lambda: tracker.visit_deleted(pk))
+
+
+@receiver(post_delete, sender=VisitArchive)
+def archived_visit_deleted(sender, instance, **kwargs):
+    statistics.count_visit_change(before=(instance.date, instance.enter_time, instance.exit_time))
+    statistics.refresh_subscription_users([instance.subscription_id], existing_only=True)
+    pk = instance.pk
+    # invalidated once the rows are gone for other connections, or a concurrent read caches them again
+    transaction.on_commit(lambda: cache.invalidate(Visit, pk))
+    transaction.on_commit(archive.forget_newest_date)
+
+
+@receiver(pre_save, sender=Subscription)
+def remember_subscription_start(sender, instance, **kwargs):
+    instance._previous_start_date = instance._previous_user_id = None
+    if not instance._state.adding and instance.pk:
+        instance._previous_start_date, instance._previous_user_id = (
+            Subscription.objects.filter(pk=instance.pk).values_list("start_date", "user_id").first() or (None, None)
+        )
+
+
+@receiver(pre_save, sender=Subscription)
+def remember_subscription_revenue(sender, instance, **kwargs):
+    instance._previous_revenue = None
+    if not instance._state.adding and instance.pk:
+        instance._previous_revenue = revenue.state(instance.pk)
+
+
+@receiver(pre_save, sender=Subscription)
+def derive_subscription_status(sender, instance, **kwargs):
+    start_date = sender._meta.get_field("start_date").to_python(instance.start_date)
+    end_date = sender._meta.get_field("end_date").to_python(instance.end_date)
+    instance.status = sender.status_on(timezone.localdate(), start_date, end_date)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, **kwargs):
+    statistics.refresh_subscription_days([instance.start_date, getattr(instance, "_previous_start_date", None)])
+    statistics.refresh_user_stats([instance.user_id, getattr(instance, "_previous_user_id", None)])
+    revenue.subscription_changed(getattr(instance, "_previous_revenue", None), revenue.state(instance.pk))
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    statistics.refresh_subscription_days([instance.start_date])
+    statistics.refresh_user_stats([instance.user_id], existing_only=True)
+    revenue.subscription_changed(revenue.state_of(instance), None)
+
+
+@receiver(post_save, sender=SubscriptionType)
+def subscription_type_saved(sender, instance, created, **kwargs):
+    # subscriptions are rendered with the title of their type
+    if not created:
+        Subscription.objects.filter(type=instance).update(updated_at=timezone.now())
+    transaction.on_commit(registry.reload)
+
+
+@receiver(post_delete, sender=SubscriptionType)
+def subscription_type_deleted(sender, instance, **kwargs):
+    transaction.on_commit(registry.reload)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        # a new member has nothing to count yet
+        UserStats.objects.bulk_create([UserStats(user_id=instance.pk)], ignore_conflicts=True)
+    transaction.on_commit(lambda: index.member_saved(instance))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: index.member_deleted(pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_save, sender=SubscriptionType)
+@receiver(post_delete, sender=SubscriptionType)
+@receiver(post_save, sender=Visit)
+@receiver(post_delete, sender=Visit)
+def invalidate_cache(sender, instance, **kwargs):
+    # after the commit: a read between the write and the commit would otherwise cache the old row again
+    pk = instance.pk
+    transaction.on_commit(lambda: cache.invalidate(sender, pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Subscription)
+@receiver(post_save, sender=Visit)
+def count_created(sender, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: counts.adjust(sender, 1))
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=Visit)
+def count_deleted(sender, **kwargs):
+    transaction.on_commit(lambda: counts.adjust(sender, -1))
+
+
+@receiver(post_migrate)
+def clear_cache(sender, **kwargs):
+    # flush and migrate rewrite tables without model signals
+    cache.clear()
+    tracker.mark_stale()
+    index.mark_stale()
+    registry.mark_stale()
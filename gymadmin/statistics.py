@@ -0,0 +1,251 @@
+"""
+Daily and hourly rollups behind the statistics endpoints.
+
+Each refresh recounts whole days from the indexed `date`/`start_date` columns (of both Visit and
+VisitArchive for visits) and upserts the result, so it is safe to call repeatedly for the same day,
+from signals as well as from `rebuild_statistics`. A single visit written by a signal handler or at the
+turnstile only moves the counters of its hour and day, with `count_visit_change`. The per-member
+`UserStats` rows are recounted the same way, per member, and rebuilt by `rebuild_user_stats`.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, Count, DateField, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, ExtractMinute, ExtractSecond, TruncWeek
+
+from django.utils import timezone
+
+from gymadmin import cache
+from gymadmin.models import DailySubscriptionStatistics, DailyVisitStatistics, HourlyVisitStatistics, Subscription, \
+    User, UserStats, Visit, VisitArchive
+
+
+def _as_dates(field, values):
+    return {field.to_python(value) for value in values if value is not None}
+
+
+def _upsert(model, rows, unique_fields, update_fields):
+    options = {"update_conflicts": True, "update_fields": update_fields}
+    if connection.features.supports_update_conflicts_with_target:
+        options["unique_fields"] = unique_fields
+    model.objects.bulk_create(rows, **options)
+
+
+def _seconds(field):
+    return ExtractHour(field) * 3600 + ExtractMinute(field) * 60 + ExtractSecond(field)
+
+
+def _hourly_counts(model, dates):
+    # visits leaving before they entered (past midnight) count, but have no duration
+    finished = Q(exit_time__gte=F("enter_time"))
+    return (
+        model.objects.filter(date__in=dates).values("date", hour=ExtractHour("enter_time"))
+        .annotate(visits=Count("id"), finished_visits=Count("id", filter=finished),
+                  duration_seconds=Sum(_seconds("exit_time") - _seconds("enter_time"), filter=finished)).order_by()
+    )
+
+
+def refresh_visit_days(dates):
+    dates = _as_dates(Visit._meta.get_field("date"), dates)
+    if not dates:
+        return
+    totals = {}
+    for model in (Visit, VisitArchive):
+        for row in _hourly_counts(model, dates):
+            visits, finished_visits, duration_seconds = totals.get((row["date"], row["hour"]), (0, 0, 0))
+            totals[row["date"], row["hour"]] = (visits + row["visits"], finished_visits + row["finished_visits"],
+                                                duration_seconds + (row["duration_seconds"] or 0))
+    hours = [
+        HourlyVisitStatistics(date=date, hour=hour, visits=visits, finished_visits=finished_visits,
+                              duration_seconds=duration_seconds)
+        for (date, hour), (visits, finished_visits, duration_seconds) in totals.items()
+    ]
+    counts = {}
+    for row in hours:
+        counts[row.date] = counts.get(row.date, 0) + row.visits
+    with transaction.atomic():
+        DailyVisitStatistics.objects.filter(date__in=dates - counts.keys()).delete()
+        fresh = {(row.date, row.hour) for row in hours}
+        stale = [pk for pk, date, hour in HourlyVisitStatistics.objects.filter(date__in=dates)
+                 .values_list("id", "date", "hour") if (date, hour) not in fresh]
+        HourlyVisitStatistics.objects.filter(id__in=stale).delete()
+        if counts:
+            _upsert(DailyVisitStatistics, [DailyVisitStatistics(date=date, visits=count) for date, count in counts.items()],
+                    unique_fields=["date"], update_fields=["visits"])
+            _upsert(HourlyVisitStatistics, hours, unique_fields=["date", "hour"],
+                    update_fields=["visits", "finished_visits", "duration_seconds"])
+
+
+def _visit_deltas(visit, sign):
+    """((date, hour), (visits, finished visits, duration seconds)) of a (date, enter_time, exit_time) visit."""
+    date, enter_time, exit_time = (Visit._meta.get_field(name).to_python(value)
+                                   for name, value in zip(("date", "enter_time", "exit_time"), visit))
+    # as in _hourly_counts: visits leaving before they entered count, but have no duration
+    if exit_time is None or exit_time < enter_time:
+        return (date, enter_time.hour), (sign, 0, 0)
+    seconds = [moment.hour * 3600 + moment.minute * 60 + moment.second for moment in (enter_time, exit_time)]
+    return (date, enter_time.hour), (sign, sign, sign * (seconds[1] - seconds[0]))
+
+
+def count_visit_change(before=None, after=None):
+    """
+    Move one visit from `before` to `after` in the daily and hourly rollups with F() updates; either is a
+    (date, enter_time, exit_time) tuple, or None for a visit being created or deleted. Days whose rows do not
+    exist yet, or would be emptied, are recounted by `refresh_visit_days` instead.
+    """
+    hours = {}
+    for visit, sign in ((before, -1), (after, 1)):
+        if visit is not None:
+            key, deltas = _visit_deltas(visit, sign)
+            hours[key] = tuple(map(sum, zip(hours.get(key, (0, 0, 0)), deltas)))
+    days = {}
+    for (date, _), (visits, _, _) in hours.items():
+        days[date] = days.get(date, 0) + visits
+
+    recount = set()
+    with transaction.atomic():
+        for (date, hour), (visits, finished_visits, duration_seconds) in hours.items():
+            if any((visits, finished_visits, duration_seconds)) and not HourlyVisitStatistics.objects.filter(
+                    date=date, hour=hour, visits__gt=-visits).update(
+                    visits=F("visits") + visits, finished_visits=F("finished_visits") + finished_visits,
+                    duration_seconds=F("duration_seconds") + duration_seconds):
+                recount.add(date)
+        for date, visits in days.items():
+            if visits and date not in recount and not DailyVisitStatistics.objects.filter(
+                    date=date, visits__gt=-visits).update(visits=F("visits") + visits):
+                recount.add(date)
+        refresh_visit_days(recount)
+
+
+def refresh_subscription_days(dates):
+    dates = _as_dates(Subscription._meta.get_field("start_date"), dates)
+    if not dates:
+        return
+    rows = [
+        DailySubscriptionStatistics(date=row["start_date"], type_id=row["type_id"],
+                                    subscriptions=row["subscriptions"], revenue=row["revenue"] or 0)
+        for row in Subscription.objects.filter(start_date__in=dates).values("start_date", "type_id")
+        .annotate(subscriptions=Count("id"), revenue=Sum("price")).order_by()
+    ]
+    with transaction.atomic():
+        fresh = {(row.date, row.type_id) for row in rows}
+        stale = [pk for pk, date, type_id in DailySubscriptionStatistics.objects.filter(date__in=dates)
+                 .values_list("id", "date", "type_id") if (date, type_id) not in fresh]
+        DailySubscriptionStatistics.objects.filter(id__in=stale).delete()
+        if rows:
+            _upsert(DailySubscriptionStatistics, rows,
+                    unique_fields=["date", "type"], update_fields=["subscriptions", "revenue"])
+
+
+def refresh_user_stats(user_ids, today=None, existing_only=False):
+    """
+    Recount the visits, last visit and current subscription of these members and upsert their rows.
+
+    With `existing_only` members without a row are left alone: delete handlers pass it, since a cascade
+    deleting the member has already collected the rows it removes.
+    """
+    user_ids = {pk for pk in user_ids if pk is not None}
+    if not user_ids:
+        return
+    today = today or timezone.localdate()
+    users = User.objects.filter(id__in=user_ids)
+    if existing_only:
+        users = users.filter(stats__isnull=False)
+    # the subscription ending last
+    current = (Subscription.objects.filter(user_id=OuterRef("pk"), start_date__lte=today, end_date__gte=today)
+               .order_by("-end_date", "-id").values("id")[:1])
+    # one query per table, grouped by member: the members that do not exist drop out of the first
+    stats = {pk: (count, last, subscription_id) for pk, count, last, subscription_id in users.values_list("id").annotate(
+        Count("subscription__visit"), Max("subscription__visit__date"), current=Subquery(current)).order_by()}
+    if not stats:
+        return
+    for pk, count, last in (users.filter(id__in=stats, subscription__archived_visits__isnull=False).values_list("id")
+                            .annotate(Count("subscription__archived_visits"),
+                                      Max("subscription__archived_visits__date")).order_by()):
+        total, newest, subscription_id = stats[pk]
+        stats[pk] = (total + count, last if newest is None or last > newest else newest, subscription_id)
+    rows = [UserStats(user_id=pk, visits=count, last_visit_date=last, current_subscription_id=subscription_id)
+            for pk, (count, last, subscription_id) in stats.items()]
+    _upsert(UserStats, rows, unique_fields=["user"], update_fields=["visits", "last_visit_date", "current_subscription"])
+    transaction.on_commit(lambda: cache.invalidate(UserStats))
+
+
+def refresh_subscription_users(subscription_ids, existing_only=False):
+    subscription_ids = {pk for pk in subscription_ids if pk is not None}
+    if subscription_ids:
+        refresh_user_stats(Subscription.objects.filter(id__in=subscription_ids).values_list("user_id", flat=True),
+                           existing_only=existing_only)
+
+
+def count_visit(subscription_id, date):
+    """One new visit on `date`: counted with a single UPDATE, recounted when the member has no row yet."""
+    date = Visit._meta.get_field("date").to_python(date)
+    counted = UserStats.objects.filter(user_id=Subquery(
+        Subscription.objects.filter(id=subscription_id).values("user_id"))
+    ).update(visits=F("visits") + 1,
+             last_visit_date=Case(When(last_visit_date__gt=date, then=F("last_visit_date")), default=Value(date),
+                                  output_field=DateField()))
+    if counted:
+        transaction.on_commit(lambda: cache.invalidate(UserStats))
+    else:
+        refresh_subscription_users([subscription_id])
+
+
+def _visits_between(start_date, end_date):
+    return DailyVisitStatistics.objects.filter(date__range=[start_date, end_date])
+
+
+def visits_between(start_date, end_date):
+    return _visits_between(start_date, end_date).aggregate(total=Sum("visits"))["total"] or 0
+
+
+async def avisits_between(start_date, end_date):
+    return (await _visits_between(start_date, end_date).aaggregate(total=Sum("visits")))["total"] or 0
+
+
+def _subscriptions_per_type(start_date, end_date):
+    rows = DailySubscriptionStatistics.objects.all()
+    if start_date:
+        rows = rows.filter(date__range=[start_date, end_date])
+    return rows.values("type__title").annotate(count=Sum("subscriptions"), revenue=Sum("revenue")).order_by("type__title")
+
+
+def subscriptions_per_type(start_date=None, end_date=None):
+    return list(_subscriptions_per_type(start_date, end_date))
+
+
+async def asubscriptions_per_type(start_date=None, end_date=None):
+    return [row async for row in _subscriptions_per_type(start_date, end_date)]
+
+
+def _hours_between(start_date, end_date):
+    return HourlyVisitStatistics.objects.filter(date__range=[start_date, end_date]).order_by()
+
+
+ENTRY_BUCKETS = {
+    "hour": (F("hour"), lambda hour: f"{hour:02d}:00"),
+    "day": (F("date"), str),
+    "week": (TruncWeek("date"), str),
+}
+
+
+def visit_entries(start_date, end_date, bucket):
+    """Visits per hour of entry, per day or per week (keyed by its Monday)."""
+    expression, label = ENTRY_BUCKETS[bucket]
+    rows = _hours_between(start_date, end_date).values_list(expression).annotate(visits=Sum("visits"))
+    return [{"bucket": label(key), "visits": visits} for key, visits in sorted(rows)]
+
+
+def average_visit_minutes(start_date, end_date):
+    totals = _hours_between(start_date, end_date).aggregate(finished=Sum("finished_visits"),
+                                                            seconds=Sum("duration_seconds"))
+    if not totals["finished"]:
+        return None
+    return round(totals["seconds"] / totals["finished"] / 60, 1)
+
+
+def visit_heatmap(start_date, end_date):
+    """Visits per ISO weekday (1 is Monday) and hour of entry, as 7 rows of 24 counts."""
+    heatmap = [[0] * 24 for _ in range(7)]
+    rows = _hours_between(start_date, end_date).values_list(ExtractIsoWeekDay("date"), "hour").annotate(Sum("visits"))
+    for weekday, hour, visits in rows:
+        heatmap[weekday - 1][hour] = visits
+    return heatmap
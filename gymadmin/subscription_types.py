@@ -0,0 +1,78 @@
+"""
+Process-local registry of the subscription types.
+
+SubscriptionType is a handful of rows that hardly ever change, so the whole table is loaded on first use
+and titles are turned into ids (and back) from memory instead of joining it in every query. The
+SubscriptionType signals reload it once the writing transaction commits, so it stays warm; writes made by
+other processes are picked up by a reload after GYMADMIN_SUBSCRIPTION_TYPES_RELOAD_SECONDS, or as soon
+as an id or title that is not known yet turns up. Async views call `aload()` first, as the lookups may query.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from gymadmin.models import SubscriptionType
+
+
+class SubscriptionTypeRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._titles = {}
+        self._ids = {}
+        self._loaded_at = None
+
+    def _reload_interval(self):
+        return getattr(settings, "GYMADMIN_SUBSCRIPTION_TYPES_RELOAD_SECONDS", 60)
+
+    def _is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self._reload_interval()
+
+    def reload(self):
+        titles = dict(SubscriptionType.objects.values_list("id", "title"))
+        ids = {}
+        # titles are not unique, a title stands for all the types carrying it
+        for pk, title in sorted(titles.items()):
+            ids[title] = ids.get(title, ()) + (pk,)
+        with self._lock:
+            self._titles, self._ids = titles, ids
+            self._loaded_at = time.monotonic()
+
+    def mark_stale(self):
+        with self._lock:
+            self._loaded_at = None
+
+    async def aload(self, pks=()):
+        """Reload now if stale or any of `pks` is unknown, so async callers never query from the lookups."""
+        with self._lock:
+            missing = any(pk not in self._titles for pk in pks)
+        if missing or self._is_stale():
+            await sync_to_async(self.reload)()
+
+    def _maps(self):
+        if self._is_stale():
+            self.reload()
+        with self._lock:
+            return self._titles, self._ids
+
+    def title(self, pk):
+        """Title of the type with this id, None when there is none."""
+        titles, _ = self._maps()
+        if pk not in titles:
+            # ids come from stored rows, so an unknown one was created elsewhere since the last load
+            self.reload()
+            titles, _ = self._maps()
+        return titles.get(pk)
+
+    def ids(self, title):
+        """Ids of the types with this title, in ascending order; empty when there is none."""
+        _, ids = self._maps()
+        if title not in ids:
+            # possibly created elsewhere since the last load; writes naming it would be rejected until the reload
+            self.reload()
+            _, ids = self._maps()
+        return ids.get(title, ())
+
+
+registry = SubscriptionTypeRegistry()
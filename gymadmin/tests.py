@@ -1,9 +1,48 @@
+import datetime
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, models, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from gymadmin.models import User, Subscription, Visit
-from gymadmin.serializers import SubscriptionSerializer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from gymadmin.models import User, Subscription, Visit, VisitArchive, SubscriptionType, DailyVisitStatistics, \
+    DailySubscriptionStatistics, HourlyVisitStatistics, MonthlyRevenue, UserStats
+from gymadmin.middleware import HybridMiddleware, MetricsMiddleware, ReplicaRoutingMiddleware
+from gymadmin.occupancy import tracker
+from gymadmin import archive, cache, counts, expiry, metrics, passwords, revenue, schema, search, statistics
+from gymadmin.pagination import KeysetPagination
+from gymadmin.search import index
+from gymadmin.subscription_types import registry
+from gymadmin.routers import ReplicaRouter, allow_replica_reads, reset
+from gymadmin.renderers import FastJSONRenderer
+from gymadmin.serializers import SubscriptionSerializer, SubscriptionValuesSerializer, UserSerializer, \
+    UserValuesSerializer, VisitBulkSerializer, VisitSerializer, VisitValuesSerializer
 from django.test import TransactionTestCase
 
+APP_QUERY = re.compile(r'(SELECT\b.*?\bFROM "gymadmin_|INSERT INTO "gymadmin_|UPDATE "gymadmin_|DELETE FROM "gymadmin_)')
+
+
+def app_queries(queries):
+    """Statements against the app's tables, leaving out what the profiling middleware runs around them."""
+    return [query["sql"] for query in queries if APP_QUERY.match(query["sql"])]
+
 
 class UserTests(TransactionTestCase):
     reset_sequences = True
@@ -17,7 +56,8 @@ class UserTests(TransactionTestCase):
 
     def test_create_user(self):
         url = reverse("register")
-        data = {"email": "creation@gmil.com", "first_name": "creationfirst", "last_name": "creationlast", "password": "create"}
+        data = {"email": "creation@gmil.com", "first_name": "creationfirst", "last_name": "creationlast", "password": "create",
+                "birth_date": "2000-01-01"}
 
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -184,3 +224,1697 @@ class VisitTests(TransactionTestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+
+class PaginationTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.bulk_create([
+            User(email=f"user{i}@gmail.com", first_name=f"first{i}", last_name=f"last{i}", birth_date="2000-01-01")
+            for i in range(7)
+        ])
+
+    def test_users_are_paged_by_cursor(self):
+        response = self.client.get(reverse("users"), {"page_size": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user["id"] for user in response.data["users"]], [1, 2, 3])
+        self.assertIsNone(response.data["previous"])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual([user["id"] for user in response.data["users"]], [4, 5, 6])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual([user["id"] for user in response.data["users"]], [7])
+        self.assertIsNone(response.data["next"])
+
+        response = self.client.get(response.data["previous"])
+        self.assertEqual([user["id"] for user in response.data["users"]], [4, 5, 6])
+
+    def test_page_size_is_capped(self):
+        with self.settings(GYMADMIN_MAX_PAGE_SIZE=2):
+            response = self.client.get(reverse("users"), {"page_size": 50})
+        self.assertEqual(len(response.data["users"]), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("users"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_visits_are_ordered_by_date_then_id(self):
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        for hour, date in enumerate(["2023-03-01", "2023-02-01", "2023-03-01", "2023-02-01"]):
+            Visit.objects.create(subscription_id=1, date=date, enter_time=f"{10 + hour}:00")
+
+        request = Request(RequestFactory().get("/visits/", {"page_size": 3}))
+        paginator = KeysetPagination(ordering=("date", "id"))
+        self.assertEqual([visit.id for visit in paginator.paginate_queryset(Visit.objects.all(), request)], [2, 4, 1])
+
+        request = Request(RequestFactory().get(paginator.get_next_link()))
+        paginator = KeysetPagination(ordering=("date", "id"))
+        self.assertEqual([visit.id for visit in paginator.paginate_queryset(Visit.objects.all(), request)], [3])
+
+
+class ExportTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        sport = SubscriptionType.objects.create(title="sport")
+        pool = SubscriptionType.objects.create(title="pool")
+        Subscription.objects.create(user_id=1, type=sport, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        Subscription.objects.create(user_id=1, type=pool, start_date="2023-06-01", end_date="2024-06-01", price=5000)
+        Visit.objects.create(subscription_id=1, date="2023-02-02", enter_time="10:00", exit_time="11:30")
+        Visit.objects.create(subscription_id=2, date="2023-07-02", enter_time="12:00")
+        Visit.objects.create(subscription_id=1, date="2023-08-02", enter_time="09:00")
+
+    def test_visits_ndjson_export(self):
+        with self.settings(GYMADMIN_EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(reverse("visits-export", kwargs={"export_format": "ndjson"}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [1, 2, 3])
+        self.assertEqual(rows[0], {"id": 1, "subscription_id": 1, "date": "2023-02-02", "enter_time": "10:00:00", "exit_time": "11:30:00"})
+
+    def test_visits_export_filters(self):
+        url = reverse("visits-export", kwargs={"export_format": "ndjson"})
+        response = self.client.get(url, {"from": "2023-03-01", "type": "sport"})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [3])
+
+    def test_subscriptions_csv_export(self):
+        response = self.client.get(reverse("subscriptions-export", kwargs={"export_format": "csv"}), {"type": "pool"})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ["id,user_id,type,start_date,end_date,price", "2,1,pool,2023-06-01,2024-06-01,5000"])
+
+    def test_unknown_export_format(self):
+        response = self.client.get(reverse("visits-export", kwargs={"export_format": "xml"}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_dates_are_bad_requests(self):
+        for url, params in [
+            (reverse("visits-export", kwargs={"export_format": "csv"}), {"from": "2023-13-01"}),
+            (reverse("subscriptions-export", kwargs={"export_format": "csv"}), {"to": "soon"}),
+            (reverse("visits"), {"date": "yesterday"}),
+            (reverse("subscriptions"), {"from": "2023-02-30"}),
+            (reverse("async-visits"), {"to": "x"}),
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+            self.assertIn("must be a date", response.json()["detail"])
+        response = self.client.get(reverse("visits"), {"from": "2023-3-1"})
+        self.assertEqual(len(response.json()["visits"]), 2)
+
+
+class VisitBulkTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        Subscription.objects.create(user_id=1, type=type, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+
+    def test_bulk_create_resolves_subscriptions_in_one_query(self):
+        visits = [{"subscription_id": 1 + i % 2, "date": "2023-02-02", "enter_time": f"{8 + i // 60:02d}:{i % 60:02d}"}
+                  for i in range(200)]
+        serializer = VisitBulkSerializer(visits)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid())
+            self.assertEqual(serializer.save(), 200)
+        statements = [query["sql"] for query in queries]
+        self.assertEqual(len([sql for sql in statements if sql.startswith('SELECT "gymadmin_subscription"')]), 1)
+        # as few INSERTs as the backend's limit on query parameters allows (SQLite: 999, so two)
+        fields = [field for field in Visit._meta.concrete_fields if not field.primary_key]
+        batches = -(-200 // connection.ops.bulk_batch_size(fields, visits))
+        self.assertEqual(len([sql for sql in statements if 'INTO "gymadmin_visit"' in sql]), batches)
+        self.assertEqual(Visit.objects.count(), 200)
+
+    def test_bulk_create_endpoint(self):
+        visits = [{"subscription_id": 1, "date": "2023-02-02", "enter_time": f"10:{i:02d}"} for i in range(30)]
+        response = self.client.post(reverse("visits-bulk"), visits, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["accepted"], 30)
+        self.assertEqual(Visit.objects.count(), 30)
+
+    def test_bulk_create_reports_invalid_items(self):
+        visits = [
+            {"subscription_id": 1, "date": "2023-02-02", "enter_time": "10:00"},
+            {"subscription_id": 99, "date": "2023-02-02", "enter_time": "10:00"},
+            {"subscription_id": 1, "date": "2023-02-02", "enter_time": "12:00", "exit_time": "11:00"},
+        ]
+        response = self.client.post(reverse("visits-bulk"), {"visits": visits}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([error["index"] for error in response.data["errors"]], [1, 2])
+        self.assertIn("subscription_id", response.data["errors"][0]["errors"])
+        self.assertEqual(Visit.objects.count(), 1)
+
+    def test_bulk_upsert_updates_exit_time(self):
+        visit = {"subscription_id": 1, "date": "2023-02-02", "enter_time": "10:00"}
+        self.client.post(reverse("visits-bulk"), [visit], content_type="application/json")
+        response = self.client.post(reverse("visits-bulk"), [visit, {**visit, "enter_time": "12:00"}, visit],
+                                    content_type="application/json")
+        # only the new visit is stored, the repeats of the stored one and of the earlier item are skipped
+        self.assertEqual((response.data["accepted"], response.data["duplicates"]), (1, 2))
+        self.assertEqual(Visit.objects.count(), 2)
+        Visit.objects.filter(enter_time="12:00").delete()
+        self.assertIsNone(Visit.objects.get().exit_time)
+
+        response = self.client.post(reverse("visits-bulk") + "?upsert=true", [{**visit, "exit_time": "11:00"}],
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Visit.objects.count(), 1)
+        self.assertEqual(Visit.objects.get().exit_time.isoformat(), "11:00:00")
+
+    @override_settings(GYMADMIN_CACHE_ENABLED=True)
+    def test_bulk_upsert_refreshes_the_cached_detail(self):
+        cache.clear()
+        visit = {"subscription_id": 1, "date": "2023-02-02", "enter_time": "10:00"}
+        self.client.post(reverse("visits-bulk"), [visit], content_type="application/json")
+        self.assertIsNone(self.client.get(reverse("visits", kwargs={"pk": 1})).data["visit"]["exit_time"])
+        self.client.post(reverse("visits-bulk") + "?upsert=true", [{**visit, "exit_time": "11:00"}],
+                         content_type="application/json")
+        self.assertEqual(self.client.get(reverse("visits", kwargs={"pk": 1})).data["visit"]["exit_time"], "11:00:00")
+
+    def test_duplicate_visit_is_rejected(self):
+        visit = {"subscription_id": 1, "date": "2023-02-02", "enter_time": "10:00"}
+        self.assertEqual(self.client.post(reverse("visits"), visit, content_type="application/json").status_code,
+                         status.HTTP_201_CREATED)
+        response = self.client.post(reverse("visits"), visit, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("non_field_errors", response.data)
+        self.assertEqual(Visit.objects.count(), 1)
+
+    def test_bulk_rejects_batch_without_valid_items(self):
+        response = self.client.post(reverse("visits-bulk"), [{"date": "2023-02-02"}], content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Visit.objects.count(), 0)
+
+
+class StatisticsTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        self.sport = SubscriptionType.objects.create(title="sport")
+        self.pool = SubscriptionType.objects.create(title="pool")
+        Subscription.objects.create(user_id=1, type=self.sport, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        Subscription.objects.create(user_id=1, type=self.sport, start_date="2023-01-01", end_date="2023-06-01", price=4000)
+        Subscription.objects.create(user_id=1, type=self.pool, start_date="2023-03-01", end_date="2024-03-01", price=5000)
+        Visit.objects.create(subscription_id=1, date="2023-02-02", enter_time="10:00", exit_time="11:00")
+        Visit.objects.create(subscription_id=1, date="2023-02-02", enter_time="12:00")
+        Visit.objects.create(subscription_id=3, date="2023-03-05", enter_time="10:00")
+
+    def test_rollups_follow_writes(self):
+        self.assertEqual(DailyVisitStatistics.objects.get(date="2023-02-02").visits, 2)
+        rollup = DailySubscriptionStatistics.objects.get(date="2023-01-01", type=self.sport)
+        self.assertEqual((rollup.subscriptions, rollup.revenue), (2, 14000))
+
+        visit = Visit.objects.get(pk=2)
+        visit.date = "2023-03-05"
+        visit.save()
+        self.assertEqual(DailyVisitStatistics.objects.get(date="2023-02-02").visits, 1)
+        self.assertEqual(DailyVisitStatistics.objects.get(date="2023-03-05").visits, 2)
+
+        Visit.objects.get(pk=1).delete()
+        self.assertFalse(DailyVisitStatistics.objects.filter(date="2023-02-02").exists())
+
+        Subscription.objects.get(pk=3).delete()
+        self.assertFalse(DailySubscriptionStatistics.objects.filter(date="2023-03-01").exists())
+
+    def test_statistics_endpoint_reads_rollups(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("statistics"), {"from": "2023-01-01", "to": "2023-02-28"})
+        self.assertFalse([query for query in queries if 'FROM "gymadmin_subscription"' in query["sql"]])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_clients"], 1)
+        # the visits of 2023 left open are long over
+        self.assertEqual(response.data["current_visits"], 0)
+        self.assertEqual(response.data["visits_in_period"], 2)
+        self.assertEqual(response.data["boughtsubscriptions_in_period_per_type"],
+                         [{"type__title": "sport", "count": 2, "revenue": 14000}])
+        self.assertEqual(response.data["total_subscriptions_per_type"], [
+            {"type__title": "pool", "count": 1, "revenue": 5000},
+            {"type__title": "sport", "count": 2, "revenue": 14000},
+        ])
+
+    def test_invalid_period_is_a_bad_request(self):
+        for params in ({"from": "2023-02-30"}, {"from": "2023-01-01", "to": "later"}):
+            for name in ("statistics", "async-statistics"):
+                response = self.client.get(reverse(name), params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, (name, params))
+                self.assertIn("must be a date", response.json()["detail"])
+        response = self.client.get(reverse("statistics"), {"from": "2023-1-1", "to": "2023-2-28"})
+        self.assertEqual(response.data["visits_in_period"], 2)
+
+    def test_rebuild_statistics_command(self):
+        DailyVisitStatistics.objects.all().delete()
+        DailySubscriptionStatistics.objects.all().delete()
+        call_command("rebuild_statistics", stdout=io.StringIO())
+        self.assertEqual(dict(DailyVisitStatistics.objects.values_list("date", "visits")),
+                         {datetime.date(2023, 2, 2): 2, datetime.date(2023, 3, 5): 1})
+        self.assertEqual(DailySubscriptionStatistics.objects.count(), 2)
+
+
+@override_settings(GYMADMIN_CACHE_ENABLED=True)
+class CacheTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        self.type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=self.type, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        Visit.objects.create(subscription_id=1, date="2023-02-02", enter_time="10:00")
+
+    def gymadmin_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, app_queries(queries)
+
+    def test_repeated_detail_reads_skip_the_database(self):
+        url = reverse("users", kwargs={"pk": 1})
+        response, queries = self.gymadmin_queries(url)
+        # the ETag validators, then the user
+        self.assertEqual(len(queries), 2)
+        response, queries = self.gymadmin_queries(url)
+        self.assertEqual(queries, [])
+        self.assertEqual(response.data["user"]["first_name"], "first")
+
+        user = User.objects.get()
+        user.first_name = "changed"
+        user.save()
+        response, queries = self.gymadmin_queries(url)
+        self.assertEqual(response.data["user"]["first_name"], "changed")
+
+    def test_subscription_detail_is_invalidated_by_its_writes(self):
+        url = reverse("subscriptions", kwargs={"pk": 1})
+        self.gymadmin_queries(url)
+        subscription = Subscription.objects.get()
+        subscription.price = 20000
+        subscription.save()
+        response, queries = self.gymadmin_queries(url)
+        self.assertEqual(response.data["subscription"]["price"], 20000)
+
+    def test_list_cache_is_keyed_on_filters_and_invalidated_by_writes(self):
+        response, queries = self.gymadmin_queries(reverse("users"), {"last_name": "last"})
+        self.assertTrue(queries)
+        response, queries = self.gymadmin_queries(reverse("users"), {"last_name": "last"})
+        self.assertEqual(queries, [])
+        self.assertEqual(len(response.data["users"]), 1)
+        response, queries = self.gymadmin_queries(reverse("users"), {"last_name": "other"})
+        self.assertEqual(len(response.data["users"]), 0)
+
+        url = reverse("subscription-visits", kwargs={"pk": 1})
+        self.gymadmin_queries(url)
+        Visit.objects.create(subscription_id=1, date="2023-02-03", enter_time="10:00")
+        response, queries = self.gymadmin_queries(url)
+        self.assertEqual(len(response.data["visits"]), 2)
+
+    def test_dependent_model_write_invalidates_cached_subscription(self):
+        url = reverse("subscriptions", kwargs={"pk": 1})
+        self.gymadmin_queries(url)
+        self.type.title = "gym"
+        self.type.save()
+        response, queries = self.gymadmin_queries(url)
+        self.assertTrue(queries)
+
+    def test_writes_invalidate_once_committed(self):
+        url = reverse("users", kwargs={"pk": 1})
+        self.gymadmin_queries(url)
+        with transaction.atomic():
+            user = User.objects.get()
+            user.first_name = "changed"
+            user.save()
+            # invalidating now would let a read before the commit cache the old row again
+            self.assertIsNotNone(cache.get_cache().get("gymadmin:gymadmin.user:1"))
+        self.assertIsNone(cache.get_cache().get("gymadmin:gymadmin.user:1"))
+        response, queries = self.gymadmin_queries(url)
+        self.assertEqual(response.data["user"]["first_name"], "changed")
+
+    def test_cache_statistics(self):
+        url = reverse("visits", kwargs={"pk": 1})
+        self.client.get(url)
+        self.client.get(url)
+        response = self.client.get(reverse("cache-statistics"))
+        self.assertGreaterEqual(response.data["cache"]["gymadmin.visit"]["hits"], 1)
+        self.assertGreaterEqual(response.data["cache"]["gymadmin.visit"]["misses"], 1)
+
+
+class OccupancyTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        sport = SubscriptionType.objects.create(title="sport")
+        pool = SubscriptionType.objects.create(title="pool")
+        Subscription.objects.create(user_id=1, type=sport, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        Subscription.objects.create(user_id=1, type=pool, start_date="2023-01-01", end_date="2024-01-01", price=5000)
+        self.today = timezone.localdate()
+        Visit.objects.create(subscription_id=1, date=self.today, enter_time="09:15", exit_time="10:00")
+        Visit.objects.create(subscription_id=1, date=self.today, enter_time="09:30")
+
+    def test_tracker_follows_visit_writes_without_queries(self):
+        self.assertEqual(tracker.current_visits(), 1)
+        Visit.objects.create(subscription_id=2, date=self.today, enter_time="10:05")
+        with self.assertNumQueries(0):
+            self.assertEqual(tracker.snapshot(), {
+                "current_visits": 2,
+                "per_type": {"pool": 1, "sport": 1},
+                "per_hour": {"09:00": 1, "10:00": 1},
+            })
+
+        visit = Visit.objects.get(pk=2)
+        visit.exit_time = "11:00"
+        visit.save()
+        Visit.objects.get(pk=3).delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(tracker.current_visits(), 0)
+
+    def test_tracker_reconciles_writes_it_did_not_see(self):
+        tracker.reconcile()
+        Visit.objects.filter(pk=2).update(exit_time="11:00")
+        self.assertEqual(tracker.current_visits(), 1)
+        with self.settings(GYMADMIN_OCCUPANCY_RECONCILE_SECONDS=0):
+            self.assertEqual(tracker.current_visits(), 0)
+
+    def test_occupancy_endpoint(self):
+        response = self.client.get(reverse("occupancy"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["current_visits"], 1)
+        self.assertEqual(response.data["per_type"], {"sport": 1})
+
+    def test_visits_left_open_on_earlier_days_are_over(self):
+        day = datetime.timedelta(days=1)
+        # past midnight, yesterday's visit still counts
+        Visit.objects.create(subscription_id=2, date=self.today - day, enter_time="23:30")
+        Visit.objects.create(subscription_id=2, date=self.today - 2 * day, enter_time="10:00")
+        self.assertEqual(tracker.current_visits(), 2)
+        tracker.reconcile()
+        self.assertEqual(tracker.current_visits(), 2)
+
+
+class CheckInTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        today = timezone.localdate()
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date=today - datetime.timedelta(days=10),
+                                    end_date=today + datetime.timedelta(days=10), price=10000)
+        Subscription.objects.create(user_id=1, type=type, start_date="2020-01-01", end_date="2020-02-01", price=10000)
+
+    def test_check_in_and_out(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("visits-check-in"), {"subscription_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # the member's row is locked (no FOR UPDATE on SQLite), then validation and insert are the same statement
+        lock, insert = app_queries(queries)[:2]
+        self.assertTrue(lock.startswith('SELECT "gymadmin_user"."id" AS "pk" FROM "gymadmin_user"'))
+        self.assertTrue(insert.startswith('INSERT INTO "gymadmin_visit"'))
+        visit = Visit.objects.get()
+        self.assertEqual(response.data["visit_id"], visit.pk)
+        self.assertEqual(visit.date, timezone.localdate())
+        self.assertIsNone(visit.exit_time)
+        self.assertEqual(tracker.current_visits(), 1)
+
+        response = self.client.post(reverse("visits-check-in"), {"user_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post(reverse("visits-check-out"), {"user_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(Visit.objects.get().exit_time)
+        self.assertEqual(tracker.current_visits(), 0)
+
+        response = self.client.post(reverse("visits-check-out"), {"subscription_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_check_in_and_out_move_the_rollups_without_recounting(self):
+        def rollups():
+            return (list(DailyVisitStatistics.objects.values_list("date", "visits")),
+                    list(HourlyVisitStatistics.objects.values_list("date", "hour", "visits", "finished_visits",
+                                                                   "duration_seconds")))
+
+        self.client.post(reverse("visits-check-in"), {"subscription_id": 1}, content_type="application/json")
+        self.client.post(reverse("visits-check-out"), {"subscription_id": 1}, content_type="application/json")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("visits-check-in"), {"subscription_id": 1}, content_type="application/json")
+        statements = [sql.split('"')[1] for sql in app_queries(queries) if not sql.startswith("SELECT")]
+        self.assertEqual(statements, ["gymadmin_visit", "gymadmin_hourlyvisitstatistics",
+                                      "gymadmin_dailyvisitstatistics", "gymadmin_userstats"])
+        self.client.post(reverse("visits-check-out"), {"subscription_id": 1}, content_type="application/json")
+
+        moved = rollups()
+        self.assertEqual(moved[0], [(timezone.localdate(), 2)])
+        statistics.refresh_visit_days([timezone.localdate()])
+        self.assertEqual(rollups(), moved)
+        Visit.objects.first().delete()
+        moved = rollups()
+        self.assertEqual(moved[0], [(timezone.localdate(), 1)])
+        statistics.refresh_visit_days([timezone.localdate()])
+        self.assertEqual(rollups(), moved)
+
+    def test_a_visit_left_open_days_ago_does_not_block_check_in(self):
+        Visit.objects.create(subscription_id=1, date=timezone.localdate() - datetime.timedelta(days=3),
+                             enter_time="10:00")
+        response = self.client.post(reverse("visits-check-in"), {"user_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.post(reverse("visits-check-out"), {"user_id": 1}, content_type="application/json")
+        self.assertIsNotNone(Visit.objects.get(pk=response.data["visit_id"]).exit_time)
+
+    def test_check_in_by_user_picks_active_subscription(self):
+        response = self.client.post(reverse("visits-check-in"), {"user_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["visit"]["subscription_id"], 1)
+        self.assertEqual(DailyVisitStatistics.objects.get(date=timezone.localdate()).visits, 1)
+
+    def test_check_in_rejections(self):
+        response = self.client.post(reverse("visits-check-in"), {"subscription_id": 2}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse("visits-check-in"), {"subscription_id": 99}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse("visits-check-in"), {}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Visit.objects.exists())
+
+    def test_checkin_benchmark_command(self):
+        output = io.StringIO()
+        call_command("benchmark", "checkin", iterations=5, stdout=output)
+        self.assertIn("check-in: requests=5", output.getvalue())
+        self.assertFalse(User.objects.filter(email__startswith="bench-").exists())
+
+
+@override_settings(GYMADMIN_CACHE_ENABLED=False)
+class QueryCountTests(TransactionTestCase):
+    """Every list endpoint must run the same number of queries whatever the number of rows."""
+    reset_sequences = True
+    sizes = (1, 100, 10000)
+
+    def grow_to(self, size):
+        type = SubscriptionType.objects.get_or_create(title="sport")[0]
+        existing = User.objects.count()
+        first_day = datetime.date(2023, 1, 1)
+        User.objects.bulk_create([
+            User(email=f"user{i}@gmail.com", first_name=f"first{i}", last_name="last", birth_date="2000-01-01")
+            for i in range(existing, size)
+        ])
+        Subscription.objects.bulk_create([
+            Subscription(user_id=i + 1, type=type, start_date=first_day, end_date="2024-01-01", price=1000)
+            for i in range(existing, size)
+        ])
+        Visit.objects.bulk_create([
+            Visit(subscription_id=i % 10 + 1, date=first_day + datetime.timedelta(days=i // 100), enter_time=f"{8 + i % 100 // 60:02d}:{i % 60:02d}",
+                  exit_time=None if i % 2 else "12:00")
+            for i in range(existing, size)
+        ])
+        tracker.reconcile()
+        archive.newest_date()
+        counts.count(User.objects.all())
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        return len(app_queries(queries))
+
+    def assertQueriesDoNotScale(self, endpoints, most=2):
+        counts = {endpoint: [] for endpoint in endpoints}
+        for size in self.sizes:
+            self.grow_to(size)
+            for url, params in endpoints:
+                counts[(url, params)].append(self.count_queries(url, dict(params)))
+        for (url, params), per_size in counts.items():
+            self.assertEqual(len(set(per_size)), 1, f"{url} {dict(params)} ran {per_size} queries for {self.sizes} rows")
+            self.assertLessEqual(per_size[0], most, url)
+
+    def test_list_endpoints(self):
+        self.assertQueriesDoNotScale([
+            (reverse("users"), ()),
+            (reverse("users"), (("page_size", 1000),)),
+            (reverse("subscriptions"), (("page_size", 1000),)),
+            (reverse("subscriptions"), (("type", "sport"), ("user_id", 1))),
+            (reverse("visits"), (("page_size", 1000),)),
+            (reverse("visits"), (("subscription_id", 1), ("from", "2023-01-01"))),
+            (reverse("subscription-visits", kwargs={"pk": 1}), ()),
+        ])
+
+    def test_paged_list_endpoints(self):
+        self.grow_to(300)
+        for url in (reverse("users"), reverse("subscriptions"), reverse("visits")):
+            next_page, counts = url, []
+            while next_page:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(next_page)
+                counts.append(len(app_queries(queries)))
+                next_page = response.data["next"]
+            self.assertEqual(set(counts), {1}, url)
+
+    def test_statistics_endpoints(self):
+        self.assertQueriesDoNotScale([
+            (reverse("statistics"), (("from", "2023-01-01"), ("to", "2023-12-31"))),
+            (reverse("occupancy"), ()),
+        ], most=4)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRoutingTests(TransactionTestCase):
+
+    def serve(self, request, write=False):
+        router = ReplicaRouter()
+        used = []
+
+        def view(request):
+            used.append(router.db_for_read(User))
+            if write:
+                router.db_for_write(Visit)
+                used.append(router.db_for_read(User))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return used, response
+
+    def test_safe_requests_read_from_replicas(self):
+        used, response = self.serve(RequestFactory().get("/users/"))
+        self.assertIn(used[0], ["replica1", "replica2"])
+        self.assertNotIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        used, response = self.serve(RequestFactory().get("/users/"), write=True)
+        self.assertEqual(used[1], "default")
+        self.assertIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+
+        used, response = self.serve(RequestFactory().post("/visits/"))
+        self.assertEqual(used, ["default"])
+        request = RequestFactory().get("/visits/")
+        request.COOKIES[ReplicaRoutingMiddleware.cookie_name] = response.cookies[ReplicaRoutingMiddleware.cookie_name].value
+        used, response = self.serve(request)
+        self.assertEqual(used, ["default"])
+
+    @override_settings(GYMADMIN_CACHE_ENABLED=True)
+    def test_cache_misses_right_after_a_write_read_from_the_primary(self):
+        cache.clear()
+        router = ReplicaRouter()
+        used = []
+
+        def produce():
+            used.append(router.db_for_read(User))
+            return {"first_name": "first"}
+
+        tokens = allow_replica_reads(True)
+        try:
+            cache.cached_object(User, 1, produce)
+            cache.invalidate(User, 1)
+            cache.cached_object(User, 1, produce)
+            # once the window is over the replicas have the write
+            cache.get_cache().delete_many(["gymadmin:gymadmin.user:written", "gymadmin:gymadmin.user:1"])
+            cache.cached_object(User, 1, produce)
+            self.assertTrue(router.db_for_read(User).startswith("replica"))
+        finally:
+            reset(tokens)
+        self.assertTrue(used[0].startswith("replica"))
+        self.assertEqual(used[1], "default")
+        self.assertTrue(used[2].startswith("replica"))
+
+    def test_primary_outside_requests_and_transactions(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(User), "default")
+        tokens = allow_replica_reads(True)
+        try:
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(User), "default")
+        finally:
+            reset(tokens)
+        self.assertFalse(router.allow_migrate("replica1", "gymadmin"))
+
+
+class AsyncViewTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        today = timezone.localdate()
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date=today, end_date=today, price=10000)
+        Visit.objects.create(subscription_id=1, date="2023-02-02", enter_time="10:00", exit_time="11:00")
+
+    async def test_async_views_match_sync_payloads(self):
+        for sync_name, async_name, kwargs in [
+            ("users", "async-users", {"pk": 1}),
+            ("users", "async-users", {}),
+            ("subscriptions", "async-subscriptions", {"pk": 1}),
+            ("subscriptions", "async-subscriptions", {}),
+            ("visits", "async-visits", {"pk": 1}),
+            ("visits", "async-visits", {}),
+        ]:
+            expected = await self.async_client.get(reverse(sync_name, kwargs=kwargs))
+            response = await self.async_client.get(reverse(async_name, kwargs=kwargs))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json(), json.loads(expected.content), async_name)
+
+    async def test_async_statistics(self):
+        response = await self.async_client.get(reverse("async-statistics"), {"from": "2023-01-01", "to": "2023-12-31"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["total_clients"], 1)
+        self.assertEqual(response.json()["visits_in_period"], 1)
+
+    async def test_async_statistics_render_like_the_sync_view(self):
+        as_of = datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc)
+        with mock.patch.object(counts, "count", return_value=counts.Count(1, as_of, counts.EXACT)), \
+                mock.patch.object(counts, "open_visits", return_value=counts.Count(0, as_of, "tracker")):
+            period = {"from": "2023-01-01", "to": "2023-12-31"}
+            expected = await self.async_client.get(reverse("statistics"), period)
+            response = await self.async_client.get(reverse("async-statistics"), period)
+        self.assertEqual(response.content, expected.content)
+
+    async def test_async_check_in_and_not_found(self):
+        response = await self.async_client.post(reverse("async-visits-check-in"), {"subscription_id": 1},
+                                                content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = await self.async_client.post(reverse("async-visits-check-in"), {"subscription_id": 1},
+                                                content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = await self.async_client.get(reverse("async-users", kwargs={"pk": 99}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(GYMADMIN_CACHE_ENABLED=True)
+    async def test_async_views_share_the_cache_and_conditional_get(self):
+        url = reverse("async-users", kwargs={"pk": 1})
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["ETag"].startswith('W/"json-'))
+        not_modified = await self.async_client.get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        await self.async_client.get(reverse("async-visits"))
+        hits = cache.stats()["gymadmin.visit:list"]["hits"]
+        cached = await self.async_client.get(reverse("async-visits"))
+        self.assertEqual(cache.stats()["gymadmin.visit:list"]["hits"], hits + 1)
+        self.assertEqual(len(cached.json()["visits"]), 1)
+        response = await self.async_client.get(reverse("async-users"), {"ordering": "nope"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_middleware_stays_async(self):
+        async def view(request):
+            return HttpResponse()
+
+        for middleware in (MetricsMiddleware, ReplicaRoutingMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(view)))
+            self.assertFalse(iscoroutinefunction(middleware(lambda request: HttpResponse())))
+        # the base class passes the request on either way
+        request = RequestFactory().get("/")
+        self.assertEqual((await HybridMiddleware(view)(request)).status_code, 200)
+        self.assertEqual(HybridMiddleware(lambda request: HttpResponse(status=204))(request).status_code, 204)
+        metrics.registry.clear()
+        await self.async_client.get(reverse("async-users"))
+        rows, _ = metrics.registry.snapshot()
+        self.assertEqual(rows[("AsyncUserList", "GET")][metrics.COUNT], 1)
+
+        response = await self.async_client.post(reverse("async-visits-check-in"), {"subscription_id": 1},
+                                                content_type="application/json")
+        self.assertIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+
+
+class SearchTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        for first_name, last_name, email in [
+            ("Anna", "Kovalenko", "anna.k@gmail.com"),
+            ("Annabel", "Smith", "bell@gmail.com"),
+            ("Ivan", "Annenkov", "ivan@ukr.net"),
+            ("Oleksandr", "Shevchenko", "sasha@gmail.com"),
+        ]:
+            User.objects.create(email=email, first_name=first_name, last_name=last_name, birth_date="2000-01-01")
+
+    def search(self, q, **params):
+        response = self.client.get(reverse("users-search"), {"q": q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [user["id"] for user in response.data["users"]]
+
+    def test_prefix_matches_in_token_order(self):
+        self.assertEqual(self.search("anna"), [1, 2])
+        self.assertEqual(self.search("ANN"), [1, 2, 3])
+        self.assertEqual(self.search("ann", limit=2), [1, 2])
+        self.assertEqual(self.search("anna kov"), [1])
+        self.assertEqual(self.search("sasha@"), [4])
+
+    def test_fuzzy_matches_follow_prefix_matches(self):
+        self.assertEqual(self.search("shevcenko"), [4])
+        self.assertEqual(self.search("kovalenko"), [1])
+        self.assertEqual(self.search("zzzz"), [])
+
+    def test_index_follows_user_writes_without_queries(self):
+        index.reconcile()
+        user = User.objects.get(pk=1)
+        user.last_name = "Petrenko"
+        user.save()
+        User.objects.get(pk=2).delete()
+        User.objects.create(email="petro@gmail.com", first_name="Petro", last_name="Bondar", birth_date="2000-01-01")
+        with self.assertNumQueries(0):
+            self.assertEqual(index.search("petr", 10), [1, 5])
+            self.assertEqual(index.search("smith", 10), [])
+            self.assertEqual(index.search("kovalenko", 10), [])
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        index.reconcile()
+        User.objects.bulk_create([User(email="olena@gmail.com", first_name="Olena", last_name="Bondar",
+                                       birth_date="2000-01-01")])
+        with self.settings(GYMADMIN_SEARCH_RECONCILE_SECONDS=0), \
+                mock.patch.object(index, "_reconcile_in_background") as rebuild, self.assertNumQueries(0):
+            # answered from the previous build meanwhile
+            self.assertEqual(index.search("olena", 10), [])
+        rebuild.assert_called_once_with()
+
+        with self.settings(GYMADMIN_SEARCH_RECONCILE_SECONDS=0):
+            index.search("olena", 10)
+        for thread in threading.enumerate():
+            if thread.name == "member-search-reconcile":
+                thread.join()
+        self.assertEqual(index.search("olena", 10), [5])
+
+    def test_warm_builds_the_index_before_the_first_search(self):
+        index.mark_stale()
+        with self.settings(GYMADMIN_SEARCH_WARM_ON_START=False):
+            search.warm()
+        self.assertIsNone(index._snapshot)
+        search.warm()
+        with self.assertNumQueries(0):
+            self.assertEqual(index.search("anna", 10), [1, 2])
+
+    def test_invalid_query(self):
+        self.assertEqual(self.client.get(reverse("users-search")).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse("users-search"), {"q": "ann", "limit": "x"}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(GYMADMIN_PASSWORD_PROFILES={"low": 1000, "high": 2000}, GYMADMIN_PASSWORD_PROFILE="low",
+                   GYMADMIN_PASSWORD_WORKERS=0)
+class PasswordTests(TransactionTestCase):
+    reset_sequences = True
+
+    def register(self, email):
+        return self.client.post(reverse("register"), {"email": email, "first_name": "first", "last_name": "last",
+                                                      "birth_date": "2000-01-01", "password": "secret"},
+                                content_type="application/json")
+
+    def test_profile_sets_iterations_and_logins_upgrade(self):
+        user = User.objects.create_user(first_name="first", last_name="last", email="test@gmail.com",
+                                        birth_date="2000-01-01", password="secret")
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$1000$"))
+        with self.settings(GYMADMIN_PASSWORD_PROFILE="high"):
+            self.assertTrue(user.check_password("secret"))
+        self.assertTrue(User.objects.get().password.startswith("pbkdf2_sha256$2000$"))
+
+    def test_logins_never_lower_the_iterations(self):
+        with self.settings(GYMADMIN_PASSWORD_PROFILE="high"):
+            user = User.objects.create_user(first_name="first", last_name="last", email="test@gmail.com",
+                                            birth_date="2000-01-01", password="secret")
+        self.assertTrue(user.check_password("secret"))
+        self.assertTrue(User.objects.get().password.startswith("pbkdf2_sha256$2000$"))
+        # None is Django's default
+        with self.settings(GYMADMIN_PASSWORD_PROFILES={"default": None}, GYMADMIN_PASSWORD_PROFILE="default"):
+            self.assertTrue(user.check_password("secret"))
+        self.assertTrue(User.objects.get().password.startswith(f"pbkdf2_sha256${PBKDF2PasswordHasher.iterations}$"))
+
+    def test_pool_hashes_off_the_calling_process(self):
+        with self.settings(GYMADMIN_PASSWORD_WORKERS=2):
+            try:
+                self.assertEqual(self.register("test@gmail.com").status_code, status.HTTP_201_CREATED)
+                hashes = passwords.hash_passwords(["one", "two", "three"])
+            finally:
+                passwords.shutdown()
+        self.assertTrue(User.objects.get().check_password("secret"))
+        self.assertTrue(User(password=hashes[1]).check_password("two"))
+        self.assertFalse(User(password=hashes[1]).check_password("one"))
+        self.assertTrue(all(password.startswith("pbkdf2_sha256$1000$") for password in hashes))
+
+    def test_registration_is_throttled(self):
+        with self.settings(GYMADMIN_REGISTRATION_RATE="2/min"):
+            self.assertEqual(self.register("one@gmail.com").status_code, status.HTTP_201_CREATED)
+            self.assertEqual(self.register("two@gmail.com").status_code, status.HTTP_201_CREATED)
+            self.assertEqual(self.register("three@gmail.com").status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        with self.settings(GYMADMIN_REGISTRATION_RATE=None, GYMADMIN_PASSWORD_WORKERS=1, GYMADMIN_PASSWORD_MAX_PENDING=0):
+            try:
+                response = self.register("three@gmail.com")
+            finally:
+                passwords.shutdown()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(User.objects.count(), 2)
+
+    async def test_async_registration_awaits_the_pool(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with self.settings(GYMADMIN_PASSWORD_WORKERS=1, GYMADMIN_PASSWORD_LOCK_DIR=directory.name):
+            try:
+                response = await self.async_client.post(
+                    reverse("async-register"), {"email": "test@gmail.com", "first_name": "first", "last_name": "last",
+                                                "birth_date": "2000-01-01", "password": "secret"},
+                    content_type="application/json")
+            finally:
+                passwords.shutdown()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["user"]["email"], "test@gmail.com")
+        user = await User.objects.aget()
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$1000$"))
+        self.assertTrue(await sync_to_async(user.check_password)("secret"))
+
+    def test_hashing_slots_are_shared_by_the_host(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with passwords._host_slot(directory.name, 1):
+            # the only slot is held (as by another process's pool): a hash waits for it
+            waiting = threading.Thread(target=lambda: passwords._encode(*passwords._job("secret")[:4],
+                                                                         (directory.name, 1)))
+            waiting.start()
+            waiting.join(0.2)
+            self.assertTrue(waiting.is_alive())
+        waiting.join(5)
+        self.assertFalse(waiting.is_alive())
+
+    def test_no_host_slots_without_fcntl(self):
+        directory = os.path.join(tempfile.gettempdir(), "gymadmin-passwords-no-fcntl")
+        with mock.patch.dict(sys.modules, {"fcntl": None}):
+            self.assertTrue(passwords._encode(*passwords._job("secret")[:4], (directory, 1))
+                            .startswith("pbkdf2_sha256$1000$"))
+        self.assertFalse(os.path.exists(directory))
+
+    def test_import_users(self):
+        User.objects.create_user(first_name="first", last_name="last", email="taken@gmail.com",
+                                 birth_date="2000-01-01", password="secret")
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as source:
+            source.write("first_name,last_name,email,birth_date,password\n"
+                         "Anna,Kovalenko,anna@gmail.com,1990-05-01,one\n"
+                         "Ivan,Petrenko,taken@gmail.com,1991-05-01,two\n"
+                         "Oleh,Bondar,oleh@gmail.com,not a date,three\n"
+                         "Olena,Shevchenko,olena@gmail.com,1992-05-01,four\n")
+            source.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command("import_users", source.name, batch_size=2, stdout=out, stderr=err)
+        self.assertIn("Imported 2 users, skipped 1 existing and 1 invalid rows.", out.getvalue())
+        self.assertIn("line 4", err.getvalue())
+        self.assertTrue(User.objects.get(email="olena@gmail.com").check_password("four"))
+        self.assertEqual(index.search("kovalenko", 10), [User.objects.get(email="anna@gmail.com").pk])
+
+
+class VisitAnalyticsTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        Subscription.objects.create(user_id=1, type=type, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        # Thursday and Friday of the week starting Monday 2023-01-30
+        Visit.objects.create(subscription_id=1, date="2023-02-02", enter_time="10:00", exit_time="11:00")
+        Visit.objects.create(subscription_id=2, date="2023-02-02", enter_time="10:30", exit_time="11:00")
+        Visit.objects.create(subscription_id=1, date="2023-02-03", enter_time="18:15")
+
+    def analytics(self, **params):
+        response = self.client.get(reverse("visit-analytics"), {"from": "2023-01-01", "to": "2023-12-31", **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_entries_per_bucket(self):
+        self.assertEqual(self.analytics()["entries"], [
+            {"bucket": "2023-02-02", "visits": 2}, {"bucket": "2023-02-03", "visits": 1},
+        ])
+        self.assertEqual(self.analytics(bucket="hour")["entries"], [
+            {"bucket": "10:00", "visits": 2}, {"bucket": "18:00", "visits": 1},
+        ])
+        self.assertEqual(self.analytics(bucket="week")["entries"], [{"bucket": "2023-01-30", "visits": 3}])
+        self.assertEqual(self.analytics(**{"from": "2023-02-03"})["entries"], [{"bucket": "2023-02-03", "visits": 1}])
+
+    def test_duration_and_heatmap(self):
+        data = self.analytics()
+        self.assertEqual(data["average_visit_minutes"], 45.0)
+        self.assertEqual(data["heatmap"][3][10], 2)
+        self.assertEqual(data["heatmap"][4][18], 1)
+        self.assertEqual(sum(map(sum, data["heatmap"])), 3)
+
+        visit = Visit.objects.get(pk=3)
+        visit.exit_time = "19:45"
+        visit.save()
+        self.assertEqual(self.analytics()["average_visit_minutes"], 60.0)
+        self.assertEqual(HourlyVisitStatistics.objects.get(date="2023-02-03", hour=18).duration_seconds, 5400)
+
+        Visit.objects.filter(date="2023-02-02").delete()
+        self.assertFalse(HourlyVisitStatistics.objects.filter(date="2023-02-02").exists())
+
+    def test_invalid_parameters(self):
+        url = reverse("visit-analytics")
+        self.assertEqual(self.client.get(url, {"bucket": "month"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"from": "yesterday"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url).data["entries"], [])
+
+
+class ArchiveTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.old_day = today - datetime.timedelta(days=400)
+        self.recent_day = today - datetime.timedelta(days=10)
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date=self.old_day, end_date=today, price=10000)
+        Visit.objects.create(subscription_id=1, date=self.old_day, enter_time="10:00", exit_time="11:00")
+        Visit.objects.create(subscription_id=1, date=self.recent_day, enter_time="10:00", exit_time="11:00")
+        Visit.objects.create(subscription_id=1, date=self.old_day, enter_time="12:00", exit_time="13:00")
+        out = io.StringIO()
+        call_command("archive_visits", batch_size=1, stdout=out)
+        self.assertIn("Archived 2 visits", out.getvalue())
+
+    def test_old_visits_move_with_their_ids(self):
+        self.assertEqual(list(Visit.objects.values_list("id", flat=True)), [2])
+        self.assertEqual(list(VisitArchive.objects.order_by("id").values_list("id", "date")),
+                         [(1, self.old_day), (3, self.old_day)])
+        self.assertEqual(DailyVisitStatistics.objects.get(date=self.old_day).visits, 2)
+
+        Visit.objects.create(subscription_id=1, date=self.old_day, enter_time="15:00")
+        self.assertEqual(DailyVisitStatistics.objects.get(date=self.old_day).visits, 3)
+        Subscription.objects.get().delete()
+        self.assertFalse(DailyVisitStatistics.objects.exists())
+
+    def test_reads_include_the_archive_only_when_the_range_reaches_it(self):
+        self.assertEqual(archive.newest_date(), self.old_day)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse("visits"), {"from": str(self.recent_day)}).data
+        self.assertEqual([visit["date"] for visit in data["visits"]], [str(self.recent_day)])
+        self.assertFalse(any("visitarchive" in sql for sql in app_queries(queries)))
+
+        pages, next_page = [], reverse("visits") + "?page_size=1"
+        while next_page:
+            data = self.client.get(next_page).data
+            pages += [(visit["date"], visit["enter_time"]) for visit in data["visits"]]
+            next_page = data["next"]
+        self.assertEqual(pages, [(str(self.old_day), "10:00:00"), (str(self.old_day), "12:00:00"),
+                                 (str(self.recent_day), "10:00:00")])
+        previous = self.client.get(reverse("visits"), {"page_size": 1, "cursor": KeysetPagination(("date", "id"))
+                                   .encode_cursor((self.recent_day, 2), reverse=True)}).data
+        self.assertEqual(previous["visits"][0]["enter_time"], "12:00:00")
+
+        self.assertEqual(self.client.get(reverse("visits", kwargs={"pk": 1})).status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.client.get(reverse("subscription-visits", kwargs={"pk": 1})).data["visits"]), 3)
+        export = self.client.get(reverse("visits-export", kwargs={"export_format": "ndjson"}))
+        self.assertEqual([json.loads(line)["id"] for line in b"".join(export.streaming_content).splitlines()], [1, 3, 2])
+
+    def test_uploads_of_archived_visits_are_duplicates(self):
+        serializer = VisitBulkSerializer([{"subscription_id": 1, "date": str(self.old_day), "enter_time": "10:00"},
+                                          {"subscription_id": 1, "date": str(self.old_day), "enter_time": "14:00"}],
+                                         upsert=True)
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.save(), 1)
+        self.assertEqual(serializer.duplicates, 1)
+        response = self.client.post(reverse("visits"), {"subscription_id": 1, "date": str(self.old_day),
+                                                        "enter_time": "12:00"}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Visit.objects.filter(date=self.old_day).count(), 1)
+
+    def test_an_archive_conflict_keeps_the_visit(self):
+        VisitArchive.objects.create(id=4, subscription_id=1, date=self.old_day, enter_time="16:00",
+                                    updated_at=timezone.now())
+        Visit.objects.create(subscription_id=1, date=self.old_day, enter_time="17:00")
+        with self.assertRaises(CommandError):
+            call_command("archive_visits", stdout=io.StringIO())
+        self.assertEqual(Visit.objects.get(id=4).enter_time, datetime.time(17))
+        self.assertEqual(VisitArchive.objects.get(id=4).enter_time, datetime.time(16))
+
+
+@override_settings(GYMADMIN_CACHE_ENABLED=False,
+                   MIDDLEWARE=[name for name in settings.MIDDLEWARE if not name.startswith("silk.")])
+class MetricsTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        metrics.registry.clear()
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        Visit.objects.create(subscription_id=1, date="2023-02-02", enter_time="10:00", exit_time="11:00")
+
+    def scrape(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return dict(line.rsplit(" ", 1) for line in response.content.decode().splitlines() if not line.startswith("#"))
+
+    def test_requests_are_recorded_per_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            visits = self.client.get(reverse("visits"))
+            self.client.get(reverse("visits"))
+        query_count = len(queries)
+        self.client.get(reverse("statistics"), {"from": "2023-01-01"})
+        self.client.get(reverse("visits", kwargs={"pk": 99}))
+
+        samples = self.scrape()
+        labels = 'view="VisitList",method="GET"'
+        self.assertEqual(samples[f'gymadmin_requests_total{{{labels},status="200"}}'], "2")
+        self.assertEqual(samples[f'gymadmin_request_duration_seconds_count{{{labels}}}'], "2")
+        self.assertEqual(samples[f'gymadmin_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], "2")
+        self.assertEqual(samples[f'gymadmin_db_queries_total{{{labels}}}'], str(query_count))
+        self.assertGreater(float(samples[f'gymadmin_serializer_seconds_total{{{labels}}}']), 0)
+        self.assertEqual(samples[f'gymadmin_response_bytes_total{{{labels}}}'], str(2 * len(visits.content)))
+        self.assertIn('gymadmin_requests_total{view="ApplicationStatisticsView",method="GET",status="200"}', samples)
+        self.assertEqual(samples['gymadmin_requests_total{view="VisitDetail",method="GET",status="404"}'], "1")
+
+    def test_short_lived_threads_share_the_shards(self):
+        registry = metrics.Registry(shards=4)
+
+        def record():
+            registry.record("VisitList", "GET", 200, 0.01, metrics.RequestMetrics(), 10)
+
+        for _ in range(50):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        rows, statuses = registry.snapshot()
+        self.assertEqual(len(registry._shards), 4)
+        self.assertEqual(rows[("VisitList", "GET")][metrics.COUNT], 50)
+        self.assertEqual(statuses[("VisitList", "GET", "200")], 50)
+
+    def test_disabled(self):
+        with self.settings(GYMADMIN_METRICS_ENABLED=False):
+            self.client.get(reverse("visits"))
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('gymadmin_request_duration_seconds_count{view="VisitList",method="GET"}', self.scrape())
+
+
+class LoadTestTests(TransactionTestCase):
+    reset_sequences = True
+
+    def test_generate_gym_data(self):
+        call_command("generate_gym_data", users=20, subscriptions=40, visits=300, days=60, seed=1,
+                     chunk_size=50, stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Subscription.objects.count(), 40)
+        visits = Visit.objects.count()
+        self.assertGreater(visits, 0)
+        self.assertLessEqual(visits, 300)
+        self.assertFalse(Visit.objects.filter(date__gt=timezone.localdate()).exists())
+        self.assertFalse(Visit.objects.filter(exit_time__lt=models.F("enter_time")).exists())
+        self.assertEqual(DailyVisitStatistics.objects.aggregate(total=models.Sum("visits"))["total"], visits)
+        self.assertEqual(DailySubscriptionStatistics.objects.aggregate(total=models.Sum("subscriptions"))["total"],
+                         Subscription.objects.filter(start_date__lte=timezone.localdate()).count())
+
+    def test_urls_benchmark_writes_and_compares_results(self):
+        call_command("generate_gym_data", users=5, subscriptions=10, visits=30, days=30, stdout=io.StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = f"{directory}/baseline.json"
+            output = io.StringIO()
+            call_command("benchmark", "urls", iterations=1, output=baseline, stdout=output, stderr=io.StringIO())
+            with open(baseline) as source:
+                results = json.load(source)
+            self.assertEqual(results["suite"], "urls")
+            self.assertEqual(set(results["environment"]), {"commit", "created_at", "python", "django", "database"})
+            self.assertIn("visits/", results["results"])
+            self.assertIn("users/<int:pk> {'pk': 5}", results["results"])
+
+            output = io.StringIO()
+            call_command("benchmark", "urls", iterations=1, compare=baseline, stdout=output, stderr=io.StringIO())
+            self.assertIn("visits/ vs ", output.getvalue())
+            with self.assertRaises(CommandError):
+                call_command("benchmark", "urls", iterations=1, compare=baseline, max_regression_percent=-100,
+                             stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class SerializationTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="ölga@gmail.com", first_name="Ольга", last_name="line\u2028break", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="басейн")
+        Subscription.objects.create(user_id=1, type=type, start_date="2023-01-01", end_date="2024-01-01", price=10000)
+        Visit.objects.create(subscription_id=1, date="2023-02-02", enter_time="10:00", exit_time="11:00:30")
+        Visit.objects.create(subscription_id=1, date="2023-02-03", enter_time="10:00:00.250000")
+
+    def assertRendersLikeDRF(self, serializer_class, values_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset.order_by("id"), many=True).data)
+        rows = values_class.serialize(values_class.values(queryset).order_by("id"))
+        self.assertEqual(FastJSONRenderer().render(rows), expected)
+        with mock.patch("gymadmin.renderers.orjson", None):
+            self.assertEqual(FastJSONRenderer().render(rows), expected)
+
+    def test_values_serializers_match_drf_serializers(self):
+        self.assertRendersLikeDRF(UserSerializer, UserValuesSerializer, User.objects.all())
+        self.assertRendersLikeDRF(SubscriptionSerializer, SubscriptionValuesSerializer,
+                                  Subscription.objects.select_related("type"))
+        self.assertRendersLikeDRF(VisitSerializer, VisitValuesSerializer, Visit.objects.all())
+
+    def test_list_endpoints(self):
+        visits = self.client.get(reverse("visits")).json()["visits"]
+        self.assertEqual(visits[1], {"subscription_id": 1, "date": "2023-02-03", "enter_time": "10:00:00.250000",
+                                     "exit_time": None})
+        subscriptions = self.client.get(reverse("subscriptions")).json()["subscriptions"]
+        self.assertEqual(subscriptions[0]["type"], "басейн")
+        self.assertEqual(self.client.get(reverse("users")).json()["users"][0]["first_name"], "Ольга")
+
+    def test_renderer_keeps_drf_formats(self):
+        data = {"date": datetime.date(2023, 2, 2), "moment": datetime.datetime(2023, 2, 2, 10, 0, 0, 123456),
+                "time": datetime.time(10, 0, 0, 250000), 1: [None, True, 1.5]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render({"big": 2 ** 70}), JSONRenderer().render({"big": 2 ** 70}))
+        self.assertEqual(FastJSONRenderer().render(data, renderer_context={"indent": 2}),
+                         JSONRenderer().render(data, renderer_context={"indent": 2}))
+
+    def test_serialization_benchmark_command(self):
+        output = io.StringIO()
+        call_command("benchmark", "serialization", iterations=1, rows=50, stdout=output)
+        self.assertIn("visits: values serializer", output.getvalue())
+        self.assertIn("visits values serialize: requests=1", output.getvalue())
+
+
+@override_settings(GYMADMIN_CACHE_ENABLED=True)
+class ConditionalGetTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        today = timezone.localdate()
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date=today - datetime.timedelta(days=400),
+                                    end_date=today + datetime.timedelta(days=10), price=10000)
+        Visit.objects.create(subscription_id=1, date=today - datetime.timedelta(days=400), enter_time="10:00",
+                             exit_time="11:00")
+        Visit.objects.create(subscription_id=1, date=today - datetime.timedelta(days=1), enter_time="10:00")
+
+    def get(self, url, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers=headers)
+        self.query_count = len(app_queries(queries))
+        return response
+
+    def test_detail_endpoints(self):
+        for url in (reverse("users", kwargs={"pk": 1}), reverse("subscriptions", kwargs={"pk": 1}),
+                    reverse("visits", kwargs={"pk": 1})):
+            response = self.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response["ETag"].startswith('W/"json-'))
+            self.assertIn("Last-Modified", response)
+
+            not_modified = self.get(url, response["ETag"])
+            self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(not_modified.content, b"")
+            self.assertEqual(not_modified["ETag"], response["ETag"])
+            self.assertEqual(self.query_count, 0)
+
+            modified = self.client.get(url, headers={"If-Modified-Since": response["Last-Modified"]})
+            self.assertEqual(modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.get(reverse("users", kwargs={"pk": 9}), "*").status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(GYMADMIN_CACHE_ENABLED=False)
+    def test_not_modified_after_one_query(self):
+        url = reverse("users", kwargs={"pk": 1})
+        etag = self.get(url)["ETag"]
+        self.assertEqual(self.get(url, etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.query_count, 1)
+
+        user = User.objects.get()
+        user.first_name = "changed"
+        user.save()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_subscription_type_rename_changes_subscriptions(self):
+        url = reverse("subscriptions", kwargs={"pk": 1})
+        etag = self.get(url)["ETag"]
+        type = SubscriptionType.objects.get()
+        type.title = "gym"
+        type.save()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["subscription"]["type"], "gym")
+
+    def test_visits_of_subscription(self):
+        url = reverse("subscription-visits", kwargs={"pk": 1})
+        response = self.get(url)
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+        self.assertEqual(self.get(url, etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # moving visits to the archive keeps the list and its ETag
+        call_command("archive_visits", stdout=io.StringIO())
+        self.assertEqual(self.get(url, etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # check-out and bulk upserts bypass save(), but still set updated_at
+        self.client.post(reverse("visits-check-out"), {"subscription_id": 1}, content_type="application/json")
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        visit = Visit.objects.get()
+        serializer = VisitBulkSerializer([{"subscription_id": 1, "date": str(visit.date), "enter_time": "10:00",
+                                           "exit_time": "12:00"}], upsert=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.assertGreater(Visit.objects.get().updated_at, visit.updated_at)
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # a deleted visit changes the ETag although no remaining row changed
+        etag = response["ETag"]
+        Visit.objects.get().delete()
+        self.assertEqual(self.get(url, etag).status_code, status.HTTP_200_OK)
+
+    def test_check_in_sets_updated_at(self):
+        before = timezone.now()
+        response = self.client.post(reverse("visits-check-in"), {"subscription_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.client.post(reverse("visits-check-out"), {"subscription_id": 1}, content_type="application/json")
+        response = self.client.post(reverse("visits-check-in"), {"subscription_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreaterEqual(Visit.objects.get(pk=response.data["visit_id"]).updated_at, before)
+
+
+class SubscriptionStatusTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        day = datetime.timedelta(days=1)
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        for start_date, end_date in ((self.today - 30 * day, self.today - day), (self.today - 30 * day, self.today),
+                                     (self.today - 30 * day, self.today + 3 * day), (self.today + day, self.today + 30 * day),
+                                     (self.today - 10 * day, self.today + 30 * day)):
+            Subscription.objects.create(user_id=1, type=type, start_date=start_date, end_date=end_date, price=10000)
+
+    def statuses(self):
+        return list(Subscription.objects.order_by("id").values_list("status", flat=True))
+
+    def test_status_is_derived_on_save(self):
+        self.assertEqual(self.statuses(), ["expired", "active", "active", "upcoming", "active"])
+        subscription = Subscription.objects.get(pk=4)
+        subscription.start_date = self.today
+        subscription.save()
+        self.assertEqual(Subscription.objects.get(pk=4).status, "active")
+
+    @override_settings(GYMADMIN_CACHE_ENABLED=True)
+    def test_sweep_moves_statuses_along(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        self.assertEqual(list(expiry.sweep(self.today)), [])
+        self.client.get(reverse("subscriptions", kwargs={"pk": 2}))
+
+        changes = list(expiry.sweep(tomorrow, batch_size=1))
+        self.assertEqual(changes, [("expired", 1), ("active", 1)])
+        self.assertEqual(self.statuses(), ["expired", "expired", "active", "active", "active"])
+        # the updates bypass the signals but not the cache
+        self.assertEqual(self.client.get(reverse("subscriptions", kwargs={"pk": 2})).data["subscription"]["status"],
+                         "expired")
+
+    @override_settings(GYMADMIN_CACHE_ENABLED=True)
+    def test_sweep_in_an_outer_transaction_invalidates_every_batch(self):
+        cache.clear()
+        tomorrow = self.today + datetime.timedelta(days=1)
+        for pk in (2, 4):
+            self.client.get(reverse("subscriptions", kwargs={"pk": pk}))
+        with transaction.atomic():
+            self.assertEqual(list(expiry.sweep(tomorrow, batch_size=1)), [("expired", 1), ("active", 1)])
+        self.assertEqual([self.client.get(reverse("subscriptions", kwargs={"pk": pk})).data["subscription"]["status"]
+                          for pk in (2, 4)], ["expired", "active"])
+
+    def test_sweep_command_lists_expiring_subscriptions(self):
+        Subscription.objects.filter(pk=1).update(status="active")
+        out = io.StringIO()
+        call_command("sweep_subscriptions", expiring_days=3, stdout=out, stderr=io.StringIO())
+        self.assertEqual([json.loads(line)["id"] for line in out.getvalue().splitlines()], [2, 3])
+        self.assertEqual(self.statuses()[0], "expired")
+
+    def test_expiring_list_and_counts(self):
+        response = self.client.get(reverse("subscriptions-expiring"), {"days": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["id"] for row in response.data["subscriptions"]], [2, 3])
+        self.assertEqual(response.data["subscriptions"][0]["status"], "active")
+        page = self.client.get(reverse("subscriptions-expiring"), {"days": 30, "page_size": 2})
+        self.assertEqual([row["id"] for row in page.data["subscriptions"]], [2, 3])
+        self.assertEqual([row["id"] for row in self.client.get(page.data["next"]).data["subscriptions"]], [5])
+        self.assertEqual(self.client.get(reverse("subscriptions-expiring"), {"days": "x"}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("subscriptions-expiring"), {"days": 99999999999})
+        self.assertEqual([row["id"] for row in response.data["subscriptions"]], [2, 3, 5])
+        self.assertEqual(self.client.get(reverse("subscription-statuses"), {"days": 99999999999})
+                         .data["expiring"]["subscriptions"], 3)
+
+        self.assertEqual([row["id"] for row in self.client.get(reverse("subscriptions"), {"status": "upcoming"})
+                         .data["subscriptions"]], [4])
+        response = self.client.get(reverse("subscription-statuses"))
+        self.assertEqual(response.data, {"subscriptions_per_status": {"upcoming": 1, "active": 3, "expired": 1},
+                                         "expiring": {"days": 7, "subscriptions": 2}})
+
+
+class UserStatsTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        day = datetime.timedelta(days=1)
+        for number in range(3):
+            User.objects.create(email=f"user{number}@gmail.com", first_name="first", last_name="last",
+                                birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user_id=1, type=type, start_date=self.today - 30 * day,
+                                    end_date=self.today + 30 * day, price=10000)
+        Subscription.objects.create(user_id=1, type=type, start_date=self.today - 10 * day,
+                                    end_date=self.today + 60 * day, price=10000)
+        Subscription.objects.create(user_id=2, type=type, start_date=self.today - 30 * day,
+                                    end_date=self.today - day, price=10000)
+        for offset in (20, 5):
+            Visit.objects.create(subscription_id=1, date=self.today - offset * day, enter_time="10:00", exit_time="11:00")
+        Visit.objects.create(subscription_id=3, date=self.today - 3 * day, enter_time="10:00", exit_time="11:00")
+
+    def stats(self):
+        return {row.user_id: (row.visits, row.last_visit_date, row.current_subscription_id)
+                for row in UserStats.objects.all()}
+
+    def test_stats_follow_writes(self):
+        day = datetime.timedelta(days=1)
+        self.assertEqual(self.stats(), {1: (2, self.today - 5 * day, 2), 2: (1, self.today - 3 * day, None),
+                                        3: (0, None, None)})
+
+        response = self.client.post(reverse("visits-check-in"), {"user_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.stats()[1], (3, self.today, 2))
+
+        visit = Visit.objects.get(subscription_id=3)
+        visit.subscription_id = 1
+        visit.save()
+        self.assertEqual(self.stats()[1][0], 4)
+        self.assertEqual(self.stats()[2], (0, None, None))
+
+        Subscription.objects.get(pk=2).delete()
+        self.assertEqual(self.stats()[1], (4, self.today, 1))
+        User.objects.get(pk=1).delete()
+        self.assertNotIn(1, self.stats())
+
+    def test_rebuild_command_repairs_rows(self):
+        expected = self.stats()
+        UserStats.objects.all().delete()
+        Visit.objects.filter(pk=1).update(subscription_id=3)
+        call_command("rebuild_user_stats", batch_size=2, stdout=io.StringIO())
+        day = datetime.timedelta(days=1)
+        self.assertEqual(self.stats(), {**expected, 1: (1, self.today - 5 * day, 2), 2: (2, self.today - 3 * day, None)})
+
+    def test_user_list_includes_and_sorts_by_stats(self):
+        response = self.client.get(reverse("users"), {"include": "stats"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["users"][0], {
+            "id": 1, "first_name": "first", "last_name": "last", "email": "user0@gmail.com", "visits": 2,
+            "last_visit_date": str(self.today - datetime.timedelta(days=5)), "current_subscription_id": 2,
+        })
+        self.assertNotIn("visits", self.client.get(reverse("users")).data["users"][0])
+
+        page = self.client.get(reverse("users"), {"ordering": "-visits", "page_size": 2})
+        self.assertEqual([row["id"] for row in page.data["users"]], [1, 2])
+        self.assertEqual([row["id"] for row in self.client.get(page.data["next"]).data["users"]], [3])
+        # members who never visited have no last visit to sort by
+        self.assertEqual([row["id"] for row in self.client.get(reverse("users"), {"ordering": "last_visit_date"})
+                         .data["users"]], [1, 2])
+        self.assertEqual(self.client.get(reverse("users"), {"ordering": "email"}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_user_list_with_stats_is_invalidated_by_visits(self):
+        self.client.get(reverse("users"), {"include": "stats"})
+        Visit.objects.create(subscription_id=3, date=self.today, enter_time="12:00", exit_time="13:00")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("users"), {"include": "stats"})
+        self.assertEqual(response.data["users"][1]["visits"], 2)
+        self.assertEqual(len(app_queries(queries)), 1)
+
+
+class RevenueTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="first@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01",
+                            date_joined="2023-01-15T12:00:00Z")
+        User.objects.create(email="second@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01",
+                            date_joined="2023-02-03T12:00:00Z")
+        self.sport = SubscriptionType.objects.create(title="sport")
+        self.pool = SubscriptionType.objects.create(title="pool")
+        Subscription.objects.create(user_id=1, type=self.sport, start_date="2023-01-17", end_date="2023-02-15", price=3000)
+        Subscription.objects.create(user_id=2, type=self.pool, start_date="2023-02-01", end_date="2023-02-28", price=2800)
+
+    def rows(self):
+        return {(month.strftime("%Y-%m"), type_id, cohort.strftime("%Y-%m")): (total, count)
+                for month, type_id, cohort, total, count in
+                MonthlyRevenue.objects.values_list("month", "type_id", "cohort", "revenue", "subscriptions")}
+
+    def test_price_is_spread_over_the_days(self):
+        shares = revenue.spread(100, datetime.date(2023, 1, 31), datetime.date(2023, 3, 1))
+        self.assertEqual(shares, [(datetime.date(2023, 1, 1), 3), (datetime.date(2023, 2, 1), 93),
+                                  (datetime.date(2023, 3, 1), 4)])
+        self.assertEqual(self.rows(), {("2023-01", 1, "2023-01"): (1500, 1), ("2023-02", 1, "2023-01"): (1500, 1),
+                                       ("2023-02", 2, "2023-02"): (2800, 1)})
+
+    def test_revenue_follows_writes_and_matches_rebuild(self):
+        subscription = Subscription.objects.get(pk=1)
+        subscription.end_date = "2023-03-16"
+        subscription.price = 6000
+        subscription.save()
+        Subscription.objects.create(user_id=2, type=self.sport, start_date="2023-03-01", end_date="2023-03-31", price=900)
+        self.assertEqual(self.rows()[("2023-03", 1, "2023-01")], (1628, 1))
+        Subscription.objects.get(pk=2).delete()
+        self.assertNotIn(("2023-02", 2, "2023-02"), self.rows())
+
+        maintained = self.rows()
+        MonthlyRevenue.objects.all().delete()
+        call_command("rebuild_revenue", stdout=io.StringIO())
+        self.assertEqual(self.rows(), maintained)
+        self.assertEqual(sum(total for total, _ in maintained.values()), 6900)
+
+    def test_subtracting_from_a_missing_month_recounts_it(self):
+        MonthlyRevenue.objects.all().delete()
+        subscription = Subscription.objects.get(pk=1)
+        subscription.price = 2000
+        subscription.save()
+        self.assertEqual(self.rows(), {("2023-01", 1, "2023-01"): (1000, 1), ("2023-02", 1, "2023-01"): (1000, 1),
+                                       ("2023-02", 2, "2023-02"): (2800, 1)})
+
+    def test_report_endpoint(self):
+        response = self.client.get(reverse("revenue-report"), {"from": "2023-01", "to": "2023-02"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["revenue"], 5800)
+        self.assertEqual(response.data["rows"], [
+            {"month": "2023-01", "type": "sport", "revenue": 1500, "subscriptions": 1},
+            {"month": "2023-02", "type": "pool", "revenue": 2800, "subscriptions": 1},
+            {"month": "2023-02", "type": "sport", "revenue": 1500, "subscriptions": 1},
+        ])
+        response = self.client.get(reverse("revenue-report"), {"from": "2023-01", "to": "2023-12", "group_by": "cohort"})
+        self.assertEqual(response.data["rows"], [{"cohort": "2023-01", "revenue": 3000, "subscriptions": 2},
+                                                 {"cohort": "2023-02", "revenue": 2800, "subscriptions": 1}])
+        for params in ({"from": "2023"}, {"group_by": "year"}, {"group_by": "month,month"}):
+            self.assertEqual(self.client.get(reverse("revenue-report"), params).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+
+class SubscriptionTypeRegistryTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        self.sport = SubscriptionType.objects.create(title="sport")
+        self.pool = SubscriptionType.objects.create(title="pool")
+        Subscription.objects.create(user_id=1, type=self.sport, start_date="2023-01-01", end_date="2024-01-01", price=100)
+        Subscription.objects.create(user_id=1, type=self.pool, start_date="2023-01-01", end_date="2024-01-01", price=100)
+
+    def test_lookups_do_not_query(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(registry.ids("sport"), (1,))
+            self.assertEqual(registry.title(2), "pool")
+        # an unknown title reloads once, in case another process just created it
+        with mock.patch.object(registry, "reload", wraps=registry.reload) as reload:
+            self.assertEqual(registry.ids("gym"), ())
+        reload.assert_called_once_with()
+        SubscriptionType.objects.bulk_create([SubscriptionType(title="gym")])
+        self.assertEqual(registry.ids("gym"), (3,))
+
+    def test_type_filter_and_payloads_skip_the_type_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("subscriptions"), {"type": "pool"})
+            self.client.get(reverse("visits"), {"type": "pool"})
+            detail = self.client.get(reverse("subscriptions", kwargs={"pk": 1}))
+        self.assertEqual([(row["id"], row["type"]) for row in response.data["subscriptions"]], [(2, "pool")])
+        self.assertEqual(detail.data["subscription"]["type"], "sport")
+        self.assertFalse([sql for sql in app_queries(queries) if "gymadmin_subscriptiontype" in sql])
+
+        self.assertEqual(self.client.get(reverse("subscriptions"), {"type": "gym"}).data["subscriptions"], [])
+        SubscriptionType.objects.create(title="pool")
+        Subscription.objects.create(user_id=1, type_id=3, start_date="2023-01-01", end_date="2024-01-01", price=100)
+        self.assertEqual([row["id"] for row in self.client.get(reverse("subscriptions"), {"type": "pool"})
+                         .data["subscriptions"]], [2, 3])
+
+    def test_writes_refresh_the_registry(self):
+        self.sport.title = "gym"
+        self.sport.save()
+        self.assertEqual(self.client.get(reverse("subscriptions")).data["subscriptions"][0]["type"], "gym")
+
+        data = {"user_id": 1, "start_date": "2023-01-01", "end_date": "2023-02-01", "price": 100, "type": "gym"}
+        response = self.client.post(reverse("subscriptions"), data, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Subscription.objects.get(pk=3).type_id, 1)
+        response = self.client.post(reverse("subscriptions"), {**data, "type": "sport"}, content_type="application/json")
+        self.assertEqual(response.data, {"type": ["Object with title=sport does not exist."]})
+
+        self.pool.delete()
+        self.assertEqual(registry.ids("pool"), ())
+        # a type created by another process is picked up when one of its ids turns up
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO gymadmin_subscriptiontype (id, title) VALUES (5, 'yoga')")
+        self.assertEqual(registry.title(5), "yoga")
+
+
+@override_settings(GYMADMIN_CACHE_ENABLED=True)
+class AdminTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        admin = User.objects.create(email="admin@gmail.com", first_name="first", last_name="last",
+                                    birth_date="2000-01-01", is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        type = SubscriptionType.objects.create(title="sport")
+        Subscription.objects.create(user=admin, type=type, start_date="2022-06-01", end_date="2024-01-01", price=100)
+        for day in ("2022-06-02", "2023-02-03", "2023-04-20"):
+            Visit.objects.create(subscription_id=1, date=day, enter_time="10:00", exit_time="11:00")
+
+    def changelist(self, model, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f"admin:gymadmin_{model}_changelist"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, app_queries(queries)
+
+    def test_changelists_skip_full_counts_and_distinct_dates(self):
+        for model in ("visit", "subscription", "user"):
+            # the first list takes the fast count of the table, the following ones read it from the cache
+            self.changelist(model)
+            _, queries = self.changelist(model)
+            # counts are bounded by a LIMIT
+            self.assertFalse([sql for sql in queries if "DISTINCT" in sql or "COUNT(" in sql and "LIMIT" not in sql],
+                             model)
+
+        response, _ = self.changelist("visit")
+        self.assertContains(response, "?date__year=2022")
+        self.assertContains(response, "?date__year=2023")
+        response, _ = self.changelist("visit", {"date__year": "2023"})
+        # months without visits between the first and the last are listed too
+        for month in (2, 3, 4):
+            self.assertContains(response, f"date__month={month}&amp;date__year=2023")
+        self.assertNotContains(response, "date__month=5&amp;date__year=2023")
+
+    def test_unfiltered_count_comes_from_the_estimate(self):
+        with mock.patch("gymadmin.counts.estimated_rows", return_value=20000000):
+            response, queries = self.changelist("visit")
+            self.assertEqual(response.context["cl"].result_count, 20000000)
+            self.assertFalse([sql for sql in queries if "COUNT(" in sql])
+            # a filtered list is counted, up to the limit
+            with self.settings(GYMADMIN_ADMIN_COUNT_LIMIT=2):
+                response, _ = self.changelist("visit", {"date__year": "2023"})
+            self.assertEqual(response.context["cl"].result_count, 2)
+
+
+@override_settings(GYMADMIN_CACHE_ENABLED=True)
+class CountsTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        User.objects.create(email="test@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        type = SubscriptionType.objects.create(title="sport")
+        today = timezone.localdate()
+        Subscription.objects.create(user_id=1, type=type, start_date=today - datetime.timedelta(days=10),
+                                    end_date=today + datetime.timedelta(days=10), price=1000)
+
+    def count_users(self, mode=counts.FAST):
+        with CaptureQueriesContext(connection) as queries:
+            counted = counts.count(User.objects.all(), mode)
+        return counted, app_queries(queries)
+
+    def test_fast_counts_are_cached_and_follow_signals(self):
+        counted, queries = self.count_users()
+        self.assertEqual((counted.value, counted.source, len(queries)), (1, "exact", 1))
+        counted, queries = self.count_users()
+        self.assertEqual((counted.value, counted.source, queries), (1, "cached", []))
+
+        User.objects.create(email="other@gmail.com", first_name="first", last_name="last", birth_date="2000-01-01")
+        self.assertEqual(self.count_users()[0].value, 2)
+        User.objects.get(pk=2).delete()
+        self.assertEqual(self.count_users()[0].value, 1)
+
+        # bulk writes send no signals: fast counts lag behind until they are redone
+        User.objects.bulk_create([User(email="bulk@gmail.com", first_name="first", last_name="last",
+                                       birth_date="2000-01-01")])
+        self.assertEqual(self.count_users()[0].value, 1)
+        self.assertEqual(self.count_users(counts.EXACT)[0].value, 2)
+        with self.settings(GYMADMIN_COUNTS_MAX_AGE=0):
+            self.assertEqual(self.count_users()[0].value, 2)
+
+        # the raw INSERT of a check-in is counted too
+        counts.count(Visit.objects.all())
+        self.client.post(reverse("visits-check-in"), {"subscription_id": 1}, content_type="application/json")
+        self.assertEqual(counts.count(Visit.objects.all()), (1, mock.ANY, "cached"))
+
+    def test_big_tables_use_the_estimate(self):
+        with mock.patch("gymadmin.counts.estimated_rows", return_value=20000000):
+            counted, queries = self.count_users()
+        self.assertEqual((counted.value, counted.source, queries), (20000000, "estimate", []))
+        # filtered counts are exact
+        self.assertEqual(counts.count(User.objects.filter(email="test@gmail.com")).source, "exact")
+        with self.assertRaises(ValueError):
+            counts.count(User.objects.all(), "slow")
+
+    def test_statistics_report_the_count_mode_and_time(self):
+        before = timezone.now()
+        response = self.client.get(reverse("statistics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["total_clients"], response.data["current_visits"]), (1, 0))
+        self.assertEqual(response.data["counts"], "fast")
+        self.assertGreaterEqual(response.data["counted_at"], before - datetime.timedelta(seconds=1))
+
+        User.objects.bulk_create([User(email="bulk@gmail.com", first_name="first", last_name="last",
+                                       birth_date="2000-01-01")])
+        Visit.objects.bulk_create([Visit(subscription_id=1, date=timezone.localdate(), enter_time="06:00")])
+        self.assertEqual(self.client.get(reverse("statistics")).data["total_clients"], 1)
+        response = self.client.get(reverse("statistics"), {"counts": "exact"})
+        self.assertEqual((response.data["total_clients"], response.data["current_visits"]), (2, 1))
+        self.assertEqual(response.data["counts"], "exact")
+
+        response = self.client.get(reverse("statistics"), {"counts": "slow"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SchemaTests(TransactionTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(GYMADMIN_SCHEMA_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema.forget()
+        self.addCleanup(schema.forget)
+
+    def get(self, format=".json", **headers):
+        return self.client.get(reverse("schema-json", kwargs={"format": format}), headers=headers)
+
+    def test_serves_the_generated_artifact_with_validators(self):
+        with self.assertNoLogs("drf_yasg", level="WARNING"):
+            call_command("generate_schema", stdout=io.StringIO())
+        with mock.patch("gymadmin.schema.generate", side_effect=AssertionError("generated per request")):
+            response = self.get()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.content, schema.artifact(".json").read_bytes())
+            self.assertIn("/statistics/", json.loads(response.content)["paths"])
+            self.assertIn("max-age=86400", response["Cache-Control"])
+            self.assertEqual(self.get(If_None_Match=response["ETag"]).status_code, status.HTTP_304_NOT_MODIFIED)
+
+            response = self.get(".yaml")
+            self.assertEqual(response["Content-Type"], "application/yaml")
+            self.assertEqual(response.content, schema.artifact(".yaml").read_bytes())
+            self.assertEqual(self.get(".xml").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_generates_once_per_process_without_an_artifact(self):
+        with mock.patch("gymadmin.schema.generate", wraps=schema.generate) as generate:
+            first, second = self.get(), self.get(".yaml")
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual((first.status_code, second.status_code), (status.HTTP_200_OK, status.HTTP_200_OK))
+        self.assertNotEqual(first["ETag"], second["ETag"])
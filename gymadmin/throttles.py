@@ -0,0 +1,13 @@
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class RegistrationThrottle(SimpleRateThrottle):
+    """Signups per client address, at GYMADMIN_REGISTRATION_RATE (None disables it)."""
+    scope = "registration"
+
+    def get_rate(self):
+        return getattr(settings, "GYMADMIN_REGISTRATION_RATE", "30/min")
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {"scope": self.scope, "ident": self.get_ident(request)}
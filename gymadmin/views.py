@@ -1,54 +1,144 @@
-from datetime import timezone
+import datetime
 
-from django.db.models import Count, Q
-from django.http import Http404
+from django.conf import settings
+from django.http import Http404, HttpResponse, QueryDict
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import response, status
+from rest_framework import exceptions, response, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from gymadmin.models import Subscription, Visit, User
-from gymadmin.serializers import UserSerializer, SubscriptionSerializer, VisitSerializer
+from gymadmin import archive, cache, checkin, counts, expiry, metrics, revenue, schema, statistics
+from gymadmin.conditional import conditional_get, list_validators, object_validators
+from gymadmin.exports import CONTENT_TYPES, SUBSCRIPTION_EXPORT_FIELDS, VISIT_EXPORT_FIELDS, export_response
+from gymadmin.filters import date_param, filter_subscriptions, filter_users, filter_visits
+from gymadmin.models import Subscription, Visit, User, UserStats, VisitArchive
+from gymadmin.occupancy import tracker
+from gymadmin.pagination import KeysetPagination
+from gymadmin.passwords import PasswordPoolBusy
+from gymadmin.search import index
+from gymadmin.serializers import UserSerializer, SubscriptionSerializer, VisitSerializer, VisitBulkItemSerializer, \
+    VisitBulkSerializer, CheckInSerializer, UserValuesSerializer, UserWithStatsValuesSerializer, SubscriptionValuesSerializer, \
+    VisitValuesSerializer
+from gymadmin.throttles import RegistrationThrottle
 
 
 class RegisterUser(APIView):
+    throttle_classes = [RegistrationThrottle]
 
     @swagger_auto_schema(operation_description="Register a new user", request_body=UserSerializer, responses={
         201: openapi.Response("Created user", UserSerializer),
         400: 'Bad Request. Invalid input or missing required fields.',
+        429: 'Too many signups from this client or waiting for the password hashing pool',
     })
     def post(self, request, format=None):
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            try:
+                serializer.save()
+            except PasswordPoolBusy:
+                raise exceptions.Throttled(wait=1, detail="Too many signups in progress, retry shortly")
             return Response({'user': serializer.data}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# keyset orderings of users/?ordering=, read off the user_stats indexes
+USER_ORDERINGS = {
+    "visits": ("stats__visits", "stats__user"),
+    "-visits": ("-stats__visits", "-stats__user"),
+    "last_visit_date": ("stats__last_visit_date", "stats__user"),
+    "-last_visit_date": ("-stats__last_visit_date", "-stats__user"),
+}
+
+
 class UserList(APIView):
 
-    @swagger_auto_schema(operation_description="Get a list of users with filter", responses={
-        200: openapi.Response("List of users", UserSerializer(many=True))
+    @swagger_auto_schema(operation_description="Get a list of users with filter", manual_parameters=[
+        openapi.Parameter('include', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['stats'],
+                          description="Add visits, last_visit_date and current_subscription_id"),
+        openapi.Parameter('ordering', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(USER_ORDERINGS),
+                          description="Sort by a stats field, members who never visited are left out of last_visit_date"),
+    ], responses={
+        200: openapi.Response("List of users", UserSerializer(many=True)),
+        400: "Unknown include or ordering"
     })
 
     def get(self, request):
-         users = User.objects.all()
-         first_name = request.query_params.get('first_name')
-         if first_name:
-             users = users.filter(first_name=first_name)
-
-         last_name = request.query_params.get('last_name')
-         if last_name:
-             users = users.filter(last_name=last_name)
+         detail = self.check(request.query_params)
+         if detail is not None:
+             return Response({'detail': detail}, status=status.HTTP_400_BAD_REQUEST)
+         return Response(cache.cached_list(self.cached_model(request.query_params), request,
+                                           lambda: self.list_users(request)), status.HTTP_200_OK)
+
+    @staticmethod
+    def check(params):
+         """The error message of an unknown include or ordering, None when both are fine."""
+         include = params.get('include') or None
+         ordering = params.get('ordering') or None
+         if include not in (None, 'stats') or (ordering is not None and ordering not in USER_ORDERINGS):
+             return f'include must be stats and ordering one of {", ".join(USER_ORDERINGS)}'
+         return None
+
+    @staticmethod
+    def cached_model(params):
+         # the stats are cached with their own version, which a User write bumps as well
+         return User if not params.get('include') and not params.get('ordering') else UserStats
+
+    @staticmethod
+    def get_queryset(params=QueryDict(), serializer=UserValuesSerializer, ordering=("id",)):
+         users = filter_users(User.objects.all(), params)
+         if ordering[0].lstrip("-").startswith("stats__"):
+             # a keyset cannot page over NULLs: members without stats (or visits) have no key
+             users = users.filter(**{f"{ordering[0].lstrip('-')}__isnull": False})
+         return serializer.values(users, *(name.lstrip("-") for name in ordering))
+
+    @classmethod
+    def pagination(cls, params):
+         """The paginator of the list, the querysets it pages over and the serializer of their rows."""
+         serializer = UserWithStatsValuesSerializer if params.get('include') else UserValuesSerializer
+         paginator = KeysetPagination(ordering=USER_ORDERINGS.get(params.get('ordering'), ("id",)))
+         return paginator, [cls.get_queryset(params, serializer, paginator.ordering)], serializer
+
+    def list_users(self, request):
+         paginator, querysets, serializer = self.pagination(request.query_params)
+         page = paginator.paginate_querysets(querysets, request)
+         return {"users": serializer.serialize(page), **paginator.get_links()}
+
+
+class UserSearch(APIView):
+
+    @swagger_auto_schema(operation_description="Search users by prefix or similar spelling of their names and email",
+                         manual_parameters=[
+                             openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True),
+                             openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+                         ], responses={
+            200: openapi.Response("Best matching users first", UserSerializer(many=True)),
+            400: "Missing query or invalid limit"
+        })
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', getattr(settings, 'GYMADMIN_SEARCH_LIMIT', 20)))
+        except ValueError:
+            limit = 0
+        if not query.strip() or limit < 1:
+            return Response({'detail': 'Pass a non-empty q and a positive limit'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, getattr(settings, 'GYMADMIN_SEARCH_MAX_LIMIT', 100))
 
-         email = request.query_params.get('email')
-         if email:
-             users = users.filter(email=email)
-         serializer = UserSerializer(users, many=True)
-         return Response({"users": serializer.data}, status.HTTP_200_OK)
+        pks = index.search(query, limit)
+        users = {row["id"]: row for row in UserValuesSerializer.values(User.objects.filter(pk__in=pks))}
+        return Response({'users': UserValuesSerializer.serialize(users[pk] for pk in pks if pk in users)},
+                        status=status.HTTP_200_OK)
 
 
 class UserDetail(APIView):
 
+    @staticmethod
+    def lookups(pk):
+        """The querysets that may hold the object, in the order they are searched."""
+        return [User.objects.filter(pk=pk)]
+
     def get_object(self, pk):
         try:
             return User.objects.get(pk=pk)
@@ -57,12 +147,13 @@ class UserDetail(APIView):
 
     @swagger_auto_schema(operation_description="Get details of a particular user", responses={
         200: openapi.Response("Founded user", UserSerializer),
-        404: "User does not exist"
+        404: "User does not exist",
+        304: "Not modified since the ETag of If-None-Match or the If-Modified-Since date"
     })
+    @conditional_get(User, lambda pk: object_validators(*UserDetail.lookups(pk)))
     def get(self, request, pk, format=None):
-        user = self.get_object(pk)
-        serializer = UserSerializer(user)
-        return Response({'user': serializer.data}, status=status.HTTP_200_OK)
+        data = cache.cached_object(User, pk, lambda: UserSerializer(self.get_object(pk)).data)
+        return Response({'user': data}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(operation_description="Update details of a particular user",
                          request_body=UserSerializer, responses={
@@ -91,15 +182,22 @@ class SubscriptionList(APIView):
         200: openapi.Response("List of subscriptions", SubscriptionSerializer(many=True))
     })
     def get(self, request):
-        subscriptions = Subscription.objects.select_related('client', 'type')
-        type = request.query_params.get('type')
-        if type:
-            subscriptions = subscriptions.filter(type__title=type)
-        client_id = request.query_params.get('client_id')
-        if client_id:
-            subscriptions = subscriptions.filter(client_id=client_id)
-        serializer = SubscriptionSerializer(subscriptions, many=True)
-        return Response({"subscriptions":serializer.data}, status.HTTP_200_OK)
+        return Response(cache.cached_list(Subscription, request, lambda: self.list_subscriptions(request)),
+                        status.HTTP_200_OK)
+
+    @staticmethod
+    def get_queryset(params=QueryDict()):
+        return SubscriptionValuesSerializer.values(filter_subscriptions(Subscription.objects.all(), params))
+
+    @classmethod
+    def pagination(cls, params):
+        """The paginator of the list, the querysets it pages over and the serializer of their rows."""
+        return KeysetPagination(ordering=("id",)), [cls.get_queryset(params)], SubscriptionValuesSerializer
+
+    def list_subscriptions(self, request):
+        paginator, querysets, serializer = self.pagination(request.query_params)
+        page = paginator.paginate_querysets(querysets, request)
+        return {"subscriptions": serializer.serialize(page), **paginator.get_links()}
 
     @swagger_auto_schema(operation_description="Create a new subscription", request_body=SubscriptionSerializer, responses={
         201: openapi.Response("Created subscription", SubscriptionSerializer),
@@ -112,8 +210,50 @@ class SubscriptionList(APIView):
             return Response({'subscriptions': serializer.data}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class SubscriptionExpiringList(APIView):
+    @swagger_auto_schema(operation_description="Get the active subscriptions ending within the next days, soonest first",
+                         manual_parameters=[
+                             openapi.Parameter('days', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+                         ], responses={
+            200: openapi.Response("Expiring subscriptions", SubscriptionSerializer(many=True)),
+            400: "Invalid days"
+        })
+    def get(self, request, format=None):
+        try:
+            days = int(request.query_params.get('days', getattr(settings, 'GYMADMIN_EXPIRING_DAYS', 7)))
+        except ValueError:
+            days = -1
+        if days < 0:
+            return Response({'detail': 'days must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(cache.cached_list(Subscription, request, lambda: self.list_subscriptions(request, days)),
+                        status.HTTP_200_OK)
+
+    def list_subscriptions(self, request, days):
+        paginator = KeysetPagination(ordering=("end_date", "id"))
+        subscriptions = SubscriptionValuesSerializer.values(expiry.expiring(days), "end_date")
+        page = paginator.paginate_queryset(subscriptions, request)
+        return {"subscriptions": SubscriptionValuesSerializer.serialize(page), **paginator.get_links()}
+
+
+class SubscriptionExport(APIView):
+
+    @swagger_auto_schema(operation_description="Stream all subscriptions matching the filter as NDJSON or CSV", responses={
+        200: "Streamed subscriptions, one row per line",
+        404: "Unsupported export format"
+    })
+    def get(self, request, export_format, format=None):
+        if export_format not in CONTENT_TYPES:
+            raise Http404
+        subscriptions = filter_subscriptions(Subscription.objects.all(), request.query_params)
+        return export_response([subscriptions], SUBSCRIPTION_EXPORT_FIELDS, export_format, "subscriptions")
+
 class SubscriptionDetail(APIView):
 
+    @staticmethod
+    def lookups(pk):
+        """The querysets that may hold the object, in the order they are searched."""
+        return [Subscription.objects.filter(pk=pk)]
+
     def get_object(self, pk):
         try:
             return Subscription.objects.get(pk=pk)
@@ -122,12 +262,13 @@ class SubscriptionDetail(APIView):
 
     @swagger_auto_schema(operation_description="Get details of a particular subscription", responses={
         200: openapi.Response("Founded subscription", SubscriptionSerializer),
-        404: "Subscription does not exist"
+        404: "Subscription does not exist",
+        304: "Not modified since the ETag of If-None-Match or the If-Modified-Since date"
     })
+    @conditional_get(Subscription, lambda pk: object_validators(*SubscriptionDetail.lookups(pk)))
     def get(self, request, pk, format=None):
-        subscription = self.get_object(pk)
-        serializer = SubscriptionSerializer(subscription)
-        return Response({'subscription': serializer.data}, status=status.HTTP_200_OK)
+        data = cache.cached_object(Subscription, pk, lambda: SubscriptionSerializer(self.get_object(pk)).data)
+        return Response({'subscription': data}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(operation_description="Update details of a particular subscription",
                          request_body=SubscriptionSerializer, responses={
@@ -156,18 +297,24 @@ class VisitList(APIView):
         200: openapi.Response("List of visits", VisitSerializer(many=True))
     })
     def get(self, request):
-        visits = Visit.objects.select_related('subscription', 'subscription__client', 'subscription__type')
+        return Response(cache.cached_list(Visit, request, lambda: self.list_visits(request)), status.HTTP_200_OK)
 
-        subscription_id = request.query_params.get('subscription_id')
-        if subscription_id:
-            visits = visits.filter(subscription_id=subscription_id)
+    @staticmethod
+    def get_queryset(params=QueryDict(), model=Visit):
+        return VisitValuesSerializer.values(filter_visits(model.objects.all(), params), "id")
 
-        date = request.query_params.get('date')
-        if date:
-            visits = visits.filter(date=date)
+    @classmethod
+    def pagination(cls, params):
+        """The paginator of the list, the querysets it pages over and the serializer of their rows."""
+        querysets = [cls.get_queryset(params)]
+        if archive.reaches(params):
+            querysets.append(cls.get_queryset(params, VisitArchive))
+        return KeysetPagination(ordering=("date", "id")), querysets, VisitValuesSerializer
 
-        serializer = VisitSerializer(visits, many=True)
-        return Response({"visits":serializer.data}, status.HTTP_200_OK)
+    def list_visits(self, request):
+        paginator, querysets, serializer = self.pagination(request.query_params)
+        page = paginator.paginate_querysets(querysets, request)
+        return {"visits": serializer.serialize(page), **paginator.get_links()}
 
 
     @swagger_auto_schema(operation_description="Create a new visit", request_body=VisitSerializer, responses={
@@ -181,21 +328,112 @@ class VisitList(APIView):
             return Response({'visits': serializer.data}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class VisitBulkCreate(APIView):
+
+    @swagger_auto_schema(operation_description="Create a batch of visits in one transaction. "
+                                               "Pass ?upsert=true to update exit_time of already stored visits",
+                         request_body=VisitBulkItemSerializer(many=True), responses={
+            201: "All visits were valid; accepted were stored, duplicates of stored (or earlier) visits skipped",
+            207: "Valid visits were stored, invalid ones are listed in errors",
+            400: 'Bad Request. No valid visits or batch too large.',
+        })
+    def post(self, request, format=None):
+        items = request.data.get('visits') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of visits.'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = getattr(settings, 'GYMADMIN_BULK_MAX_ITEMS', 10000)
+        if len(items) > max_items:
+            return Response({'detail': f'A batch may contain at most {max_items} visits.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        upsert = request.query_params.get('upsert', '').lower() in ('1', 'true', 'yes')
+        serializer = VisitBulkSerializer(items, upsert=upsert)
+        valid = serializer.is_valid()
+        if not serializer.validated_data:
+            return Response({'received': len(items), 'accepted': 0, 'errors': serializer.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        accepted = serializer.save()
+        return Response({'received': len(items), 'accepted': accepted, 'duplicates': serializer.duplicates,
+                         'errors': serializer.errors},
+                        status=status.HTTP_201_CREATED if valid else status.HTTP_207_MULTI_STATUS)
+
+class VisitCheckIn(APIView):
+
+    @swagger_auto_schema(operation_description="Open a visit for today if the subscription covers today "
+                                               "and the member has no open visit",
+                         request_body=CheckInSerializer, responses={
+            201: openapi.Response("Opened visit", VisitSerializer),
+            400: 'Bad Request. Subscription does not cover today or invalid input.',
+            404: 'Subscription does not exist',
+            409: 'Member already has an open visit',
+        })
+    def post(self, request, format=None):
+        serializer = CheckInSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        visit = checkin.check_in(**serializer.validated_data)
+        return Response({'visit_id': visit.pk, 'visit': VisitSerializer(visit).data}, status=status.HTTP_201_CREATED)
+
+class VisitCheckOut(APIView):
+
+    @swagger_auto_schema(operation_description="Close the open visit of a subscription or member",
+                         request_body=CheckInSerializer, responses={
+            200: openapi.Response("Closed visit", VisitSerializer),
+            400: 'Bad Request. Invalid input or missing required fields.',
+            409: 'There is no open visit to close',
+        })
+    def post(self, request, format=None):
+        serializer = CheckInSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        visit = checkin.check_out(**serializer.validated_data)
+        return Response({'visit_id': visit.pk, 'visit': VisitSerializer(visit).data}, status=status.HTTP_200_OK)
+
+class VisitExport(APIView):
+
+    @swagger_auto_schema(operation_description="Stream all visits matching the filter as NDJSON or CSV", responses={
+        200: "Streamed visits, one row per line",
+        404: "Unsupported export format"
+    })
+    def get(self, request, export_format, format=None):
+        if export_format not in CONTENT_TYPES:
+            raise Http404
+        visits = [filter_visits(Visit.objects.all(), request.query_params)]
+        if archive.reaches(request.query_params):
+            visits.insert(0, filter_visits(VisitArchive.objects.all(), request.query_params))
+        return export_response(visits, VISIT_EXPORT_FIELDS, export_format, "visits")
+
 class VisitDetail(APIView):
+    @staticmethod
+    def lookups(pk):
+        """The querysets that may hold the object, in the order they are searched."""
+        return [Visit.objects.filter(pk=pk), VisitArchive.objects.filter(pk=pk)]
+
     def get_object(self, pk):
         try:
             return Visit.objects.get(pk=pk)
         except Visit.DoesNotExist:
             raise Http404
 
+    def get_object_or_archived(self, pk):
+        try:
+            return self.get_object(pk)
+        except Http404:
+            try:
+                return VisitArchive.objects.get(pk=pk)
+            except VisitArchive.DoesNotExist:
+                raise Http404
+
     @swagger_auto_schema(operation_description="Get details of a particular visit", responses={
         200: openapi.Response("Founded visit", VisitSerializer),
-        404: "Visit does not exist"
+        404: "Visit does not exist",
+        304: "Not modified since the ETag of If-None-Match or the If-Modified-Since date"
     })
+    @conditional_get(Visit, lambda pk: object_validators(*VisitDetail.lookups(pk)))
     def get(self, request, pk, format=None):
-        visit = self.get_object(pk)
-        serializer = VisitSerializer(visit)
-        return Response({'visit': serializer.data}, status=status.HTTP_200_OK)
+        data = cache.cached_object(Visit, pk, lambda: VisitSerializer(self.get_object_or_archived(pk)).data)
+        return Response({'visit': data}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(operation_description="Update details of a particular visit",
                          request_body=VisitSerializer, responses={
@@ -221,49 +459,214 @@ class VisitDetail(APIView):
 class VisitListForSubscription(APIView):
 
     @swagger_auto_schema(operation_description="Get a list of visits of particular subscription", responses={
-        200: openapi.Response("List of visits of particular subscription", VisitSerializer(many=True))
+        200: openapi.Response("List of visits of particular subscription", VisitSerializer(many=True)),
+        404: "Subscription does not exist",
+        304: "Not modified since the ETag of If-None-Match or the If-Modified-Since date"
     })
+    @conditional_get(Visit, lambda pk: list_validators(*VisitListForSubscription.get_querysets(pk)))
     def get(self, request, pk, format=None):
-        visits = Visit.objects.filter(subscription=Subscription.objects.get(pk=pk))
-        serializer = VisitSerializer(visits, many=True)
-        return Response({'visits': serializer.data}, status=status.HTTP_200_OK)
+        return Response(cache.cached_list(Visit, request, lambda: self.list_visits(pk)), status=status.HTTP_200_OK)
+
+    @staticmethod
+    def get_querysets(pk):
+        """The archived visits of the subscription, when there are any archived ones, and the others."""
+        querysets = [Visit.objects.filter(subscription_id=pk)]
+        if archive.reaches({}):
+            querysets.insert(0, VisitArchive.objects.filter(subscription_id=pk))
+        return querysets
+
+    def list_visits(self, pk):
+        visits = [row for queryset in self.get_querysets(pk)
+                  for row in VisitValuesSerializer.values(queryset).order_by('id')]
+        if not visits and not Subscription.objects.filter(pk=pk).exists():
+            raise Http404
+        return {'visits': VisitValuesSerializer.serialize(visits)}
 
 
 class ApplicationStatisticsView(APIView):
     @swagger_auto_schema(
-        operation_description="Get statistics including total clients, total subscriptions per type, current visits, and optionally statistics for a specified date range.",
-        responses={200: openapi.Response("Statistics data")},
+        operation_description="Get statistics including total clients, total subscriptions per type, current visits, and optionally statistics for a specified date range. "
+                              "Total clients and current visits are fast counts by default, taken no earlier than counted_at; pass counts=exact for exact ones.",
+        manual_parameters=[
+            openapi.Parameter('counts', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(counts.MODES),
+                              default=counts.FAST),
+        ],
+        responses={200: openapi.Response("Statistics data"), 400: "Unknown counts mode or invalid dates"},
     )
     def get(self, request, format=None):
-        total_clients = User.objects.count()
-        total_subscriptions_per_type = Subscription.objects.values('type__title').annotate(count=Count('id'))
-        current_visits = Visit.objects.filter(exit_time__isnull=True).count()
-        start_date = self.request.query_params.get('from')
-        end_date = self.request.query_params.get('to')
-
+        detail = self.check(request.query_params)
+        if detail is not None:
+            return Response({'detail': detail}, status=status.HTTP_400_BAD_REQUEST)
+        mode = self.mode(request.query_params)
+        start_date, end_date = self.period(request.query_params)
+        total_clients = counts.count(User.objects.all(), mode)
+        total_subscriptions_per_type = statistics.subscriptions_per_type()
+        current_visits = counts.open_visits(mode)
+        in_period = ()
         if start_date:
-            if not end_date:
-                end_date = timezone.now().date()
-
-            visits_in_period = Visit.objects.filter(date__range=[start_date, end_date]).count()
-            subscriptions_in_period_per_type = Subscription.objects.filter(
-                Q(start_date__range=[start_date, end_date]) | Q(end_date__range=[start_date, end_date])
-            ).values('type__title').annotate(count=Count('id'))
-
-            return Response({
-                'total_clients': total_clients,
-                'total_subscriptions_per_type': list(total_subscriptions_per_type),
-                'current_visits': current_visits,
-
+            in_period = (statistics.visits_between(start_date, end_date),
+                         statistics.subscriptions_per_type(start_date, end_date))
+        return Response(self.payload(mode, total_clients, total_subscriptions_per_type, current_visits,
+                                     start_date, end_date, *in_period))
+
+    @staticmethod
+    def mode(params):
+        return params.get('counts') or counts.FAST
+
+    @classmethod
+    def check(cls, params):
+        """The error message of invalid parameters, None when they are fine."""
+        if cls.mode(params) not in counts.MODES:
+            return f'counts must be one of {", ".join(counts.MODES)}'
+        return None
+
+    @staticmethod
+    def period(params):
+        """(from, to) of the statistics of a period, to defaulting to today; (None, None) without from."""
+        start_date = date_param(params, 'from')
+        if not start_date:
+            return None, None
+        return start_date, date_param(params, 'to') or timezone.now().date()
+
+    @staticmethod
+    def payload(mode, total_clients, total_subscriptions_per_type, current_visits, start_date=None, end_date=None,
+                visits_in_period=None, subscriptions_in_period_per_type=None):
+        data = {
+            'total_clients': total_clients.value,
+            'total_subscriptions_per_type': total_subscriptions_per_type,
+            'current_visits': current_visits.value,
+            'counts': mode,
+            'counted_at': min(total_clients.as_of, current_visits.as_of),
+        }
+        if start_date:
+            data.update({
                 'STATISTIC start_date': start_date,
                 'STATISTIC end_date': end_date,
 
                 'visits_in_period': visits_in_period,
-                'boughtsubscriptions_in_period_per_type': list(subscriptions_in_period_per_type),
-            })
-        else:
-            return Response({
-                'total_clients': total_clients,
-                'total_subscriptions_per_type': list(total_subscriptions_per_type),
-                'current_visits': current_visits,
+                'boughtsubscriptions_in_period_per_type': subscriptions_in_period_per_type,
             })
+        return data
+
+
+class VisitAnalyticsView(APIView):
+    @swagger_auto_schema(operation_description="Get visit entries per hour, day or week, the average visit duration "
+                                               "and a weekday by hour-of-entry heatmap for a date range "
+                                               "(default: the year up to today)",
+                         manual_parameters=[
+                             openapi.Parameter('from', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+                             openapi.Parameter('to', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+                             openapi.Parameter('bucket', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                               enum=list(statistics.ENTRY_BUCKETS)),
+                         ],
+                         responses={200: openapi.Response("Visit analytics"), 400: "Invalid dates or bucket"})
+    def get(self, request, format=None):
+        bucket = request.query_params.get('bucket', 'day')
+        try:
+            end_date = datetime.date.fromisoformat(request.query_params.get('to', str(timezone.localdate())))
+            start_date = datetime.date.fromisoformat(
+                request.query_params.get('from', str(end_date - datetime.timedelta(days=364))))
+        except ValueError:
+            return Response({'detail': 'from and to must be dates (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+        if bucket not in statistics.ENTRY_BUCKETS:
+            return Response({'detail': f'bucket must be one of {", ".join(statistics.ENTRY_BUCKETS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'from': start_date,
+            'to': end_date,
+            'bucket': bucket,
+            'entries': statistics.visit_entries(start_date, end_date, bucket),
+            'average_visit_minutes': statistics.average_visit_minutes(start_date, end_date),
+            'heatmap': statistics.visit_heatmap(start_date, end_date),
+        }, status=status.HTTP_200_OK)
+
+
+class SubscriptionStatusView(APIView):
+    @swagger_auto_schema(operation_description="Get the number of upcoming, active and expired subscriptions "
+                                               "(as of the last sweep) and of active ones expiring within the days",
+                         manual_parameters=[
+                             openapi.Parameter('days', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+                         ], responses={200: openapi.Response("Subscriptions per status"), 400: "Invalid days"})
+    def get(self, request, format=None):
+        try:
+            days = int(request.query_params.get('days', getattr(settings, 'GYMADMIN_EXPIRING_DAYS', 7)))
+        except ValueError:
+            days = -1
+        if days < 0:
+            return Response({'detail': 'days must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'subscriptions_per_status': expiry.counts_per_status(),
+            'expiring': {'days': days, 'subscriptions': expiry.expiring(days).count()},
+        }, status=status.HTTP_200_OK)
+
+
+class RevenueReportView(APIView):
+    @swagger_auto_schema(operation_description="Get the revenue of subscriptions spread over the days they cover, "
+                                               "per month, subscription type and member cohort (signup month), "
+                                               "for a range of months (default: the 12 months up to this one). "
+                                               "subscriptions counts subscription-months unless grouped by month",
+                         manual_parameters=[
+                             openapi.Parameter('from', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="YYYY-MM"),
+                             openapi.Parameter('to', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="YYYY-MM"),
+                             openapi.Parameter('group_by', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                               description="Comma separated month, type and cohort (default: month,type)"),
+                         ], responses={200: openapi.Response("Revenue rows"), 400: "Invalid months or group_by"})
+    def get(self, request, format=None):
+        params = request.query_params
+        group_by = [name for name in params.get('group_by', 'month,type').split(',') if name]
+        try:
+            last_month = revenue.parse_month(params['to']) if 'to' in params else revenue.month_of(timezone.localdate())
+            first_month = revenue.parse_month(params['from']) if 'from' in params else \
+                revenue.next_month(last_month.replace(year=last_month.year - 1))
+        except ValueError:
+            return Response({'detail': 'from and to must be months (YYYY-MM)'}, status=status.HTTP_400_BAD_REQUEST)
+        if not group_by or not set(group_by) <= set(revenue.REPORT_GROUPS) or len(set(group_by)) != len(group_by):
+            return Response({'detail': f'group_by must be a list of {", ".join(revenue.REPORT_GROUPS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        rows = revenue.report(first_month, last_month, group_by)
+        return Response({
+            'from': f"{first_month:%Y-%m}",
+            'to': f"{last_month:%Y-%m}",
+            'group_by': group_by,
+            'revenue': sum(row['revenue'] for row in rows),
+            'rows': rows,
+        }, status=status.HTTP_200_OK)
+
+
+class OccupancyView(APIView):
+    @swagger_auto_schema(operation_description="Get the number of people in the gym now, per subscription type and per hour of entry",
+                         responses={200: openapi.Response("Open visits")})
+    def get(self, request, format=None):
+        return Response(tracker.snapshot(), status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    @swagger_auto_schema(operation_description="Get per-view request latency, database, serializer and response size "
+                                               "metrics of this process in the Prometheus text format",
+                         responses={200: "Metrics", 404: "Metrics are disabled"})
+    def get(self, request, format=None):
+        if not metrics.is_enabled():
+            raise Http404
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class CacheStatisticsView(APIView):
+    @swagger_auto_schema(operation_description="Get hit and miss counters of the response cache of this process",
+                         responses={200: openapi.Response("Hits and misses per cache namespace")})
+    def get(self, request, format=None):
+        return Response({'cache': cache.stats()}, status=status.HTTP_200_OK)
+
+
+class SchemaView(View):
+    """The OpenAPI document from the `generate_schema` artifact; a plain view, so it is not in the document."""
+
+    def get(self, request, format):
+        if format not in schema.FORMATS:
+            raise Http404
+        content, content_type, etag = schema.document(format)
+        response = get_conditional_response(request, etag=etag) or HttpResponse(content, content_type=content_type)
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=getattr(settings, "GYMADMIN_SCHEMA_MAX_AGE", 86400))
+        return response